@@ -15,18 +15,54 @@ MODOS SOPORTADOS:
 1. MES COMPLETO: Especificar MES y AÑO (comportamiento original)
 2. RANGO PERSONALIZADO: Especificar FECHA_INICIO y FECHA_FIN
 
-IMPORTANTE: El Excel SIEMPRE se crea NUEVO desde cero con estructura de Dashboard
+EXCEL DE SALIDA:
+- Por defecto cada periodo crea un Excel NUEVO desde cero con estructura de Dashboard
+- Con --historico (o history_workbook en CONFIG) cada periodo se escribe como una columna
+  de un unico Excel historico, que se crea la primera vez y despues se actualiza
 Workgroup: Production-caba-piba-athena-boti-group
 Rol: PIBAConsumeBoti
 """
-import boto3
-import awswrangler as wr
-import pandas as pd
-from datetime import datetime
+import argparse
+import asyncio
+import functools
+import glob
+import importlib
+from datetime import datetime, timedelta, timezone
 from calendar import monthrange
 import os
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+import configparser
+import random
+import time
+import json
+import hashlib
+import math
+import re
+import sys
+import tempfile
+import threading
+import uuid
+
+class LazyModule:
+    """
+    Modulo que se importa recien al usar su primer atributo. boto3, awswrangler
+    (pyarrow + submodulos de AWS), pandas y openpyxl tardan segundos en importarse:
+    asi --dry-run, los errores de configuracion y los resultados en cache no pagan
+    por los modulos que no usan.
+    """
+    
+    def __init__(self, nombre):
+        self._nombre = nombre
+        self._modulo = None
+    
+    def __getattr__(self, atributo):
+        if self._modulo is None:
+            self._modulo = importlib.import_module(self._nombre)
+        return getattr(self._modulo, atributo)
+
+boto3 = LazyModule('boto3')
+wr = LazyModule('awswrangler')
+pd = LazyModule('pandas')
+openpyxl = LazyModule('openpyxl')
 
 # ==================== CONFIGURACION ====================
 CONFIG = {
@@ -34,7 +70,95 @@ CONFIG = {
     'workgroup': 'Production-caba-piba-athena-boti-group',
     'database': 'caba-piba-consume-zone-db',
     'output_folder': 'output',
-    'config_file': 'config_fechas.txt'
+    'config_file': 'config_fechas.txt',
+    # Cache local de resultados (Parquet + indice JSON)
+    'use_cache': True,
+    'cache_folder': 'cache',
+    'cache_max_bytes': 500 * 1024 * 1024,   # Limite de tamaño total (LRU)
+    'late_arrival_days': 2,                 # Dias recientes que todavia pueden recibir datos
+    'cache_ttl_minutes': 60,                # Validez de resultados que incluyen dias abiertos
+    # Store local diario (session_id distintos por dia y starting_cause)
+    'use_daily_store': False,
+    'daily_store_folder': os.path.join('cache', 'diario'),
+    # Modo aproximado (approx_distinct / sketches HyperLogLog)
+    'approximate': False,
+    'approx_max_error': 0.0230,             # Error estandar de approx_distinct (entre 0.0040625 y 0.26)
+    # Modo lote: varios periodos en una ejecucion
+    'max_concurrent_queries': 5,            # Limite de queries simultaneas del workgroup
+    'batch_single_scan': True,              # Lote en una sola query agrupada por dia/mes
+    # Dashboard completo: calcula todas las filas con consulta registrada
+    'full_dashboard': False,
+    # Historico: un unico Excel con una columna por periodo (None = un Excel nuevo por periodo)
+    'history_workbook': None,               # Ej: os.path.join('output', 'Dashboard_historico.xlsx')
+    # Desglose por dia y hora local (hojas/CSV adicionales)
+    'time_breakdown': False,
+    'source_timezone': 'UTC',               # Zona en la que Athena guarda session_creation_time
+    'local_timezone': 'America/Argentina/Buenos_Aires',
+    # Atribucion por template de push: hoja con los top N templates y CSV
+    'campaign_breakdown': False,
+    'campaign_top_n': 50,                   # None = todos los templates
+    'campaign_sends_table': None,           # Tabla de envios en TABLE_LAYOUTS (con template_column). None = sin tasa de apertura
+    # Exportacion de detalle por sesion (session_id detras de D4)
+    'detail_export': False,
+    'detail_format': 'csv.gz',              # 'csv.gz', 'csv.zst' (requiere zstandard) o 'parquet'
+    'detail_chunk_rows': 1000000,           # Filas por archivo
+    'detail_writers': 4,                    # Threads comprimiendo y escribiendo en paralelo
+    'detail_folder': os.path.join('output', 'detalle'),
+    'detail_starting_cause': 'WhatsAppTemplate',  # None = sesiones de todas las starting_cause
+    # Archivo historico local (Parquet particionado por anio/mes)
+    'archive_results': True,
+    'archive_folder': os.path.join('output', 'archivo'),
+    # Excel: a partir de estas filas en hojas de desglose/detalle se escribe en modo streaming
+    'excel_write_only_rows': 50000,
+    # Motor asyncio de Athena
+    'poll_min_seconds': 0.5,                # Primer intervalo de polling (backoff exponencial)
+    'poll_max_seconds': 10,                 # Intervalo maximo de polling
+    'query_timeout_seconds': 1800,          # Al vencer se llama a StopQueryExecution
+    # Lectura de resultados por streaming (memoria constante)
+    'stream_results': False,                # Escribe el CSV pagina a pagina mientras descarga
+    'stream_source': 'api',                 # 'api' (GetQueryResults) o 's3' (CSV de resultados en chunks)
+    'stream_chunk_rows': 50000,             # Filas por chunk al leer el CSV de S3
+    # Estrategia de descarga: resultados chicos por API, extracciones grandes via UNLOAD a Parquet
+    'fetch_strategy': 'auto',               # 'auto', 'api' o 'unload'
+    'unload_threshold_rows': 100000,        # En 'auto', filas esperadas a partir de las cuales se usa UNLOAD
+    'unload_s3_prefix': None,               # Ej: 's3://bucket/unload/'. None = bucket de resultados de wrangler
+    'unload_keep_files': False,             # Conservar los Parquet en S3 despues de leerlos
+    # Backend de queries: 'athena' o 'duckdb' (extractos locales de boti_session_metrics_2)
+    'query_backend': 'athena',
+    'duckdb_source': os.path.join('datos_locales', 'boti_session_metrics_2'),
+    # Reintentos: backoff exponencial con jitter, token bucket y circuit breaker
+    'retry_max_attempts': 4,                # Intentos totales por llamada/query
+    'retry_base_seconds': 1.0,
+    'retry_max_seconds': 30.0,
+    'start_query_rate_per_second': 2.0,     # Ritmo de StartQueryExecution en todo el proceso
+    'circuit_breaker_threshold': 5,         # Fallas seguidas que abren el circuito
+    'circuit_breaker_reset_seconds': 60,
+    # Reuso de resultados: registro local de ejecuciones y reuso de Athena
+    'query_registry_file': os.path.join('cache', 'query_registry.json'),
+    'query_reuse_max_age_minutes': 60,      # 0 = no reutilizar ejecuciones registradas
+    'athena_result_reuse': False,           # ResultReuseConfiguration de Athena (engine v3)
+    'athena_result_reuse_max_age_minutes': 60,
+    # Modo daemon: calendarios de reportes automaticos con recuperacion de periodos perdidos
+    'scheduler_calendars': ['quincenal', 'mensual'],    # 'diario', 'quincenal', 'mensual'
+    'scheduler_catchup': {'diario': 7, 'quincenal': 4, 'mensual': 3},  # Periodos cerrados a revisar
+    'scheduler_delay_days': 0,              # Dias a esperar despues del cierre del periodo
+    'scheduler_check_seconds': 900,         # Intervalo entre revisiones del calendario
+    'scheduler_state_file': os.path.join('cache', 'scheduler_state.json'),
+    # Contador en tiempo casi real de las sesiones de hoy (hora local)
+    'rolling_refresh_seconds': 120,         # Intervalo entre consultas incrementales
+    'rolling_lag_seconds': 120,             # Margen para filas que todavia se estan cargando
+    'rolling_state_file': os.path.join('cache', 'contador_hoy.json'),
+    'rolling_host': '127.0.0.1',
+    'rolling_port': 8765,
+    # Metricas de ejecucion
+    'metrics_file': os.path.join('output', 'metricas.jsonl'),
+    'metrics_prometheus_file': None,        # Ej: '/var/lib/node_exporter/textfile/sesiones_pushes.prom'
+    'athena_usd_per_tb': 5.0,               # Precio por TB escaneado
+    # Sesion AWS compartida
+    'identity_cache_file': os.path.join('cache', 'identity.json'),
+    'identity_ttl_minutes': 60,             # Validez de la identidad cacheada si no se conoce la expiracion
+    'credentials_warn_minutes': 10,         # Avisar cuando falte menos para que expiren las credenciales
+    'max_pool_connections': 20              # Conexiones HTTP por cliente (queries en paralelo + descargas)
 }
 
 # ==================== FUNCIONES ====================
@@ -67,90 +191,175 @@ def read_date_config(config_file):
                 f.write("# NOTA: Si ambos modos estan configurados, se usa el MODO 2 (rango personalizado)\n")
             
             print("    Archivo creado: {}".format(config_file))
-            return 'mes', None, None, 10, 2025, "octubre 2025"
+            return resolve_period({'mes': 10, 'anio': 2025})
         
         # Leer el archivo y buscar ambos modos
-        mes = None
-        anio = None
-        fecha_inicio_str = None
-        fecha_fin_str = None
-        
         with open(config_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                
-                # MODO 1: MES y AÑO
-                if line.startswith('MES='):
-                    mes_str = line.split('=')[1].strip()
-                    mes = int(mes_str)
-                
-                if line.startswith('AÑO=') or line.startswith('ANO='):
-                    anio_str = line.split('=')[1].strip()
-                    anio = int(anio_str)
-                
-                # MODO 2: FECHA_INICIO y FECHA_FIN
-                if line.startswith('FECHA_INICIO='):
-                    fecha_inicio_str = line.split('=')[1].strip()
-                
-                if line.startswith('FECHA_FIN='):
-                    fecha_fin_str = line.split('=')[1].strip()
+            valores = parse_config_lines(f)
         
-        # PRIORIDAD: Si hay FECHA_INICIO y FECHA_FIN, usar MODO 2 (rango personalizado)
-        if fecha_inicio_str and fecha_fin_str:
-            try:
-                fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d')
-                fecha_fin = datetime.strptime(fecha_fin_str, '%Y-%m-%d')
-                
-                if fecha_inicio > fecha_fin:
-                    print("[ERROR] FECHA_INICIO no puede ser posterior a FECHA_FIN")
-                    return None, None, None, None, None, None
-                
-                # Descripcion para el rango
-                descripcion = "{} al {}".format(
-                    fecha_inicio.strftime('%d/%m/%Y'),
-                    fecha_fin.strftime('%d/%m/%Y')
-                )
-                
-                print("[INFO] Modo: RANGO PERSONALIZADO")
-                return 'rango', fecha_inicio_str, fecha_fin_str, None, None, descripcion
-                
-            except ValueError as e:
-                print("[ERROR] Formato de fecha invalido. Use YYYY-MM-DD (ej: 2025-10-01)")
-                print("    Error: {}".format(str(e)))
-                return None, None, None, None, None, None
+        periodo = resolve_period(valores)
+        if periodo[0] is None and not valores:
+            # Si no hay ninguno de los dos modos configurados
+            print("[ERROR] El archivo {} no contiene configuracion valida".format(config_file))
+            print("    Debe tener MES+AÑO o FECHA_INICIO+FECHA_FIN")
+        return periodo
         
-        # Si no hay rango, usar MODO 1 (mes completo)
-        if mes is not None and anio is not None:
-            if mes < 1 or mes > 12:
-                print("[ERROR] Mes invalido: {}. Debe estar entre 1 y 12".format(mes))
-                return None, None, None, None, None, None
+    except Exception as e:
+        print("[ERROR] Error leyendo archivo de configuracion: {}".format(str(e)))
+        return None, None, None, None, None, None
+
+def parse_config_lines(lines):
+    """Extrae MES, AÑO, FECHA_INICIO y FECHA_FIN de lineas KEY=VALUE (ignora comentarios)"""
+    valores = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        
+        # MODO 1: MES y AÑO
+        if line.startswith('MES='):
+            valores['mes'] = int(line.split('=')[1].strip())
+        
+        if line.startswith('AÑO=') or line.startswith('ANO='):
+            valores['anio'] = int(line.split('=')[1].strip())
+        
+        # MODO 2: FECHA_INICIO y FECHA_FIN
+        if line.startswith('FECHA_INICIO='):
+            valores['fecha_inicio'] = line.split('=')[1].strip()
+        
+        if line.startswith('FECHA_FIN='):
+            valores['fecha_fin'] = line.split('=')[1].strip()
+    return valores
+
+def resolve_period(valores):
+    """
+    Valida los valores leidos y determina el modo del periodo.
+    Retorna: (modo, fecha_inicio, fecha_fin, mes, anio, descripcion)
+    """
+    mes = valores.get('mes')
+    anio = valores.get('anio')
+    fecha_inicio_str = valores.get('fecha_inicio')
+    fecha_fin_str = valores.get('fecha_fin')
+    
+    # PRIORIDAD: Si hay FECHA_INICIO y FECHA_FIN, usar MODO 2 (rango personalizado)
+    if fecha_inicio_str and fecha_fin_str:
+        try:
+            fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d')
+            fecha_fin = datetime.strptime(fecha_fin_str, '%Y-%m-%d')
             
-            if anio < 2020 or anio > 2030:
-                print("[ADVERTENCIA] Año inusual: {}".format(anio))
+            if fecha_inicio > fecha_fin:
+                print("[ERROR] FECHA_INICIO no puede ser posterior a FECHA_FIN")
+                return None, None, None, None, None, None
             
-            # Calcular primer y ultimo dia del mes
-            primer_dia = 1
-            ultimo_dia = monthrange(anio, mes)[1]
-            fecha_inicio_str = "{:04d}-{:02d}-{:02d}".format(anio, mes, primer_dia)
-            fecha_fin_str = "{:04d}-{:02d}-{:02d}".format(anio, mes, ultimo_dia)
+            # Descripcion para el rango
+            descripcion = "{} al {}".format(
+                fecha_inicio.strftime('%d/%m/%Y'),
+                fecha_fin.strftime('%d/%m/%Y')
+            )
             
-            # Descripcion para el mes completo
-            mes_nombre = get_month_name(mes)
-            descripcion = "{} {}".format(mes_nombre, anio)
+            print("[INFO] Modo: RANGO PERSONALIZADO")
+            return 'rango', fecha_inicio_str, fecha_fin_str, None, None, descripcion
             
-            print("[INFO] Modo: MES COMPLETO")
-            return 'mes', fecha_inicio_str, fecha_fin_str, mes, anio, descripcion
+        except ValueError as e:
+            print("[ERROR] Formato de fecha invalido. Use YYYY-MM-DD (ej: 2025-10-01)")
+            print("    Error: {}".format(str(e)))
+            return None, None, None, None, None, None
+    
+    # Si no hay rango, usar MODO 1 (mes completo)
+    if mes is not None and anio is not None:
+        if mes < 1 or mes > 12:
+            print("[ERROR] Mes invalido: {}. Debe estar entre 1 y 12".format(mes))
+            return None, None, None, None, None, None
         
-        # Si no hay ninguno de los dos modos configurados
-        print("[ERROR] El archivo {} no contiene configuracion valida".format(config_file))
-        print("    Debe tener MES+AÑO o FECHA_INICIO+FECHA_FIN")
-        return None, None, None, None, None, None
+        if anio < 2020 or anio > 2030:
+            print("[ADVERTENCIA] Año inusual: {}".format(anio))
         
-    except Exception as e:
-        print("[ERROR] Error leyendo archivo de configuracion: {}".format(str(e)))
-        return None, None, None, None, None, None
+        # Calcular primer y ultimo dia del mes
+        primer_dia = 1
+        ultimo_dia = monthrange(anio, mes)[1]
+        fecha_inicio_str = "{:04d}-{:02d}-{:02d}".format(anio, mes, primer_dia)
+        fecha_fin_str = "{:04d}-{:02d}-{:02d}".format(anio, mes, ultimo_dia)
+        
+        # Descripcion para el mes completo
+        mes_nombre = get_month_name(mes)
+        descripcion = "{} {}".format(mes_nombre, anio)
+        
+        print("[INFO] Modo: MES COMPLETO")
+        return 'mes', fecha_inicio_str, fecha_fin_str, mes, anio, descripcion
+    
+    if valores:
+        print("[ERROR] Configuracion incompleta: {}".format(valores))
+        print("    Debe tener MES+AÑO o FECHA_INICIO+FECHA_FIN")
+    return None, None, None, None, None, None
+
+def read_periods_config(config_file):
+    """
+    Lee uno o varios periodos del archivo de configuracion.
+    Si el archivo tiene secciones [nombre], cada seccion es un periodo (modo lote);
+    si no, se usa la configuracion unica de read_date_config.
+    Retorna lista de tuplas (modo, fecha_inicio, fecha_fin, mes, anio, descripcion) o None si hay errores.
+    """
+    if not os.path.exists(config_file):
+        periodo = read_date_config(config_file)
+        return None if periodo[0] is None else [periodo]
+    
+    secciones = []
+    with open(config_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                secciones.append((stripped[1:-1].strip(), []))
+            elif secciones:
+                secciones[-1][1].append(line)
+    
+    if not secciones:
+        periodo = read_date_config(config_file)
+        return None if periodo[0] is None else [periodo]
+    
+    periodos = []
+    for nombre, lineas in secciones:
+        print("[INFO] Seccion [{}]".format(nombre))
+        try:
+            periodo = resolve_period(parse_config_lines(lineas))
+        except ValueError as e:
+            print("[ERROR] Valor invalido en la seccion [{}]: {}".format(nombre, str(e)))
+            return None
+        if periodo[0] is None:
+            print("[ERROR] La seccion [{}] no tiene un periodo valido".format(nombre))
+            return None
+        periodos.append(periodo)
+    return periodos
+
+def parse_period_arg(texto):
+    """
+    Convierte un periodo de linea de comandos en tupla de periodo:
+      2025-10                 -> mes completo
+      2025-10-01:2025-10-15   -> rango personalizado
+      2025-10-15              -> un solo dia
+    """
+    texto = texto.strip()
+    if ':' in texto:
+        inicio, fin = texto.split(':', 1)
+        return resolve_period({'fecha_inicio': inicio.strip(), 'fecha_fin': fin.strip()})
+    if re.match(r'^\d{4}-\d{1,2}$', texto):
+        anio, mes = texto.split('-')
+        return resolve_period({'mes': int(mes), 'anio': int(anio)})
+    return resolve_period({'fecha_inicio': texto, 'fecha_fin': texto})
+
+def dedupe_periods(periodos):
+    """
+    Quita los periodos repetidos (mismo fecha_inicio y fecha_fin), conservando el primero.
+    Los resultados del lote se indexan por descripcion: un periodo repetido pisaria al otro.
+    """
+    unicos = {}
+    for periodo in periodos:
+        rango = (periodo[1], periodo[2])
+        if rango in unicos:
+            print("[ADVERTENCIA] Periodo repetido, se procesa una sola vez: {} ({} a {})".format(
+                periodo[5], periodo[1], periodo[2]))
+        else:
+            unicos[rango] = periodo
+    return list(unicos.values())
 
 def get_month_name(mes):
     """Retorna el nombre del mes en español"""
@@ -174,16 +383,389 @@ def get_month_abbr(mes):
     }
     return meses.get(mes, 'mes')
 
-def build_query(fecha_inicio, fecha_fin):
+# ==================== LAYOUT DE TABLAS ====================
+# Descriptor de cada tabla consultada. El query builder usa esta informacion para
+# generar predicados "sargables" (sin funciones sobre la columna) y, si la tabla
+# esta particionada, predicados sobre las columnas de particion, de modo que Athena
+# solo lea los archivos del periodo pedido.
+#
+# - timestamp_column: columna con la fecha/hora de la sesion
+# - timestamp_type:   'timestamp' (literal timestamp '...') o 'string' (ISO 'YYYY-MM-DD HH:MM:SS')
+# - partitions:       lista de (columna, formato strftime). Vacia si no hay particiones.
+#                     Ej: [('dt', '%Y-%m-%d')] o [('year', '%Y'), ('month', '%m'), ('day', '%d')]
+# - partition_sortable: True si la particion es una unica columna cuyo valor ordena
+#                     lexicograficamente igual que la fecha (permite BETWEEN en vez de IN)
+# - template_column:  columna con el template/campaña de la push (atribucion, --campanas).
+#                     None = sin configurar: --campanas no corre hasta indicar el nombre real.
+TABLE_LAYOUTS = {
+    'boti_session_metrics_2': {
+        'database': 'caba-piba-consume-zone-db',
+        'table': 'boti_session_metrics_2',
+        'timestamp_column': 'session_creation_time',
+        'timestamp_type': 'timestamp',
+        'partitions': [],
+        'partition_sortable': False,
+        'template_column': None
+    }
+}
+
+# Cantidad tipica de valores distintos de starting_cause (para estimar filas de resultado)
+EXPECTED_STARTING_CAUSES = 20
+# Templates de push distintos por dia (para estimar filas de la atribucion por template)
+EXPECTED_TEMPLATES_PER_DAY = 500
+
+def get_table_layout(table_name='boti_session_metrics_2'):
+    """Retorna el descriptor de layout de la tabla (ver TABLE_LAYOUTS)"""
+    if table_name not in TABLE_LAYOUTS:
+        raise ValueError("No hay layout definido para la tabla: {}".format(table_name))
+    return TABLE_LAYOUTS[table_name]
+
+def iter_days(fecha_inicio, fecha_fin):
+    """Genera los dias (datetime) entre fecha_inicio y fecha_fin inclusive (YYYY-MM-DD)"""
+    dia = datetime.strptime(fecha_inicio, '%Y-%m-%d')
+    fin = datetime.strptime(fecha_fin, '%Y-%m-%d')
+    while dia <= fin:
+        yield dia
+        dia += timedelta(days=1)
+
+def build_time_predicate(fecha_inicio, fecha_fin, layout):
+    """
+    Predicado de rango semiabierto sobre la columna de tiempo:
+        col >= inicio AND col < (fin + 1 dia)
+    No aplica CAST sobre la columna, asi Athena puede usar estadisticas y particiones.
+    """
+    inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d')
+    fin_exclusivo = datetime.strptime(fecha_fin, '%Y-%m-%d') + timedelta(days=1)
+    return build_timestamp_predicate(inicio, fin_exclusivo, layout)
+
+def build_timestamp_predicate(desde, hasta, layout):
+    """Predicado semiabierto col >= desde AND col < hasta (datetimes en la zona de la tabla)"""
+    if layout['timestamp_type'] == 'string':
+        literal = "'{}'"
+    else:
+        literal = "timestamp '{}'"
+    
+    return "{col} >= {ini} AND {col} < {fin}".format(
+        col=layout['timestamp_column'],
+        ini=literal.format(desde.strftime('%Y-%m-%d %H:%M:%S')),
+        fin=literal.format(hasta.strftime('%Y-%m-%d %H:%M:%S'))
+    )
+
+def build_partition_predicate(fecha_inicio, fecha_fin, layout):
+    """
+    Predicado sobre las columnas de particion que cubren el rango de fechas.
+    Retorna None si la tabla no esta particionada.
+    """
+    partitions = layout.get('partitions') or []
+    if not partitions:
+        return None
+    
+    # Valores de particion que cubren el rango, sin repetir y en orden
+    valores = []
+    for dia in iter_days(fecha_inicio, fecha_fin):
+        valor = tuple(dia.strftime(fmt) for _, fmt in partitions)
+        if valor not in valores:
+            valores.append(valor)
+    
+    # Una sola columna de particion
+    if len(partitions) == 1:
+        col = partitions[0][0]
+        if len(valores) == 1:
+            return "{} = '{}'".format(col, valores[0][0])
+        if layout.get('partition_sortable'):
+            return "{} BETWEEN '{}' AND '{}'".format(col, valores[0][0], valores[-1][0])
+        return "{} IN ({})".format(col, ", ".join("'{}'".format(v[0]) for v in valores))
+    
+    # Varias columnas (ej: year/month/day): OR de combinaciones
+    condiciones = []
+    for valor in valores:
+        condiciones.append("(" + " AND ".join(
+            "{} = '{}'".format(col, v) for (col, _), v in zip(partitions, valor)
+        ) + ")")
+    if len(condiciones) == 1:
+        return condiciones[0][1:-1]
+    return "(" + " OR ".join(condiciones) + ")"
+
+def build_where_clause(fecha_inicio, fecha_fin, layout):
+    """Combina predicado de particiones (si hay) y predicado de tiempo"""
+    predicados = []
+    particion = build_partition_predicate(fecha_inicio, fecha_fin, layout)
+    if particion:
+        predicados.append(particion)
+    predicados.append(build_time_predicate(fecha_inicio, fecha_fin, layout))
+    return "\n  AND ".join(predicados)
+
+def build_range_where_clause(desde, hasta, layout):
+    """Como build_where_clause, para un rango [desde, hasta) de datetimes en la zona de la tabla"""
+    predicados = []
+    particion = build_partition_predicate(desde.strftime('%Y-%m-%d'),
+                                          (hasta - timedelta(seconds=1)).strftime('%Y-%m-%d'), layout)
+    if particion:
+        predicados.append(particion)
+    predicados.append(build_timestamp_predicate(desde, hasta, layout))
+    return "\n  AND ".join(predicados)
+
+def build_count_expression(aproximado=False, columna='session_id'):
+    """Expresion de conteo de sesiones: exacta o con approx_distinct (los NULL no cuentan)"""
+    if aproximado:
+        return "approx_distinct({}, {})".format(columna, CONFIG['approx_max_error'])
+    return "count(distinct ({}))".format(columna)
+
+def build_query(fecha_inicio, fecha_fin, layout=None, aproximado=False):
     """Construye la query de Sesiones Abiertas por Pushes con el rango de fechas especificado"""
     
-    query = """SELECT starting_cause, count(distinct (session_id)) as Cant_sesiones 
-FROM "caba-piba-consume-zone-db"."boti_session_metrics_2"   
-WHERE CAST(session_creation_time AS DATE) BETWEEN date '{fecha_inicio}' and date '{fecha_fin}' 
-group by starting_cause""".format(fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    if layout is None:
+        layout = get_table_layout('boti_session_metrics_2')
+    
+    query = """SELECT starting_cause, {conteo} as Cant_sesiones 
+FROM "{database}"."{table}"
+WHERE {where}
+group by starting_cause""".format(
+        conteo=build_count_expression(aproximado),
+        database=layout['database'],
+        table=layout['table'],
+        where=build_where_clause(fecha_inicio, fecha_fin, layout)
+    )
+    
+    return query
+
+def build_day_expression(layout):
+    """Expresion SQL que lleva la columna de tiempo al dia (solo para SELECT/GROUP BY)"""
+    if layout['timestamp_type'] == 'string':
+        return "substr({}, 1, 10)".format(layout['timestamp_column'])
+    return "CAST({} AS DATE)".format(layout['timestamp_column'])
+
+def group_contiguous_days(dias):
+    """Agrupa una lista de fechas YYYY-MM-DD en rangos contiguos [(inicio, fin), ...]"""
+    rangos = []
+    for dia in sorted(dias):
+        dia_obj = datetime.strptime(dia, '%Y-%m-%d')
+        if rangos and datetime.strptime(rangos[-1][1], '%Y-%m-%d') + timedelta(days=1) == dia_obj:
+            rangos[-1] = (rangos[-1][0], dia)
+        else:
+            rangos.append((dia, dia))
+    return rangos
+
+def build_days_where_clause(dias, layout):
+    """WHERE para una lista de dias: los dias no contiguos se combinan con OR"""
+    rangos = group_contiguous_days(dias)
+    if len(rangos) == 1:
+        return build_where_clause(rangos[0][0], rangos[0][1], layout)
+    return "\n   OR ".join(
+        "({})".format(build_where_clause(inicio, fin, layout)) for inicio, fin in rangos
+    )
+
+def build_daily_query(dias, layout=None):
+    """
+    Query de los pares distintos (dia, starting_cause, session_id) de los dias indicados,
+    para el store diario exacto. Los dias no contiguos se combinan con OR en una unica consulta.
+    """
+    if layout is None:
+        layout = get_table_layout('boti_session_metrics_2')
+    
+    query = """SELECT DISTINCT {dia} as fecha, starting_cause, session_id 
+FROM "{database}"."{table}"
+WHERE {where}""".format(
+        dia=build_day_expression(layout),
+        database=layout['database'],
+        table=layout['table'],
+        where=build_days_where_clause(dias, layout)
+    )
+    
+    return query
+
+# Sketches HyperLogLog: HLL_P bits del hash eligen el registro (2^HLL_P registros)
+# y el resto del hash define rho = posicion del primer bit en 1. Los registros se
+# calculan en Athena (una fila por dia, starting_cause y registro) y se combinan
+# localmente con max(), por lo que cualquier rango se estima sin volver a escanear.
+HLL_P = 11
+HLL_M = 2 ** HLL_P
+HLL_W_BITS = 52  # bits del hash usados para rho (valor < 2^53: exacto en double)
+
+def build_sketch_query(dias, layout=None):
+    """Query de registros HLL por dia y starting_cause para los dias indicados"""
+    if layout is None:
+        layout = get_table_layout('boti_session_metrics_2')
+    
+    w = "bitwise_and(bitwise_right_shift(hv, {p}), {mask})".format(
+        p=HLL_P, mask=2 ** HLL_W_BITS - 1)
+    
+    query = """WITH hashes AS (
+  SELECT {dia} as fecha, starting_cause, from_big_endian_64(xxhash64(to_utf8(session_id))) as hv
+  FROM "{database}"."{table}"
+  WHERE {where}
+)
+SELECT fecha, starting_cause, bitwise_and(hv, {m_mask}) as registro,
+  max(CASE WHEN {w} = 0 THEN {rho_cero} ELSE {bits} - CAST(floor(log2({w})) AS integer) END) as rho
+FROM hashes
+group by 1, 2, 3""".format(
+        dia=build_day_expression(layout),
+        database=layout['database'],
+        table=layout['table'],
+        where=build_days_where_clause(dias, layout),
+        m_mask=HLL_M - 1,
+        w=w,
+        rho_cero=HLL_W_BITS + 1,
+        bits=HLL_W_BITS
+    )
+    
+    return query
+
+def hll_standard_error():
+    """Error estandar relativo de un sketch HLL con HLL_M registros"""
+    return 1.04 / math.sqrt(HLL_M)
+
+def estimate_hll(rhos):
+    """
+    Estimacion HyperLogLog a partir de los registros no vacios (iterable de rho).
+    Incluye la correccion de rango chico (linear counting).
+    """
+    rhos = list(rhos)
+    alpha = 0.7213 / (1 + 1.079 / HLL_M)
+    vacios = HLL_M - len(rhos)
+    suma = vacios + sum(2.0 ** -int(r) for r in rhos)
+    estimacion = alpha * HLL_M * HLL_M / suma
+    if estimacion <= 2.5 * HLL_M and vacios > 0:
+        estimacion = HLL_M * math.log(float(HLL_M) / vacios)
+    return estimacion
+
+def merge_sketches(sketch_df):
+    """
+    Combina sketches (fecha, starting_cause, registro, rho) de varios dias y
+    retorna DataFrame starting_cause, Cant_sesiones (estimado), Error_std
+    """
+    combinado = sketch_df.groupby(['starting_cause', 'registro'], as_index=False)['rho'].max()
+    filas = []
+    for cause, grupo in combinado.groupby('starting_cause'):
+        filas.append({
+            'starting_cause': cause,
+            'Cant_sesiones': int(round(estimate_hll(grupo['rho']))),
+            'Error_std': hll_standard_error()
+        })
+    df = pd.DataFrame(filas, columns=['starting_cause', 'Cant_sesiones', 'Error_std'])
+    return df.sort_values('Cant_sesiones', ascending=False).reset_index(drop=True)
+
+# ==================== INDICADORES DEL DASHBOARD ====================
+# Cada fila del Dashboard se declara una vez. Los indicadores con 'consulta' se
+# calculan con el motor de indicadores; el resto queda vacio (se completan con
+# otros scripts o a mano) hasta que se registre su consulta con register_indicator.
+#
+# consulta = {
+#     'tabla': nombre en TABLE_LAYOUTS (define columna de tiempo y particiones),
+#     'group_by': columnas de agrupacion (puede ser []),
+#     'agregados': {alias: expresion SQL o funcion(aproximado) -> expresion},
+#     'extractor': funcion(DataFrame) -> valor de la celda
+# }
+# Los indicadores con la misma tabla y el mismo group_by comparten una unica query
+# (un solo escaneo) con todos sus agregados.
+
+def extract_whatsapp_template(df):
+    """Valor de Cant_sesiones para starting_cause = 'WhatsAppTemplate' (0 si no aparece)"""
+    fila = df[df['starting_cause'] == 'WhatsAppTemplate']
+    if len(fila) == 0:
+        return 0
+    return int(fila['Cant_sesiones'].iloc[0])
+
+DASHBOARD_INDICATORS = [
+    {'key': 'conversaciones', 'fila': 2, 'indicador': 'Conversaciones',
+     'detalle': 'Q Conversaciones', 'consulta': None},
+    {'key': 'usuarios', 'fila': 3, 'indicador': 'Usuarios',
+     'detalle': 'Q Usuarios únicos', 'consulta': None},
+    {'key': 'sesiones_abiertas_pushes', 'fila': 4, 'indicador': 'Sesiones abiertas por Pushes',
+     'detalle': 'Q Sesiones que se abrieron con una Push',
+     'consulta': {
+         'tabla': 'boti_session_metrics_2',
+         'group_by': ['starting_cause'],
+         'agregados': {'Cant_sesiones': build_count_expression},
+         'extractor': extract_whatsapp_template
+     }},
+    {'key': 'sesiones_alcanzadas_pushes', 'fila': 5, 'indicador': 'Sesiones Alcanzadas por Pushes',
+     'detalle': 'Q Sesiones que recibieron al menos 1 Push', 'consulta': None},
+    {'key': 'mensajes_pushes_enviados', 'fila': 6, 'indicador': 'Mensajes Pushes Enviados',
+     'detalle': 'Q de mensajes enviados bajo el formato push [Hilde gris]', 'consulta': None},
+    {'key': 'contenidos_botmaker', 'fila': 7, 'indicador': 'Contenidos en Botmaker',
+     'detalle': 'Contenidos prendidos en botmaker (todos los prendidos, incluy', 'consulta': None},
+    {'key': 'contenidos_usuario', 'fila': 8, 'indicador': 'Contenidos Prendidos para  el USUARIO',
+     'detalle': 'Contenidos prendidos de cara al usuario (relevantes) – (no inclu', 'consulta': None},
+    {'key': 'interacciones', 'fila': 9, 'indicador': 'Interacciones',
+     'detalle': 'Q Interacciones', 'consulta': None},
+    {'key': 'tramites', 'fila': 10, 'indicador': 'Trámites, solicitudes y turnos',
+     'detalle': 'Q Trámites, solicitudes y turnos disponibles', 'consulta': None},
+    {'key': 'contenidos_mas_consultados', 'fila': 11, 'indicador': 'contenidos mas consultados',
+     'detalle': 'Q Contenidos con más interacciones en el mes (Top 10)', 'consulta': None},
+    {'key': 'derivaciones', 'fila': 12, 'indicador': 'Derivaciones',
+     'detalle': 'Q Derivaciones', 'consulta': None},
+    {'key': 'no_entendimiento', 'fila': 13, 'indicador': 'No entendimiento',
+     'detalle': 'Performance motor de búsqueda del nuevo modelo de IA', 'consulta': None},
+    {'key': 'tasa_efectividad', 'fila': 14, 'indicador': 'Tasa de Efectividad',
+     'detalle': 'Mide el porcentaje de usuarios que lograron su objetivo [Estadísticas Eventos]', 'consulta': None},
+    {'key': 'ces', 'fila': 15, 'indicador': 'CES (Customer Effort Score)',
+     'detalle': 'Puntuación del esfuerzo del cliente [Estadísticas Eventos]', 'consulta': None}
+]
+
+def get_indicator(key):
+    """Retorna el indicador registrado con esa key"""
+    for indicador in DASHBOARD_INDICATORS:
+        if indicador['key'] == key:
+            return indicador
+    raise ValueError("Indicador desconocido: {}".format(key))
+
+def register_indicator(key, tabla, group_by, agregados, extractor):
+    """Registra (o reemplaza) la consulta de una fila del Dashboard"""
+    get_table_layout(tabla)
+    get_indicator(key)['consulta'] = {
+        'tabla': tabla,
+        'group_by': list(group_by),
+        'agregados': dict(agregados),
+        'extractor': extractor
+    }
+
+def build_indicator_query(tabla, group_by, agregados, fecha_inicio, fecha_fin, aproximado=False):
+    """Query de un grupo de indicadores (misma tabla y group_by) con todos sus agregados"""
+    layout = get_table_layout(tabla)
+    
+    columnas = list(group_by)
+    for alias, expresion in agregados.items():
+        if callable(expresion):
+            expresion = expresion(aproximado)
+        columnas.append("{} as {}".format(expresion, alias))
     
+    query = """SELECT {columnas} 
+FROM "{database}"."{table}"
+WHERE {where}""".format(
+        columnas=", ".join(columnas),
+        database=layout['database'],
+        table=layout['table'],
+        where=build_where_clause(fecha_inicio, fecha_fin, layout)
+    )
+    if group_by:
+        query += "\ngroup by {}".format(", ".join(group_by))
     return query
 
+def plan_indicator_queries(fecha_inicio, fecha_fin, aproximado=False, excluir=()):
+    """
+    Agrupa los indicadores con consulta por (tabla, group_by) y arma una query por grupo.
+    Retorna lista de dicts {'query', 'indicadores'}.
+    """
+    grupos = {}
+    for indicador in DASHBOARD_INDICATORS:
+        consulta = indicador['consulta']
+        if consulta is None or indicador['key'] in excluir:
+            continue
+        clave = (consulta['tabla'], tuple(consulta['group_by']))
+        grupo = grupos.setdefault(clave, {'agregados': {}, 'indicadores': []})
+        grupo['agregados'].update(consulta['agregados'])
+        grupo['indicadores'].append(indicador)
+    
+    planes = []
+    for (tabla, group_by), grupo in grupos.items():
+        planes.append({
+            'query': build_indicator_query(tabla, group_by, grupo['agregados'],
+                                           fecha_inicio, fecha_fin, aproximado),
+            'indicadores': grupo['indicadores']
+        })
+    return planes
+
 def generate_filename(modo, mes, anio, fecha_inicio, fecha_fin):
     """Genera el nombre del archivo basado en el modo y las fechas"""
     if modo == 'mes':
@@ -198,129 +780,503 @@ def generate_filename(modo, mes, anio, fecha_inicio, fecha_fin):
     
     return filename_csv, filename_excel
 
-def create_excel_with_dashboard(filepath, result_value, modo, mes, anio, fecha_inicio, fecha_fin):
+def get_period_header(modo, mes, anio, fecha_inicio, fecha_fin):
+    """Encabezado de la columna del periodo en el Dashboard (oct-25 o 01/10-15/10/25)"""
+    if modo == 'mes':
+        return '{}-{}'.format(get_month_abbr(mes), str(anio)[-2:])  # Formato: oct-25
+    # modo == 'rango'
+    fecha_inicio_obj = datetime.strptime(fecha_inicio, '%Y-%m-%d')
+    fecha_fin_obj = datetime.strptime(fecha_fin, '%Y-%m-%d')
+    return '{}-{}'.format(
+        fecha_inicio_obj.strftime('%d/%m'),
+        fecha_fin_obj.strftime('%d/%m/%y')
+    )
+
+def create_excel_with_dashboard(filepath, result_value, modo, mes, anio, fecha_inicio, fecha_fin, valores=None,
+                                hojas=None, write_only=None):
     """
     Crea un Excel NUEVO desde cero con estructura de Dashboard completa
-    Escribe el resultado SOLO en la celda D4 (Sesiones abiertas por Pushes)
+    Escribe el resultado en la celda D4 (Sesiones abiertas por Pushes) y, si se pasan
+    valores (dict key de indicador -> valor), el resto de la columna D
+    hojas: dict nombre de hoja -> DataFrame con hojas de desglose/detalle adicionales
+    write_only: None = automatico segun la cantidad de filas de las hojas (excel_write_only_rows)
     """
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
     
-    print("    [INFO] Creando Excel NUEVO con estructura Dashboard...")
+    hojas = hojas or {}
+    if write_only is None:
+        write_only = sum(len(df) for df in hojas.values()) >= CONFIG['excel_write_only_rows']
     
-    # IMPORTANTE: Siempre crea un workbook NUEVO
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = 'Dashboard'
-    
-    # Formato para encabezados
-    header_font = Font(bold=True)
+    if write_only:
+        print("    [INFO] Creando Excel NUEVO con estructura Dashboard (modo streaming write-only)...")
+    else:
+        print("    [INFO] Creando Excel NUEVO con estructura Dashboard...")
     
     # Determinar el texto del encabezado de fecha
-    if modo == 'mes':
-        header_fecha = '{}-{}'.format(get_month_abbr(mes), str(anio)[-2:])  # Formato: oct-25
-    else:  # modo == 'rango'
-        fecha_inicio_obj = datetime.strptime(fecha_inicio, '%Y-%m-%d')
-        fecha_fin_obj = datetime.strptime(fecha_fin, '%Y-%m-%d')
-        header_fecha = '{}-{}'.format(
-            fecha_inicio_obj.strftime('%d/%m'),
-            fecha_fin_obj.strftime('%d/%m/%y')
-        )
+    header_fecha = get_period_header(modo, mes, anio, fecha_inicio, fecha_fin)
+    
+    # FILAS 2-15: Indicadores (ver DASHBOARD_INDICATORS); D vacío si el indicador no se calculo
+    valores = dict(valores or {})
+    valores['sesiones_abiertas_pushes'] = result_value
+    filas = [('Indicador', 'Descripción/Detalle', header_fecha)]
+    for indicador in sorted(DASHBOARD_INDICATORS, key=lambda ind: ind['fila']):
+        while len(filas) + 1 < indicador['fila']:
+            filas.append((None, None, None))
+        filas.append((indicador['indicador'], indicador['detalle'], valores.get(indicador['key'])))
     
-    # FILA 1: Encabezados
-    ws['B1'] = 'Indicador'
-    ws['C1'] = 'Descripción/Detalle'
-    ws['D1'] = header_fecha
-    ws['B1'].font = header_font
-    ws['C1'].font = header_font
-    ws['D1'].font = header_font
-    
-    # FILA 2: Conversaciones
-    ws['B2'] = 'Conversaciones'
-    ws['C2'] = 'Q Conversaciones'
-    # D2 vacío (no se llena)
-    
-    # FILA 3: Usuarios
-    ws['B3'] = 'Usuarios'
-    ws['C3'] = 'Q Usuarios únicos'
-    # D3 vacío (no se llena)
-    
-    # FILA 4: Sesiones abiertas por Pushes - AQUI VA EL RESULTADO
-    ws['B4'] = 'Sesiones abiertas por Pushes'
-    ws['C4'] = 'Q Sesiones que se abrieron con una Push'
-    ws['D4'] = result_value  # ← UNICO VALOR QUE SE ESCRIBE
-    
-    # FILA 5: Sesiones Alcanzadas por Pushes
-    ws['B5'] = 'Sesiones Alcanzadas por Pushes'
-    ws['C5'] = 'Q Sesiones que recibieron al menos 1 Push'
-    # D5 vacío (no se llena)
-    
-    # FILA 6: Mensajes Pushes Enviados
-    ws['B6'] = 'Mensajes Pushes Enviados'
-    ws['C6'] = 'Q de mensajes enviados bajo el formato push [Hilde gris]'
-    # D6 vacío (no se llena)
-    
-    # FILA 7: Contenidos en Botmaker
-    ws['B7'] = 'Contenidos en Botmaker'
-    ws['C7'] = 'Contenidos prendidos en botmaker (todos los prendidos, incluy'
-    # D7 vacío (no se llena)
-    
-    # FILA 8: Contenidos Prendidos para el USUARIO
-    ws['B8'] = 'Contenidos Prendidos para  el USUARIO'
-    ws['C8'] = 'Contenidos prendidos de cara al usuario (relevantes) – (no inclu'
-    # D8 vacío (no se llena)
-    
-    # FILA 9: Interacciones
-    ws['B9'] = 'Interacciones'
-    ws['C9'] = 'Q Interacciones'
-    # D9 vacío (no se llena)
-    
-    # FILA 10: Trámites, solicitudes y turnos
-    ws['B10'] = 'Trámites, solicitudes y turnos'
-    ws['C10'] = 'Q Trámites, solicitudes y turnos disponibles'
-    # D10 vacío (no se llena)
-    
-    # FILA 11: contenidos mas consultados
-    ws['B11'] = 'contenidos mas consultados'
-    ws['C11'] = 'Q Contenidos con más interacciones en el mes (Top 10)'
-    # D11 vacío (no se llena)
-    
-    # FILA 12: Derivaciones
-    ws['B12'] = 'Derivaciones'
-    ws['C12'] = 'Q Derivaciones'
-    # D12 vacío (no se llena)
-    
-    # FILA 13: No entendimiento
-    ws['B13'] = 'No entendimiento'
-    ws['C13'] = 'Performance motor de búsqueda del nuevo modelo de IA'
-    # D13 vacío (no se llena)
-    
-    # FILA 14: Tasa de Efectividad
-    ws['B14'] = 'Tasa de Efectividad'
-    ws['C14'] = 'Mide el porcentaje de usuarios que lograron su objetivo [Estadísticas Eventos]'
-    # D14 vacío (no se llena)
-    
-    # FILA 15: CES (Customer Effort Score)
-    ws['B15'] = 'CES (Customer Effort Score)'
-    ws['C15'] = 'Puntuación del esfuerzo del cliente [Estadísticas Eventos]'
-    # D15 vacío (no se llena)
-    
-    # Ajustar anchos de columna
+    # IMPORTANTE: Siempre crea un workbook NUEVO
+    wb = openpyxl.Workbook(write_only=write_only)
+    if write_only:
+        ws = wb.create_sheet('Dashboard')
+    else:
+        ws = wb.active
+        ws.title = 'Dashboard'
+    
+    # Ajustar anchos de columna (en write-only deben definirse antes de escribir filas)
     ws.column_dimensions['B'].width = 35
     ws.column_dimensions['C'].width = 50
     ws.column_dimensions['D'].width = 15
     
+    # Formato para encabezados (FILA 1)
+    header_font = Font(bold=True)
+    
+    if write_only:
+        encabezados = []
+        for valor in filas[0]:
+            celda = WriteOnlyCell(ws, value=valor)
+            celda.font = header_font
+            encabezados.append(celda)
+        ws.append([None] + encabezados)
+        for fila in filas[1:]:
+            ws.append((None,) + fila)
+    else:
+        for numero, fila in enumerate(filas, start=1):
+            for columna, valor in zip('BCD', fila):
+                if valor is not None:
+                    ws['{}{}'.format(columna, numero)] = valor
+        ws['B1'].font = header_font
+        ws['C1'].font = header_font
+        ws['D1'].font = header_font
+    
+    # Hojas de desglose/detalle
+    for nombre, df in hojas.items():
+        write_dataframe_sheet(wb, nombre, df, header_font)
+    
     # Guardar
     wb.save(filepath)
     print("    [OK] Excel generado: {}".format(filepath))
 
+def write_dataframe_sheet(wb, nombre, df, header_font, chunk_rows=10000):
+    """
+    Agrega una hoja con el DataFrame (encabezado en negrita). Escribe por chunks para
+    no duplicar en memoria un DataFrame grande; los NaN quedan como celdas vacias.
+    """
+    from openpyxl.cell import WriteOnlyCell
+    
+    ws = wb.create_sheet(nombre[:31])
+    
+    encabezados = []
+    for columna in df.columns:
+        celda = WriteOnlyCell(ws, value=str(columna))
+        celda.font = header_font
+        encabezados.append(celda)
+    ws.append(encabezados)
+    
+    for inicio in range(0, len(df), chunk_rows):
+        chunk = df.iloc[inicio:inicio + chunk_rows]
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for fila in chunk.itertuples(index=False, name=None):
+            ws.append(fila)
+
+# ==================== HISTORICO EN UN SOLO EXCEL ====================
+# Con history_workbook configurado, cada periodo se escribe como una columna (D, E,
+# F...) de un unico Dashboard, identificada por su encabezado (oct-25). El libro se
+# abre una sola vez, se actualiza en memoria (solo las celdas que cambian) y se
+# guarda una sola vez al final de la ejecucion, aunque el lote tenga muchos periodos.
+
+_HISTORY_STATE = {'lock': threading.Lock()}
+
+def open_history_workbook():
+    """Abre (una sola vez por proceso) el Excel historico, o lo crea con la estructura del Dashboard"""
+    from openpyxl.styles import Font
+    
+    if 'workbook' not in _HISTORY_STATE:
+        path = CONFIG['history_workbook']
+        if os.path.exists(path):
+            wb = openpyxl.load_workbook(path)
+            print("    [INFO] Excel historico abierto: {}".format(path))
+        else:
+            wb = openpyxl.Workbook()
+            ws = wb.active
+            ws.title = 'Dashboard'
+            ws['B1'] = 'Indicador'
+            ws['C1'] = 'Descripción/Detalle'
+            ws['B1'].font = Font(bold=True)
+            ws['C1'].font = Font(bold=True)
+            for indicador in DASHBOARD_INDICATORS:
+                ws['B{}'.format(indicador['fila'])] = indicador['indicador']
+                ws['C{}'.format(indicador['fila'])] = indicador['detalle']
+            ws.column_dimensions['B'].width = 35
+            ws.column_dimensions['C'].width = 50
+            print("    [INFO] Excel historico nuevo: {}".format(path))
+        _HISTORY_STATE['workbook'] = wb
+        _HISTORY_STATE['celdas_modificadas'] = 0
+    return _HISTORY_STATE['workbook']
+
+def parse_period_header(header):
+    """
+    Inverso de get_period_header: (inicio, fin) del encabezado (oct-25 o 01/10-15/10/25).
+    Retorna None si el encabezado no es de un periodo (ej: columnas agregadas a mano).
+    """
+    texto = str(header).strip() if header is not None else ''
+    abreviaturas = {get_month_abbr(mes): mes for mes in range(1, 13)}
+    try:
+        if re.fullmatch(r'[a-z]{3}-\d{2}', texto) and texto[:3] in abreviaturas:
+            mes, anio = abreviaturas[texto[:3]], 2000 + int(texto[4:])
+            return datetime(anio, mes, 1), datetime(anio, mes, monthrange(anio, mes)[1])
+        if re.fullmatch(r'\d{2}/\d{2}-\d{2}/\d{2}/\d{2}', texto):
+            fin = datetime.strptime(texto[6:], '%d/%m/%y')
+            inicio = datetime.strptime(texto[:5], '%d/%m').replace(year=fin.year)
+            if inicio > fin:
+                # Rango que cruza el cambio de año (ej: 20/12-10/01/26)
+                inicio = inicio.replace(year=fin.year - 1)
+            return inicio, fin
+    except ValueError:
+        pass
+    return None
+
+def find_period_column(ws, header_fecha):
+    """
+    Columna del periodo (por encabezado en la fila 1). Si no existe, inserta una columna
+    vacia en su posicion cronologica (por fecha de inicio y, a igual inicio, por fecha de
+    fin) entre las columnas de periodos, o la primera libre desde D si va ultima.
+    """
+    rango = parse_period_header(header_fecha)
+    ultima = 3
+    siguiente = None
+    for celda in ws[1][3:]:
+        if celda.value == header_fecha:
+            return celda.column
+        if celda.value is None:
+            continue
+        ultima = celda.column
+        existente = parse_period_header(celda.value)
+        if siguiente is None and rango is not None and existente is not None and existente > rango:
+            siguiente = celda.column
+    if siguiente is None:
+        return ultima + 1
+    ws.insert_cols(siguiente)
+    return siguiente
+
+def update_history_workbook(result_value, modo, mes, anio, fecha_inicio, fecha_fin, valores=None):
+    """
+    Agrega o actualiza en memoria la columna del periodo en el Excel historico.
+    Las filas se ubican por el texto del indicador en la columna B. Retorna la celda de D4.
+    """
+    from openpyxl.styles import Font
+    
+    header_fecha = get_period_header(modo, mes, anio, fecha_inicio, fecha_fin)
+    valores = dict(valores or {})
+    valores['sesiones_abiertas_pushes'] = result_value
+    
+    with _HISTORY_STATE['lock']:
+        ws = open_history_workbook()['Dashboard']
+        filas = {celda.value: celda.row for celda in ws['B'] if celda.value is not None}
+        columna = find_period_column(ws, header_fecha)
+        
+        cambios = {1: header_fecha}
+        for indicador in DASHBOARD_INDICATORS:
+            if valores.get(indicador['key']) is not None:
+                cambios[filas.get(indicador['indicador'], indicador['fila'])] = valores[indicador['key']]
+        
+        for fila, valor in cambios.items():
+            celda = ws.cell(row=fila, column=columna)
+            if celda.value != valor:
+                celda.value = valor
+                _HISTORY_STATE['celdas_modificadas'] += 1
+        ws.cell(row=1, column=columna).font = Font(bold=True)
+        ws.column_dimensions[ws.cell(row=1, column=columna).column_letter].width = 15
+        
+        return ws.cell(row=filas.get('Sesiones abiertas por Pushes', 4), column=columna).coordinate
+
+def save_history_workbook():
+    """Guarda el Excel historico si hubo cambios (una sola escritura por ejecucion)"""
+    if 'workbook' not in _HISTORY_STATE:
+        return
+    wb = _HISTORY_STATE.pop('workbook')
+    modificadas = _HISTORY_STATE.pop('celdas_modificadas')
+    if modificadas == 0:
+        print("[INFO] Excel historico sin cambios: {}".format(CONFIG['history_workbook']))
+        return
+    carpeta = os.path.dirname(CONFIG['history_workbook'])
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    wb.save(CONFIG['history_workbook'])
+    print("[OK] Excel historico guardado: {} ({} celdas modificadas)".format(
+        os.path.abspath(CONFIG['history_workbook']), modificadas))
+
+# ==================== ARCHIVO HISTORICO (PARQUET) ====================
+# Cada resultado procesado se agrega a un dataset Parquet particionado por anio/mes
+# (del inicio del periodo), una fila por starting_cause con los metadatos de la
+# corrida. Las consultas de historial leen solo las particiones y filas necesarias
+# (filtros empujados al lector de Parquet) y no usan Athena.
+
+RUN_ID = uuid.uuid4().hex
+ARCHIVE_COLUMNS = ['run_id', 'run_timestamp', 'modo', 'fecha_inicio', 'fecha_fin', 'descripcion',
+                   'starting_cause', 'Cant_sesiones', 'aproximado']
+
+def archive_results(df, periodo):
+    """Agrega el resultado del periodo al archivo historico (un archivo nuevo por escritura)"""
+    modo, fecha_inicio, fecha_fin, mes, anio, descripcion = periodo
+    inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d')
+    
+    registro = pd.DataFrame({
+        'run_id': RUN_ID,
+        'run_timestamp': pd.Timestamp(datetime.now()),
+        'modo': modo,
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'descripcion': descripcion,
+        'starting_cause': df['starting_cause'].astype(str).values,
+        'Cant_sesiones': df['Cant_sesiones'].astype('int64').values,
+        'aproximado': bool(CONFIG['approximate']),
+        'anio': inicio.year,
+        'mes': inicio.month
+    })
+    try:
+        os.makedirs(CONFIG['archive_folder'], exist_ok=True)
+        registro.to_parquet(CONFIG['archive_folder'], partition_cols=['anio', 'mes'], index=False)
+    except Exception as e:
+        # El archivo historico no debe frenar la generacion de CSV/Excel
+        print("    [ADVERTENCIA] No se pudo agregar al archivo historico: {}".format(e))
+        return False
+    return True
+
+def load_history(desde=None, hasta=None, starting_cause=None, modo=None, todas_las_corridas=False):
+    """
+    Lee el archivo historico filtrando por fecha de inicio del periodo (YYYY-MM-DD),
+    starting_cause y modo. Por defecto deja solo la ultima corrida de cada periodo.
+    """
+    if not os.path.isdir(CONFIG['archive_folder']):
+        return pd.DataFrame(columns=ARCHIVE_COLUMNS)
+    
+    filtros = []
+    if desde:
+        filtros.append(('anio', '>=', int(desde[:4])))
+        filtros.append(('fecha_inicio', '>=', desde))
+    if hasta:
+        filtros.append(('anio', '<=', int(hasta[:4])))
+        filtros.append(('fecha_inicio', '<=', hasta))
+    if starting_cause:
+        filtros.append(('starting_cause', '=', starting_cause))
+    if modo:
+        filtros.append(('modo', '=', modo))
+    
+    df = pd.read_parquet(CONFIG['archive_folder'], columns=ARCHIVE_COLUMNS, filters=filtros or None)
+    if not todas_las_corridas and len(df) > 0:
+        ultima = df.groupby(['fecha_inicio', 'fecha_fin'])['run_timestamp'].transform('max')
+        df = df[df['run_timestamp'] == ultima]
+    return df.sort_values(['fecha_inicio', 'fecha_fin', 'starting_cause']).reset_index(drop=True)
+
+def history_trend(starting_cause='WhatsAppTemplate', meses=18):
+    """Serie mensual (periodos de mes completo) de los ultimos meses para un starting_cause"""
+    hoy = datetime.now()
+    inicio_mes = hoy.year * 12 + hoy.month - 1 - (meses - 1)
+    desde = '{:04d}-{:02d}-01'.format(inicio_mes // 12, inicio_mes % 12 + 1)
+    
+    df = load_history(desde=desde, starting_cause=starting_cause, modo='mes')
+    return df[['fecha_inicio', 'descripcion', 'Cant_sesiones', 'aproximado', 'run_timestamp']].reset_index(drop=True)
+
+def print_history_trend(starting_cause='WhatsAppTemplate', meses=18):
+    """Muestra la tendencia mensual desde el archivo historico local"""
+    tendencia = history_trend(starting_cause, meses)
+    
+    print("")
+    print("=" * 60)
+    print("HISTORIAL {} - ULTIMOS {} MESES".format(starting_cause, meses))
+    print("=" * 60)
+    if len(tendencia) == 0:
+        print("[INFO] Sin datos en el archivo historico ({})".format(CONFIG['archive_folder']))
+        return tendencia
+    anterior = None
+    for descripcion, cantidad, aproximado in zip(tendencia['descripcion'], tendencia['Cant_sesiones'],
+                                                 tendencia['aproximado']):
+        variacion = '' if not anterior else '  ({:+.1%})'.format((cantidad - anterior) / float(anterior))
+        print("  {:<25} {}{:>12,}{}".format(descripcion, '~' if aproximado else ' ', cantidad, variacion))
+        anterior = cantidad
+    print("=" * 60)
+    return tendencia
+
+# ==================== SESION AWS COMPARTIDA ====================
+# Una unica boto3.Session y un cliente por servicio (con su pool de conexiones HTTP)
+# para todo el proceso. La identidad validada con STS se guarda en
+# identity_cache_file junto con la expiracion de las credenciales: mientras las
+# credenciales sean las mismas y no hayan expirado, no se vuelve a llamar a STS.
+
+_AWS_STATE = {}
+
+def get_aws_session():
+    """Retorna la boto3.Session compartida del proceso"""
+    if 'session' not in _AWS_STATE:
+        _AWS_STATE['session'] = boto3.Session(region_name=CONFIG['region'])
+    return _AWS_STATE['session']
+
+def get_aws_client(service):
+    """Retorna el cliente compartido del servicio (thread-safe, reutiliza conexiones HTTP)"""
+    from botocore.config import Config as BotoConfig
+    
+    clientes = _AWS_STATE.setdefault('clients', {})
+    if service not in clientes:
+        clientes[service] = get_aws_session().client(
+            service,
+            config=BotoConfig(max_pool_connections=CONFIG['max_pool_connections'])
+        )
+    return clientes[service]
+
+def to_utc(valor):
+    """Convierte un datetime a UTC con zona (los naive se asumen UTC)"""
+    if valor.tzinfo is None:
+        return valor.replace(tzinfo=timezone.utc)
+    return valor.astimezone(timezone.utc)
+
+def parse_utc_timestamp(texto):
+    """'YYYY-MM-DD HH:MM:SS' guardado en UTC (identity_cache_file) -> datetime UTC con zona"""
+    return datetime.strptime(texto, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+def get_credentials_expiry(session):
+    """
+    Expiracion de las credenciales actuales (datetime UTC con zona) o None si no se conoce.
+    Con credenciales de ~/.aws/credentials se usa aws_expiration, que guarda aws-azure-login;
+    si no, la expiracion de las credenciales temporales de botocore (atributo privado
+    _expiry_time, que puede no existir en otras versiones).
+    """
+    credenciales = session.get_credentials()
+    if credenciales is None:
+        return None
+    
+    if getattr(credenciales, 'method', None) == 'shared-credentials-file':
+        path = os.environ.get('AWS_SHARED_CREDENTIALS_FILE', os.path.expanduser('~/.aws/credentials'))
+        perfil = session.profile_name or 'default'
+        parser = configparser.RawConfigParser()
+        try:
+            parser.read(path)
+            valor = parser.get(perfil, 'aws_expiration')
+        except (configparser.Error, OSError):
+            valor = None
+        if valor:
+            try:
+                return to_utc(datetime.fromisoformat(valor.strip().replace('Z', '+00:00')))
+            except ValueError:
+                pass
+    
+    expiry = getattr(credenciales, '_expiry_time', None)
+    if isinstance(expiry, datetime):
+        return to_utc(expiry)
+    return None
+
+def credentials_fingerprint(session):
+    """Hash del access key actual (para invalidar la identidad cacheada si cambian las credenciales)"""
+    credenciales = session.get_credentials()
+    if credenciales is None:
+        return None
+    return hashlib.sha256(credenciales.access_key.encode('utf-8')).hexdigest()[:16]
+
+def load_cached_identity(session):
+    """Retorna la identidad cacheada si sigue siendo valida para las credenciales actuales"""
+    path = CONFIG['identity_cache_file']
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            identidad = json.load(f)
+    except (ValueError, OSError):
+        return None
+    
+    if identidad.get('fingerprint') != credentials_fingerprint(session):
+        return None
+    
+    ahora = datetime.now(timezone.utc)
+    if identidad.get('expiry'):
+        if parse_utc_timestamp(identidad['expiry']) <= ahora:
+            return None
+    else:
+        validada = parse_utc_timestamp(identidad['validated_at'])
+        if ahora - validada > timedelta(minutes=CONFIG['identity_ttl_minutes']):
+            return None
+    return identidad
+
+def save_cached_identity(session, arn):
+    """Guarda la identidad validada con la expiracion de las credenciales"""
+    expiry = get_credentials_expiry(session)
+    identidad = {
+        'arn': arn,
+        'fingerprint': credentials_fingerprint(session),
+        'validated_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'expiry': expiry.strftime('%Y-%m-%d %H:%M:%S') if expiry else None
+    }
+    try:
+        os.makedirs(os.path.dirname(CONFIG['identity_cache_file']) or '.', exist_ok=True)
+        with open(CONFIG['identity_cache_file'], 'w', encoding='utf-8') as f:
+            json.dump(identidad, f, indent=2)
+    except OSError as e:
+        print("    [ADVERTENCIA] No se pudo guardar la identidad en cache: {}".format(str(e)))
+    return identidad
+
+def warn_if_credentials_expiring():
+    """Avisa si las credenciales expiran en menos de credentials_warn_minutes (para lotes largos)"""
+    identidad = _AWS_STATE.get('identity')
+    if not identidad or not identidad.get('expiry'):
+        return
+    restante = parse_utc_timestamp(identidad['expiry']) - datetime.now(timezone.utc)
+    if restante < timedelta(minutes=CONFIG['credentials_warn_minutes']):
+        if _AWS_STATE.get('expiry_warned'):
+            return
+        _AWS_STATE['expiry_warned'] = True
+        print("")
+        print("[ADVERTENCIA] Las credenciales AWS expiran en {} minutos".format(
+            max(0, int(restante.total_seconds() // 60))))
+        print("    Para lotes largos renovalas antes: aws-azure-login --profile default --mode=gui")
+
+def reset_expired_aws_session():
+    """
+    Descarta la sesion, los clientes y la identidad compartidos si las credenciales ya
+    expiraron (procesos residentes): la proxima verificacion vuelve a leer ~/.aws/credentials.
+    """
+    identidad = _AWS_STATE.get('identity')
+    if not identidad or not identidad.get('expiry'):
+        return False
+    if parse_utc_timestamp(identidad['expiry']) > datetime.now(timezone.utc):
+        return False
+    _AWS_STATE.clear()
+    print("[INFO] Credenciales AWS expiradas: se vuelve a crear la sesion")
+    return True
+
 def check_aws_credentials():
-    """Verifica que las credenciales AWS esten configuradas y sean validas"""
+    """
+    Verifica que las credenciales AWS esten configuradas y sean validas.
+    Usa la identidad cacheada (sin llamar a STS) mientras las credenciales no cambien ni expiren.
+    """
+    if is_local_backend():
+        print("[INFO] Backend local '{}': no se verifican credenciales AWS".format(CONFIG['query_backend']))
+        return True
+    
+    if 'identity' in _AWS_STATE:
+        warn_if_credentials_expiring()
+        return True
+    
     try:
-        sts = boto3.client('sts', region_name=CONFIG['region'])
-        identity = sts.get_caller_identity()
+        session = get_aws_session()
+        identidad = load_cached_identity(session)
         
-        user_arn = identity.get('Arn', '')
+        if identidad is not None:
+            user_arn = identidad['arn']
+            print("[OK] Credenciales AWS validas (identidad en cache, sin llamar a STS)")
+        else:
+            identity = get_aws_client('sts').get_caller_identity()
+            user_arn = identity.get('Arn', '')
+            print("[OK] Credenciales AWS validas")
         
-        print("[OK] Credenciales AWS validas")
         print("    ARN: {}".format(user_arn))
         
         # Verificar que sea el rol correcto
@@ -341,6 +1297,12 @@ def check_aws_credentials():
             print("")
             return False
         
+        if identidad is None:
+            identidad = save_cached_identity(session, user_arn)
+        if identidad.get('expiry'):
+            print("    Expiran: {} UTC".format(identidad['expiry']))
+        _AWS_STATE['identity'] = identidad
+        warn_if_credentials_expiring()
         return True
         
     except Exception as e:
@@ -359,25 +1321,2032 @@ def check_aws_credentials():
             print("")
         return False
 
-def execute_query_and_save():
-    """Funcion principal: ejecuta query y guarda resultados"""
-    
-    # Verificar credenciales
-    print("Verificando credenciales AWS...")
-    if not check_aws_credentials():
+# ==================== ESCRITURA ATOMICA ====================
+# Los indices, manifests, registros y estados se escriben en un temporal unico de la
+# misma carpeta (tempfile.mkstemp) y se reemplazan con os.replace. Dos procesos que
+# escriben el mismo archivo a la vez (daemon y ejecucion manual) no comparten el
+# temporal, y un lector ve siempre el archivo anterior o el nuevo completo.
+
+def replace_atomically(path, escribir):
+    """Llama a escribir(ruta_temporal) y reemplaza path con el temporal de forma atomica"""
+    carpeta = os.path.dirname(os.path.abspath(path))
+    os.makedirs(carpeta, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.{}.'.format(os.path.basename(path)), suffix='.tmp', dir=carpeta)
+    os.close(fd)
+    # mkstemp crea el archivo con permisos 0600; los demas procesos (node exporter) deben poder leerlo
+    os.chmod(tmp_path, 0o644)
+    try:
+        escribir(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_json_atomically(path, datos, **kwargs):
+    """json.dump de datos en path de forma atomica (kwargs pasan a json.dump)"""
+    def escribir(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, **kwargs)
+    replace_atomically(path, escribir)
+
+# ==================== CACHE LOCAL DE RESULTADOS ====================
+# Los resultados se guardan como Parquet en CONFIG['cache_folder'] con un indice
+# JSON (index.json). La clave es el SQL normalizado + el rango de fechas.
+#
+# Reglas de frescura:
+# - Un resultado es INMUTABLE si al momento de consultarlo todos los dias del rango
+#   ya estaban cerrados (fecha_fin anterior a hoy - late_arrival_days).
+#   Esos resultados no se vuelven a consultar nunca.
+# - Si el rango incluia "hoy" o dias dentro de la ventana de llegada tardia,
+#   el resultado solo es valido durante cache_ttl_minutes.
+# - Cuando el tamaño total supera cache_max_bytes se eliminan las entradas
+#   usadas hace mas tiempo (LRU).
+
+def normalize_sql(query):
+    """Normaliza el SQL para usarlo como clave (colapsa espacios y quita el ; final)"""
+    return re.sub(r'\s+', ' ', query).strip().rstrip(';').strip()
+
+def cache_key(query, fecha_inicio, fecha_fin):
+    """Clave de cache: hash del SQL normalizado + rango de fechas"""
+    base = "{}|{}|{}".format(normalize_sql(query), fecha_inicio, fecha_fin)
+    if is_local_backend():
+        # Los resultados sobre extractos locales no se mezclan con los de Athena
+        base += "|{}|{}".format(CONFIG['query_backend'], os.path.abspath(CONFIG['duckdb_source']))
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+def get_cache_index_path():
+    """Ruta del indice de la cache"""
+    return os.path.join(CONFIG['cache_folder'], 'index.json')
+
+def load_cache_index():
+    """Lee el indice de la cache (dict clave -> metadatos)"""
+    path = get_cache_index_path()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (ValueError, OSError) as e:
+        print("    [ADVERTENCIA] Indice de cache ilegible, se ignora: {}".format(str(e)))
+        return {}
+
+def save_cache_index(index):
+    """Escribe el indice de la cache de forma atomica"""
+    write_json_atomically(get_cache_index_path(), index, indent=2, ensure_ascii=False)
+
+def is_range_closed(fecha_fin, reference=None):
+    """True si todos los dias hasta fecha_fin quedan fuera de la ventana de llegada tardia"""
+    if reference is None:
+        reference = datetime.now()
+    limite = reference.date() - timedelta(days=CONFIG['late_arrival_days'])
+    return datetime.strptime(fecha_fin, '%Y-%m-%d').date() < limite
+
+def is_cache_entry_fresh(entry, now=None):
+    """Aplica las reglas de frescura a una entrada del indice"""
+    if now is None:
+        now = datetime.now()
+    if entry.get('immutable'):
+        return True
+    created = datetime.strptime(entry['created'], '%Y-%m-%d %H:%M:%S')
+    return now - created < timedelta(minutes=CONFIG['cache_ttl_minutes'])
+
+def cache_get(query, fecha_inicio, fecha_fin):
+    """Retorna el DataFrame cacheado o None si no hay entrada valida"""
+    if not CONFIG['use_cache']:
         return None
     
-    # Leer configuracion de fechas
-    print("")
-    print("Leyendo configuracion de fechas...")
+    index = load_cache_index()
+    key = cache_key(query, fecha_inicio, fecha_fin)
+    entry = index.get(key)
+    if entry is None:
+        return None
     
-    result = read_date_config(CONFIG['config_file'])
+    path = os.path.join(CONFIG['cache_folder'], entry['file'])
+    if not is_cache_entry_fresh(entry) or not os.path.exists(path):
+        return None
     
-    if result[0] is None:
-        print("[ERROR] No se pudo leer la configuracion de fechas")
+    try:
+        df = pd.read_parquet(path)
+    except Exception as e:
+        print("    [ADVERTENCIA] No se pudo leer la cache ({}), se consulta Athena".format(str(e)))
         return None
     
-    modo, fecha_inicio, fecha_fin, mes, anio, descripcion = result
+    entry['last_access'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    save_cache_index(index)
+    return df
+
+def cache_put(query, fecha_inicio, fecha_fin, df):
+    """Guarda el resultado en la cache y aplica la eviccion LRU"""
+    if not CONFIG['use_cache']:
+        return
+    
+    try:
+        os.makedirs(CONFIG['cache_folder'], exist_ok=True)
+        key = cache_key(query, fecha_inicio, fecha_fin)
+        filename = "{}.parquet".format(key)
+        path = os.path.join(CONFIG['cache_folder'], filename)
+        replace_atomically(path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+        
+        now = datetime.now()
+        index = load_cache_index()
+        index[key] = {
+            'file': filename,
+            'sql': normalize_sql(query),
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'created': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'last_access': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'immutable': is_range_closed(fecha_fin, now),
+            'size': os.path.getsize(path)
+        }
+        evict_cache(index)
+        save_cache_index(index)
+    except Exception as e:
+        # La cache nunca debe hacer fallar el reporte
+        print("    [ADVERTENCIA] No se pudo guardar en cache: {}".format(str(e)))
+
+def evict_cache(index):
+    """Elimina las entradas menos usadas hasta respetar cache_max_bytes (modifica index)"""
+    total = sum(entry.get('size', 0) for entry in index.values())
+    if total <= CONFIG['cache_max_bytes']:
+        return
+    
+    for key, entry in sorted(index.items(), key=lambda item: item[1]['last_access']):
+        if total <= CONFIG['cache_max_bytes']:
+            break
+        path = os.path.join(CONFIG['cache_folder'], entry['file'])
+        if os.path.exists(path):
+            os.remove(path)
+        total -= entry.get('size', 0)
+        del index[key]
+        print("    [INFO] Cache: eliminada entrada {} a {} (LRU)".format(
+            entry['fecha_inicio'], entry['fecha_fin']))
+
+# ==================== REGISTRO DE EJECUCIONES (REUSO DE RESULTADOS) ====================
+# Cada query que termina bien en Athena se registra por SQL normalizado con su
+# QueryExecutionId. Si la misma query se vuelve a pedir dentro de
+# query_reuse_max_age_minutes, se descargan los resultados de esa ejecucion
+# (GetQueryResults sobre el OutputLocation del workgroup) sin volver a escanear.
+# Opcionalmente se activa ademas el reuso de resultados propio de Athena
+# (ResultReuseConfiguration), que funciona entre usuarios del mismo workgroup.
+
+def registry_key(query):
+    """Clave del registro: hash del SQL normalizado + workgroup + base"""
+    base = "{}|{}|{}".format(normalize_sql(query), CONFIG['workgroup'], CONFIG['database'])
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+def load_query_registry():
+    """Lee el registro de ejecuciones (dict clave -> ejecucion)"""
+    path = CONFIG['query_registry_file']
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (ValueError, OSError) as e:
+        print("    [ADVERTENCIA] Registro de ejecuciones ilegible, se ignora: {}".format(str(e)))
+        return {}
+
+def save_query_registry(registro):
+    """Escribe el registro de forma atomica, descartando ejecuciones vencidas"""
+    limite = time.time() - CONFIG['query_reuse_max_age_minutes'] * 60
+    registro = {clave: entrada for clave, entrada in registro.items() if entrada['finished'] >= limite}
+    write_json_atomically(CONFIG['query_registry_file'], registro, indent=2, ensure_ascii=False)
+
+def is_query_reuse_enabled():
+    """El registro local solo aplica a Athena (los IDs de DuckDB no sobreviven al proceso)"""
+    return CONFIG['query_reuse_max_age_minutes'] > 0 and not is_local_backend()
+
+def find_reusable_execution(query):
+    """Ejecucion registrada de la misma query y todavia dentro de la edad maxima, o None"""
+    if not is_query_reuse_enabled():
+        return None
+    entrada = load_query_registry().get(registry_key(query))
+    if entrada is None or time.time() - entrada['finished'] > CONFIG['query_reuse_max_age_minutes'] * 60:
+        return None
+    return entrada
+
+def register_execution(query, ejecucion):
+    """Registra una ejecucion terminada en SUCCEEDED"""
+    if not is_query_reuse_enabled():
+        return
+    registro = load_query_registry()
+    registro[registry_key(query)] = {
+        'query_id': ejecucion['QueryExecutionId'],
+        'finished': time.time(),
+        'output_location': ejecucion.get('ResultConfiguration', {}).get('OutputLocation'),
+        'bytes_escaneados': ejecucion.get('Statistics', {}).get('DataScannedInBytes', 0)
+    }
+    try:
+        save_query_registry(registro)
+    except OSError as e:
+        print("    [ADVERTENCIA] No se pudo actualizar el registro de ejecuciones: {}".format(str(e)))
+
+# ==================== STORE DE AGREGADOS DIARIOS ====================
+# Guarda por dia en daily_store_folder, con un manifest de dias materializados
+# {fecha: {'created', 'immutable'}} por tipo:
+#   - exacto:  sesiones/AAAA-MM-DD.parquet con los pares distintos (starting_cause,
+#              session_id) del dia (manifest_sesiones.json)
+#   - sketch:  registros HLL por (fecha, starting_cause) (sketches.parquet)
+#   - campana: sesiones y envios por (fecha, template) (campanas.parquet)
+# Un rango (mes o personalizado) se arma con los dias del store y solo se consultan en
+# Athena los dias faltantes o todavia abiertos.
+#
+# El modo exacto guarda los session_id y no conteos: el rango se cuenta sobre la union
+# de los conjuntos diarios, asi una sesion con filas en dos dias cuenta una sola vez y el
+# resultado es el count(distinct session_id) de la query directa sin suponer nada sobre
+# la tabla. Los sketches HLL se combinan con max() por registro, que tambien es una union.
+
+# Sesiones distintas por dia (para estimar filas del store exacto y elegir UNLOAD)
+EXPECTED_SESSIONS_PER_DAY = 100000
+
+DAILY_STORE_KINDS = {
+    # kind: (archivo o carpeta de datos, manifest, columnas)
+    'exacto': ('sesiones', 'manifest_sesiones.json',
+               [('starting_cause', 'object'), ('session_id', 'object')]),
+    'sketch': ('sketches.parquet', 'manifest_sketch.json',
+               [('fecha', 'object'), ('starting_cause', 'object'), ('registro', 'int64'), ('rho', 'int64')]),
+    'campana': ('campanas.parquet', 'manifest_campana.json',
+                [('fecha', 'object'), ('template', 'object'), ('envios', 'int64'), ('Cant_sesiones', 'int64')])
+}
+
+def get_daily_store_paths(kind='exacto'):
+    """Rutas de los datos (parquet, o carpeta con un parquet por dia para 'exacto') y del manifest"""
+    folder = CONFIG['daily_store_folder']
+    if is_local_backend():
+        folder = os.path.join(folder, CONFIG['query_backend'])
+    data_file, manifest_file = DAILY_STORE_KINDS[kind][:2]
+    return os.path.join(folder, data_file), os.path.join(folder, manifest_file)
+
+def load_daily_manifest(kind='exacto'):
+    """Lee solo el manifest del store diario (dias materializados)"""
+    _, manifest_path = get_daily_store_paths(kind)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_daily_store(kind='exacto'):
+    """Lee el store diario. Retorna (DataFrame, manifest)"""
+    data_path, _ = get_daily_store_paths(kind)
+    manifest = load_daily_manifest(kind)
+    
+    if os.path.exists(data_path):
+        df = pd.read_parquet(data_path)
+    else:
+        df = pd.DataFrame({
+            col: pd.Series(dtype=dtype) for col, dtype in DAILY_STORE_KINDS[kind][2]
+        })
+    return df, manifest
+
+def save_daily_store(df, manifest, kind='exacto'):
+    """Escribe el store diario (parquet y manifest) de forma atomica"""
+    data_path, _ = get_daily_store_paths(kind)
+    replace_atomically(data_path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+    save_daily_manifest(manifest, kind)
+
+def save_daily_manifest(manifest, kind='exacto'):
+    """Escribe el manifest del store diario de forma atomica"""
+    _, manifest_path = get_daily_store_paths(kind)
+    write_json_atomically(manifest_path, manifest, indent=2, sort_keys=True)
+
+def get_missing_days(fecha_inicio, fecha_fin, manifest, now=None, firma=None):
+    """
+    Dias del rango que no estan materializados o cuyo dato ya no es fresco.
+    firma: si se indica, tambien faltan los dias materializados con otra firma de configuracion.
+    """
+    faltantes = []
+    for dia in iter_days(fecha_inicio, fecha_fin):
+        dia_str = dia.strftime('%Y-%m-%d')
+        entry = manifest.get(dia_str)
+        if entry is None or not is_cache_entry_fresh(entry, now) or entry.get('firma') != firma:
+            faltantes.append(dia_str)
+    return faltantes
+
+def normalize_day_column(df):
+    """Lleva la columna fecha a string YYYY-MM-DD (Athena puede devolver date o string)"""
+    df = df.copy()
+    df['fecha'] = pd.to_datetime(df['fecha']).dt.strftime('%Y-%m-%d')
+    return df
+
+def mark_days_materialized(manifest, dias, firma=None):
+    """Marca los dias consultados en el manifest (con su firma de configuracion, si hay)"""
+    now = datetime.now()
+    for dia in dias:
+        manifest[dia] = {
+            'created': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'immutable': is_range_closed(dia, now)
+        }
+        if firma is not None:
+            manifest[dia]['firma'] = firma
+    return manifest
+
+def update_daily_store(df_nuevos, dias, store_df, manifest, firma=None):
+    """Reemplaza en el store los dias consultados y los marca en el manifest (con su firma, si hay)"""
+    store_df = store_df[~store_df['fecha'].isin(dias)]
+    if len(df_nuevos) > 0:
+        store_df = pd.concat([store_df, normalize_day_column(df_nuevos)], ignore_index=True)
+    
+    mark_days_materialized(manifest, dias, firma)
+    return store_df.sort_values(list(store_df.columns[:-1])).reset_index(drop=True), manifest
+
+def get_daily_set_path(dia):
+    """Parquet con los pares (starting_cause, session_id) de un dia del store exacto"""
+    carpeta, _ = get_daily_store_paths('exacto')
+    return os.path.join(carpeta, '{}.parquet'.format(dia))
+
+def save_daily_sets(df_nuevos, dias, manifest):
+    """Escribe un parquet por dia consultado (vacio si el dia no tuvo sesiones) y el manifest"""
+    carpeta, _ = get_daily_store_paths('exacto')
+    os.makedirs(carpeta, exist_ok=True)
+    columnas = [col for col, _ in DAILY_STORE_KINDS['exacto'][2]]
+    por_dia = {}
+    if len(df_nuevos) > 0:
+        por_dia = {dia: grupo for dia, grupo in normalize_day_column(df_nuevos).groupby('fecha')}
+    
+    for dia in dias:
+        df_dia = por_dia.get(dia)
+        if df_dia is None:
+            df_dia = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in DAILY_STORE_KINDS['exacto'][2]})
+        replace_atomically(get_daily_set_path(dia),
+                           lambda tmp_path: df_dia[columnas].astype(str).to_parquet(tmp_path, index=False))
+    save_daily_manifest(mark_days_materialized(manifest, dias), 'exacto')
+
+def assemble_range_from_sets(fecha_inicio, fecha_fin):
+    """
+    Sesiones distintas por starting_cause sobre la union de los conjuntos diarios del rango.
+    Retorna el formato de build_query.
+    """
+    partes = [pd.read_parquet(get_daily_set_path(dia.strftime('%Y-%m-%d')))
+              for dia in iter_days(fecha_inicio, fecha_fin)]
+    pares = pd.concat(partes, ignore_index=True).drop_duplicates()
+    df = pares.groupby('starting_cause').size().rename('Cant_sesiones').reset_index()
+    df['Cant_sesiones'] = df['Cant_sesiones'].astype('int64')
+    return df.sort_values(['Cant_sesiones', 'starting_cause'], ascending=[False, True]).reset_index(drop=True)
+
+def fetch_from_daily_store(fecha_inicio, fecha_fin, get_session, aproximado=False):
+    """
+    Resuelve el rango desde el store diario consultando en Athena solo los dias faltantes.
+    get_session: funcion que retorna la sesion boto3 (o None si las credenciales fallan);
+    solo se invoca si hay dias por consultar.
+    aproximado: usa sketches HLL por dia (mas baratos que count distinct) en vez de conteos exactos.
+    """
+    kind = 'sketch' if aproximado else 'exacto'
+    if aproximado:
+        store_df, manifest = load_daily_store(kind)
+        faltantes = get_missing_days(fecha_inicio, fecha_fin, manifest)
+    else:
+        manifest = load_daily_manifest(kind)
+        faltantes = get_missing_days(fecha_inicio, fecha_fin, manifest)
+        # Dias del manifest cuyo archivo ya no esta (borrado a mano)
+        faltantes = sorted(set(faltantes) | {
+            dia.strftime('%Y-%m-%d') for dia in iter_days(fecha_inicio, fecha_fin)
+            if not os.path.exists(get_daily_set_path(dia.strftime('%Y-%m-%d')))})
+    
+    total_dias = len(list(iter_days(fecha_inicio, fecha_fin)))
+    print("")
+    print("[INFO] Store diario ({}): {} de {} dias ya materializados".format(
+        kind, total_dias - len(faltantes), total_dias))
+    
+    if faltantes:
+        rangos = group_contiguous_days(faltantes)
+        print("    Dias a consultar: {}".format(", ".join(
+            inicio if inicio == fin else "{} a {}".format(inicio, fin) for inicio, fin in rangos)))
+        
+        session = get_session()
+        if session is None:
+            return None
+        
+        if aproximado:
+            query_diaria = build_sketch_query(faltantes)
+        else:
+            query_diaria = build_daily_query(faltantes)
+        print("")
+        print("Query diaria a ejecutar:")
+        print("    {}".format(query_diaria))
+        print("")
+        print("Ejecutando consulta...")
+        
+        # Filas esperadas: dias x starting_cause x registros HLL, o las sesiones de los dias
+        if aproximado:
+            filas_esperadas = len(faltantes) * EXPECTED_STARTING_CAUSES * HLL_M
+        else:
+            filas_esperadas = len(faltantes) * EXPECTED_SESSIONS_PER_DAY
+        df_nuevos = run_athena_query(query_diaria, session, expected_rows=filas_esperadas)
+        if aproximado:
+            store_df, manifest = update_daily_store(df_nuevos, faltantes, store_df, manifest)
+            save_daily_store(store_df, manifest, kind)
+        else:
+            save_daily_sets(df_nuevos, faltantes, manifest)
+    
+    if aproximado:
+        en_rango = store_df[(store_df['fecha'] >= fecha_inicio) & (store_df['fecha'] <= fecha_fin)]
+        return merge_sketches(en_rango)
+    return assemble_range_from_sets(fecha_inicio, fecha_fin)
+
+# ==================== DESGLOSE POR DIA Y HORA ====================
+# Una sola query agrupada en Athena por (dia, hora, starting_cause) en la zona horaria
+# local (Buenos Aires): el resultado tiene a lo sumo dias x 24 x causas filas. Como cada
+# sesion tiene un unico session_creation_time, los buckets son disjuntos y los pivots
+# por dia y por hora se obtienen sumando localmente. El filtro va de la medianoche local
+# del primer dia a la medianoche local del dia siguiente al ultimo (convertidas a
+# source_timezone), asi cada dia del pivot es un dia local completo. Por eso el total
+# puede diferir de D4, que define el periodo en source_timezone.
+
+def build_local_time_expression(layout):
+    """Columna de tiempo convertida de source_timezone a local_timezone"""
+    columna = layout['timestamp_column']
+    if layout['timestamp_type'] == 'string':
+        columna = "CAST({} AS TIMESTAMP)".format(columna)
+    return "with_timezone({}, '{}') AT TIME ZONE '{}'".format(
+        columna, CONFIG['source_timezone'], CONFIG['local_timezone'])
+
+def get_local_period_bounds(fecha_inicio, fecha_fin):
+    """
+    Medianoche local de fecha_inicio y del dia siguiente a fecha_fin, expresadas en la
+    zona de la tabla (datetimes naive). Retorna (desde, hasta) para un rango semiabierto.
+    """
+    from zoneinfo import ZoneInfo
+    
+    zona_local = ZoneInfo(CONFIG['local_timezone'])
+    inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').replace(tzinfo=zona_local)
+    fin_exclusivo = (datetime.strptime(fecha_fin, '%Y-%m-%d') + timedelta(days=1)).replace(tzinfo=zona_local)
+    return get_local_day_start(inicio), get_local_day_start(fin_exclusivo)
+
+def build_time_breakdown_query(fecha_inicio, fecha_fin, aproximado=False):
+    """Query de sesiones por dia y hora local x starting_cause (dias locales completos)"""
+    layout = get_table_layout('boti_session_metrics_2')
+    hora_local = build_local_time_expression(layout)
+    desde, hasta = get_local_period_bounds(fecha_inicio, fecha_fin)
+    
+    return """SELECT date({hora_local}) as fecha, hour({hora_local}) as hora, starting_cause, {conteo} as Cant_sesiones 
+FROM "{database}"."{table}"
+WHERE {where}
+group by date({hora_local}), hour({hora_local}), starting_cause""".format(
+        hora_local=hora_local,
+        conteo=build_count_expression(aproximado),
+        database=layout['database'],
+        table=layout['table'],
+        where=build_range_where_clause(desde, hasta, layout)
+    )
+
+def pivot_time_breakdown(df, fecha_inicio, fecha_fin):
+    """
+    Arma los pivots dia x starting_cause y hora x starting_cause (con columna Total).
+    Todos los dias del periodo y las 24 horas aparecen siempre, con 0 (tambien con un
+    resultado vacio). Retorna (por_dia, por_hora).
+    """
+    df = df.assign(fecha=df['fecha'].astype(str).str[:10], hora=df['hora'].astype(int))
+    causas = sorted(df['starting_cause'].dropna().unique())
+    
+    dias = [dia.strftime('%Y-%m-%d') for dia in iter_days(fecha_inicio, fecha_fin)]
+    
+    pivots = []
+    for indice, valores_indice in (('fecha', dias), ('hora', list(range(24)))):
+        pivot = df.pivot_table(index=indice, columns='starting_cause', values='Cant_sesiones',
+                               aggfunc='sum', fill_value=0)
+        pivot = pivot.reindex(index=valores_indice, columns=causas, fill_value=0).astype('int64')
+        pivot['Total'] = pivot.sum(axis=1).astype('int64')
+        pivot.index.name = indice
+        pivot.columns.name = None
+        pivots.append(pivot.reset_index())
+    
+    return pivots[0], pivots[1]
+
+def fetch_time_breakdown(fecha_inicio, fecha_fin, get_session):
+    """Obtiene el desglose por dia y hora (cache local o Athena). Retorna (por_dia, por_hora) o None"""
+    query = build_time_breakdown_query(fecha_inicio, fecha_fin, aproximado=CONFIG['approximate'])
+    
+    print("")
+    print("Query de desglose por dia y hora ({}):".format(CONFIG['local_timezone']))
+    print("    {}".format(query))
+    
+    df = cache_get(query, fecha_inicio, fecha_fin)
+    if df is not None:
+        print("[OK] Desglose por dia y hora obtenido de la cache local")
+    else:
+        session = get_session()
+        if session is None:
+            return None
+        dias = len(list(iter_days(fecha_inicio, fecha_fin))) + 1
+        df = run_athena_query(query, session, expected_rows=dias * 24 * EXPECTED_STARTING_CAUSES)
+        cache_put(query, fecha_inicio, fecha_fin, df)
+        print("[OK] Desglose por dia y hora: {:,} filas".format(len(df)))
+    
+    return pivot_time_breakdown(df, fecha_inicio, fecha_fin)
+
+# ==================== ATRIBUCION POR TEMPLATE (CAMPAÑAS) ====================
+# Sesiones iniciadas por WhatsAppTemplate agrupadas por dia y template de la push
+# (template_column del layout). Si campaign_sends_table apunta a la tabla de envios,
+# la misma query agrega los envios por dia y template y se cruzan en Athena (FULL
+# OUTER JOIN de los dos agregados), para calcular la tasa de apertura.
+#
+# El resultado diario se guarda en el store diario (kind 'campana'): un periodo solo
+# consulta los dias que no estan materializados y el resumen por template se arma
+# localmente sumando los dias. Cada dia guarda la firma de la configuracion (columna de
+# template y tabla de envios); si la configuracion cambia, los dias se vuelven a consultar. Con miles de templates por mes el resultado supera
+# unload_threshold_rows y se descarga via UNLOAD a Parquet.
+
+def check_campaign_config():
+    """Mensaje de error si falta configurar la atribucion por template, o None si esta lista"""
+    if not get_table_layout('boti_session_metrics_2').get('template_column'):
+        return ("La atribucion por template (--campanas) requiere la columna de template: configurar "
+                "'template_column' en TABLE_LAYOUTS['boti_session_metrics_2'] con el nombre real de la columna")
+    if CONFIG['campaign_sends_table']:
+        if CONFIG['campaign_sends_table'] not in TABLE_LAYOUTS:
+            return "No hay layout definido para la tabla de envios: {}".format(CONFIG['campaign_sends_table'])
+        if not TABLE_LAYOUTS[CONFIG['campaign_sends_table']].get('template_column'):
+            return "La tabla de envios '{}' no tiene 'template_column' en TABLE_LAYOUTS".format(
+                CONFIG['campaign_sends_table'])
+    return None
+
+def build_campaign_query(dias):
+    """Query de sesiones (y envios, si hay tabla de envios) por dia y template para los dias indicados"""
+    layout = get_table_layout('boti_session_metrics_2')
+    sesiones = """SELECT {dia} as fecha, coalesce({template}, '(sin template)') as template, count(distinct (session_id)) as Cant_sesiones 
+FROM "{database}"."{table}"
+WHERE ({where})
+  AND starting_cause = 'WhatsAppTemplate'
+group by 1, 2""".format(
+        dia=build_day_expression(layout),
+        template=layout['template_column'],
+        database=layout['database'],
+        table=layout['table'],
+        where=build_days_where_clause(dias, layout)
+    )
+    
+    if not CONFIG['campaign_sends_table']:
+        return """SELECT fecha, template, CAST(0 AS BIGINT) as envios, Cant_sesiones 
+FROM ({sesiones}) s""".format(sesiones=sesiones)
+    
+    layout_envios = get_table_layout(CONFIG['campaign_sends_table'])
+    envios = """SELECT {dia} as fecha, coalesce({template}, '(sin template)') as template, count(*) as envios 
+FROM "{database}"."{table}"
+WHERE {where}
+group by 1, 2""".format(
+        dia=build_day_expression(layout_envios),
+        template=layout_envios['template_column'],
+        database=layout_envios['database'],
+        table=layout_envios['table'],
+        where=build_days_where_clause(dias, layout_envios)
+    )
+    
+    return """WITH sesiones AS ({sesiones}),
+envios AS ({envios})
+SELECT coalesce(s.fecha, e.fecha) as fecha, coalesce(s.template, e.template) as template, 
+coalesce(e.envios, 0) as envios, coalesce(s.Cant_sesiones, 0) as Cant_sesiones 
+FROM sesiones s FULL OUTER JOIN envios e ON s.fecha = e.fecha AND s.template = e.template""".format(
+        sesiones=sesiones, envios=envios)
+
+def campaign_fingerprint():
+    """
+    Firma de la configuracion que define el contenido del store 'campana' (columna de
+    template y tabla de envios): los dias guardados con otra firma se vuelven a consultar.
+    """
+    layout = get_table_layout('boti_session_metrics_2')
+    config = {'template_column': layout['template_column'], 'envios': None}
+    if CONFIG['campaign_sends_table']:
+        envios = get_table_layout(CONFIG['campaign_sends_table'])
+        config['envios'] = [envios['database'], envios['table'], envios['timestamp_column'],
+                            envios['template_column']]
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def summarize_campaigns(store_df, fecha_inicio, fecha_fin):
+    """Suma los dias del rango por template: sesiones, envios, tasa de apertura y participacion"""
+    en_rango = store_df[(store_df['fecha'] >= fecha_inicio) & (store_df['fecha'] <= fecha_fin)]
+    df = en_rango.groupby('template', as_index=False)[['Cant_sesiones', 'envios']].sum()
+    df['Tasa_apertura'] = (df['Cant_sesiones'] / df['envios']).where(df['envios'] > 0)
+    total = df['Cant_sesiones'].sum()
+    df['Participacion'] = df['Cant_sesiones'] / total if total else 0.0
+    if not CONFIG['campaign_sends_table']:
+        df = df.drop(columns=['envios', 'Tasa_apertura'])
+    return df.sort_values(['Cant_sesiones', 'template'], ascending=[False, True]).reset_index(drop=True)
+
+def fetch_campaign_breakdown(fecha_inicio, fecha_fin, get_session):
+    """
+    Atribucion por template del periodo desde el store diario 'campana', consultando en
+    Athena solo los dias faltantes. Retorna el DataFrame por template o None.
+    """
+    store_df, manifest = load_daily_store('campana')
+    firma = campaign_fingerprint()
+    faltantes = get_missing_days(fecha_inicio, fecha_fin, manifest, firma=firma)
+    
+    total_dias = len(list(iter_days(fecha_inicio, fecha_fin)))
+    print("")
+    print("[INFO] Atribucion por template: {} de {} dias ya materializados".format(
+        total_dias - len(faltantes), total_dias))
+    
+    if faltantes:
+        session = get_session()
+        if session is None:
+            return None
+        
+        query = build_campaign_query(faltantes)
+        print("")
+        print("Query de atribucion por template:")
+        print("    {}".format(query))
+        
+        df_nuevos = run_athena_query(query, session,
+                                     expected_rows=len(faltantes) * EXPECTED_TEMPLATES_PER_DAY)
+        store_df, manifest = update_daily_store(df_nuevos, faltantes, store_df, manifest, firma=firma)
+        save_daily_store(store_df, manifest, 'campana')
+    
+    df = summarize_campaigns(store_df, fecha_inicio, fecha_fin)
+    print("[OK] Atribucion por template: {:,} templates".format(len(df)))
+    for template, cantidad in zip(df['template'].head(5), df['Cant_sesiones'].head(5)):
+        print("    {}: {:,}".format(template, cantidad))
+    return df
+
+# ==================== PLANIFICADOR DE LOTE (UN SOLO ESCANEO) ====================
+# Varios periodos se resuelven con una unica query sobre la union de sus dias, agrupada
+# por starting_cause y con una columna de conteo por periodo:
+#   count(distinct (CASE WHEN <rango del periodo> THEN session_id END)) as periodo_N
+# Cada columna es el count(distinct) de la query del periodo (los NULL no cuentan), asi
+# los periodos superpuestos se leen una sola vez y no se suman conteos de buckets
+# (una sesion con filas en varios dias contaria una vez por dia).
+
+def is_full_month_period(fecha_inicio, fecha_fin):
+    """True si el rango cubre meses calendario completos"""
+    inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d')
+    fin = datetime.strptime(fecha_fin, '%Y-%m-%d')
+    return inicio.day == 1 and fin.day == monthrange(fin.year, fin.month)[1]
+
+def plan_single_scan(periodos):
+    """Dias (YYYY-MM-DD, ordenados) que cubren todos los periodos del lote"""
+    dias = set()
+    for periodo in periodos:
+        dias.update(dia.strftime('%Y-%m-%d') for dia in iter_days(periodo[1], periodo[2]))
+    return sorted(dias)
+
+def build_single_scan_query(periodos, layout=None, aproximado=False):
+    """Query unica con una columna periodo_N por periodo (en el orden de la lista)"""
+    if layout is None:
+        layout = get_table_layout('boti_session_metrics_2')
+    
+    conteos = ",\n  ".join(
+        "{} as periodo_{}".format(build_count_expression(aproximado, "CASE WHEN {} THEN session_id END".format(
+            build_time_predicate(periodo[1], periodo[2], layout))), i)
+        for i, periodo in enumerate(periodos)
+    )
+    query = """SELECT starting_cause,
+  {conteos} 
+FROM "{database}"."{table}"
+WHERE {where}
+group by starting_cause""".format(
+        conteos=conteos,
+        database=layout['database'],
+        table=layout['table'],
+        where=build_days_where_clause(plan_single_scan(periodos), layout)
+    )
+    
+    return query
+
+def slice_single_scan_results(df, indice):
+    """Columna periodo_N del resultado en el formato de build_query (sin causas en cero)"""
+    resultado = df[['starting_cause', 'periodo_{}'.format(indice)]].rename(
+        columns={'periodo_{}'.format(indice): 'Cant_sesiones'})
+    resultado = resultado[resultado['Cant_sesiones'].astype('int64') > 0].copy()
+    resultado['Cant_sesiones'] = resultado['Cant_sesiones'].astype('int64')
+    return resultado.sort_values('Cant_sesiones', ascending=False).reset_index(drop=True)
+
+# ==================== METRICAS DE EJECUCION ====================
+# Cada etapa (config, consulta, descarga, csv, excel...) y cada query de Athena se
+# registran en memoria durante la ejecucion. Al final se agregan como JSON lines a
+# metrics_file, opcionalmente a un textfile de Prometheus (node exporter) y se
+# muestra una tabla resumen. De cada QueryExecution se toman tiempo en cola, tiempo
+# de motor, bytes escaneados y el costo estimado (athena_usd_per_tb, minimo 10 MB).
+
+_METRICS = {'etapas': [], 'queries': [], 'reuso': {'hits': 0, 'misses': 0, 'bytes_ahorrados': 0}}
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB (None si la plataforma no lo informa)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss esta en bytes en macOS y en KB en Linux
+    return maximo / (1024.0 * 1024.0) if sys.platform == 'darwin' else maximo / 1024.0
+
+def record_stage(etapa, inicio, periodo=None):
+    """Registra la duracion de una etapa iniciada en inicio (time.perf_counter())"""
+    _METRICS['etapas'].append({
+        'tipo': 'etapa',
+        'etapa': etapa,
+        'periodo': periodo,
+        'segundos': round(time.perf_counter() - inicio, 4),
+        'rss_mb': peak_rss_mb()
+    })
+
+def estimate_query_cost(bytes_escaneados):
+    """Costo estimado en USD de una query (Athena redondea al MB, minimo 10 MB)"""
+    if not bytes_escaneados:
+        return 0.0
+    mb = max(math.ceil(bytes_escaneados / float(1024 ** 2)), 10)
+    return mb / float(1024 ** 2) * CONFIG['athena_usd_per_tb']
+
+def record_query_metrics(ejecucion):
+    """Registra las estadisticas de una QueryExecution terminada"""
+    estadisticas = ejecucion.get('Statistics', {})
+    bytes_escaneados = estadisticas.get('DataScannedInBytes', 0)
+    _METRICS['queries'].append({
+        'tipo': 'query',
+        'query_id': ejecucion['QueryExecutionId'],
+        'estado': ejecucion['Status']['State'],
+        'cola_ms': estadisticas.get('QueryQueueTimeInMillis', 0),
+        'motor_ms': estadisticas.get('EngineExecutionTimeInMillis', 0),
+        'total_ms': estadisticas.get('TotalExecutionTimeInMillis', 0),
+        'bytes_escaneados': bytes_escaneados,
+        'costo_usd': round(estimate_query_cost(bytes_escaneados), 6)
+    })
+
+def record_reuse(hit, bytes_ahorrados=0):
+    """Registra si una query se resolvio reutilizando un resultado previo"""
+    reuso = _METRICS['reuso']
+    reuso['hits' if hit else 'misses'] += 1
+    reuso['bytes_ahorrados'] += bytes_ahorrados or 0
+
+def reset_metrics():
+    """Inicia una nueva corrida dentro del mismo proceso (modo daemon): nuevo run_id y metricas en cero"""
+    global RUN_ID
+    RUN_ID = uuid.uuid4().hex
+    _METRICS['etapas'].clear()
+    _METRICS['queries'].clear()
+    _METRICS['reuso'].update(hits=0, misses=0, bytes_ahorrados=0)
+    _RETRY_STATE['reintentos'] = 0
+    if 'breaker' in _RETRY_STATE:
+        _RETRY_STATE['breaker'].aperturas = 0
+
+def summarize_metrics():
+    """Totales por etapa y de las queries de Athena de la ejecucion"""
+    etapas = {}
+    for registro in _METRICS['etapas']:
+        total = etapas.setdefault(registro['etapa'], {'veces': 0, 'segundos': 0.0, 'maximo': 0.0})
+        total['veces'] += 1
+        total['segundos'] += registro['segundos']
+        total['maximo'] = max(total['maximo'], registro['segundos'])
+    
+    queries = _METRICS['queries']
+    athena = {
+        'queries': len(queries),
+        'cola_segundos': sum(q['cola_ms'] for q in queries) / 1000.0,
+        'motor_segundos': sum(q['motor_ms'] for q in queries) / 1000.0,
+        'bytes_escaneados': sum(q['bytes_escaneados'] for q in queries),
+        'costo_usd': sum(q['costo_usd'] for q in queries),
+        'reuso_hits': _METRICS['reuso']['hits'],
+        'reuso_misses': _METRICS['reuso']['misses'],
+        'bytes_ahorrados': _METRICS['reuso']['bytes_ahorrados'],
+        'reintentos': _RETRY_STATE.get('reintentos', 0),
+        'aperturas_breaker': _RETRY_STATE['breaker'].aperturas if 'breaker' in _RETRY_STATE else 0
+    }
+    return etapas, athena
+
+def write_metrics_jsonl(exito):
+    """Agrega las metricas de la ejecucion como JSON lines (una por etapa y por query + resumen)"""
+    etapas, athena = summarize_metrics()
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    registros = _METRICS['etapas'] + _METRICS['queries'] + [dict(
+        athena, tipo='resumen', exito=exito, rss_mb=peak_rss_mb(), backend=CONFIG['query_backend'])]
+    
+    carpeta = os.path.dirname(CONFIG['metrics_file'])
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    with open(CONFIG['metrics_file'], 'a', encoding='utf-8') as f:
+        for registro in registros:
+            f.write(json.dumps(dict(registro, run_id=RUN_ID, timestamp=timestamp), ensure_ascii=False) + '\n')
+
+def write_prometheus_textfile(path, exito):
+    """Escribe las metricas de la ultima ejecucion en formato textfile de Prometheus (escritura atomica)"""
+    etapas, athena = summarize_metrics()
+    lineas = []
+    
+    def metrica(nombre, ayuda, muestras):
+        lineas.append("# HELP {} {}".format(nombre, ayuda))
+        lineas.append("# TYPE {} gauge".format(nombre))
+        for etiquetas, valor in muestras:
+            lineas.append("{}{} {}".format(nombre, etiquetas, valor))
+    
+    metrica('sesiones_pushes_stage_seconds', 'Duracion total de cada etapa en la ultima ejecucion',
+            [('{{etapa="{}"}}'.format(etapa), round(total['segundos'], 4)) for etapa, total in sorted(etapas.items())])
+    metrica('sesiones_pushes_athena_queries', 'Queries de Athena ejecutadas', [('', athena['queries'])])
+    metrica('sesiones_pushes_athena_queue_seconds', 'Tiempo total en cola de Athena', [('', athena['cola_segundos'])])
+    metrica('sesiones_pushes_athena_engine_seconds', 'Tiempo total de motor de Athena', [('', athena['motor_segundos'])])
+    metrica('sesiones_pushes_athena_scanned_bytes', 'Bytes escaneados por Athena', [('', athena['bytes_escaneados'])])
+    metrica('sesiones_pushes_athena_cost_usd', 'Costo estimado de Athena en USD', [('', round(athena['costo_usd'], 6))])
+    metrica('sesiones_pushes_result_reuse', 'Queries resueltas reutilizando resultados previos',
+            [('{resultado="hit"}', athena['reuso_hits']), ('{resultado="miss"}', athena['reuso_misses'])])
+    metrica('sesiones_pushes_saved_bytes', 'Bytes que no se escanearon gracias al reuso', [('', athena['bytes_ahorrados'])])
+    rss = peak_rss_mb()
+    if rss is not None:
+        metrica('sesiones_pushes_peak_rss_bytes', 'Pico de memoria residente', [('', int(rss * 1024 * 1024))])
+    metrica('sesiones_pushes_last_run_success', '1 si la ultima ejecucion termino bien', [('', int(bool(exito)))])
+    metrica('sesiones_pushes_last_run_timestamp_seconds', 'Fin de la ultima ejecucion', [('', int(time.time()))])
+    
+    def escribir(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lineas) + '\n')
+    replace_atomically(path, escribir)
+
+def print_metrics_summary():
+    """Tabla resumen de etapas y queries de Athena de la ejecucion"""
+    etapas, athena = summarize_metrics()
+    
+    print("")
+    print("=" * 60)
+    print("METRICAS DE LA EJECUCION")
+    print("=" * 60)
+    print("  {:<14} {:>6} {:>12} {:>12}".format('Etapa', 'Veces', 'Total (s)', 'Maximo (s)'))
+    for etapa, total in etapas.items():
+        print("  {:<14} {:>6} {:>12.2f} {:>12.2f}".format(etapa, total['veces'], total['segundos'], total['maximo']))
+    print("")
+    print("  Queries Athena: {}".format(athena['queries']))
+    print("      En cola: {:.1f} s | Motor: {:.1f} s".format(athena['cola_segundos'], athena['motor_segundos']))
+    print("      Escaneado: {:,.1f} MB | Costo estimado: USD {:.4f}".format(
+        athena['bytes_escaneados'] / float(1024 ** 2), athena['costo_usd']))
+    if athena['reintentos'] or athena['aperturas_breaker']:
+        print("  Reintentos: {} | Aperturas del circuit breaker: {}".format(
+            athena['reintentos'], athena['aperturas_breaker']))
+    if athena['reuso_hits'] or athena['reuso_misses']:
+        print("  Reuso de resultados: {} hits / {} misses | Ahorrado: {:,.1f} MB (USD {:.4f})".format(
+            athena['reuso_hits'], athena['reuso_misses'], athena['bytes_ahorrados'] / float(1024 ** 2),
+            estimate_query_cost(athena['bytes_ahorrados'])))
+    rss = peak_rss_mb()
+    if rss is not None:
+        print("  Pico de memoria: {:,.0f} MB".format(rss))
+    print("=" * 60)
+
+def emit_metrics(exito):
+    """Emite las metricas de la ejecucion (JSON lines, Prometheus) y muestra el resumen"""
+    try:
+        write_metrics_jsonl(exito)
+        if CONFIG['metrics_prometheus_file']:
+            write_prometheus_textfile(CONFIG['metrics_prometheus_file'], exito)
+    except Exception as e:
+        print("[ADVERTENCIA] No se pudieron escribir las metricas: {}".format(e))
+    print_metrics_summary()
+
+# ==================== REINTENTOS Y CIRCUIT BREAKER ====================
+# Los errores de Athena/botocore se clasifican en:
+#   throttling   -> TooManyRequestsException, ThrottlingException, SlowDown...
+#   transitorio  -> errores de red/5xx y queries FAILED reintentables (S3 SlowDown, ICEBERG_...)
+#   credenciales -> token expirado o invalido (no se reintenta: hay que renovar la sesion)
+#   permanente   -> el resto (SQL invalido, permisos, tabla inexistente...)
+# Throttling y transitorios se reintentan con backoff exponencial con jitter completo.
+# Un token bucket compartido limita el ritmo de StartQueryExecution de todo el proceso
+# (se vacia ante throttling) y un circuit breaker corta las llamadas despues de
+# circuit_breaker_threshold fallas seguidas, hasta circuit_breaker_reset_seconds.
+
+THROTTLING_ERROR_CODES = {'TooManyRequestsException', 'ThrottlingException', 'Throttling', 'SlowDown',
+                          'RequestLimitExceeded', 'ProvisionedThroughputExceededException'}
+TRANSIENT_ERROR_CODES = {'InternalServerException', 'InternalFailure', 'InternalError', 'ServiceUnavailable',
+                         'ServiceUnavailableException', 'RequestTimeout', 'RequestTimeoutException'}
+CREDENTIAL_ERROR_CODES = {'ExpiredToken', 'ExpiredTokenException', 'RequestExpired', 'InvalidClientTokenId',
+                          'UnrecognizedClientException'}
+TRANSIENT_FAILURE_PATTERNS = ('slowdown', 'slow down', 'reduce your request rate', 'throttl', 'iceberg_',
+                              'internal_error', 'hive_cannot_open_split', 'service unavailable')
+
+class CircuitOpenError(Exception):
+    """El circuit breaker esta abierto: no se llama a Athena hasta que venza la espera"""
+
+def classify_error(e):
+    """Clasifica un error como 'throttling', 'transitorio', 'credenciales' o 'permanente'"""
+    from botocore.exceptions import (ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError,
+                                     ReadTimeoutError)
+    
+    if isinstance(e, AthenaQueryError):
+        if e.estado == 'FAILED' and (e.reintentable or any(
+                patron in str(e.motivo).lower() for patron in TRANSIENT_FAILURE_PATTERNS)):
+            return 'transitorio'
+        return 'permanente'
+    
+    codigo = getattr(e, 'response', {}).get('Error', {}).get('Code', '')
+    if codigo in THROTTLING_ERROR_CODES:
+        return 'throttling'
+    if codigo in CREDENTIAL_ERROR_CODES or 'ExpiredToken' in str(e):
+        return 'credenciales'
+    if codigo in TRANSIENT_ERROR_CODES:
+        return 'transitorio'
+    if isinstance(e, (EndpointConnectionError, ConnectionClosedError, ReadTimeoutError, ConnectTimeoutError)):
+        return 'transitorio'
+    return 'permanente'
+
+def backoff_delay(intento):
+    """Espera antes del reintento intento (0, 1, ...): backoff exponencial con jitter completo"""
+    techo = min(CONFIG['retry_max_seconds'], CONFIG['retry_base_seconds'] * 2 ** intento)
+    return random.uniform(0, techo)
+
+class TokenBucket:
+    """Token bucket thread-safe: rate tokens por segundo, hasta capacity acumulados"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.actualizado = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def reserve(self):
+        """Toma un token si hay; si no, retorna los segundos a esperar hasta el proximo"""
+        with self.lock:
+            ahora = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (ahora - self.actualizado) * self.rate)
+            self.actualizado = ahora
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+    
+    async def acquire(self):
+        while True:
+            espera = self.reserve()
+            if espera <= 0:
+                return
+            await asyncio.sleep(espera)
+    
+    def drain(self):
+        """Vacia el bucket (ante throttling se frena el ritmo de todo el proceso)"""
+        with self.lock:
+            self.tokens = 0.0
+            self.actualizado = time.monotonic()
+
+class CircuitBreaker:
+    """Circuit breaker de fallas consecutivas (cerrado -> abierto -> semiabierto -> cerrado)"""
+    
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.fallas = 0
+        self.estado = 'cerrado'
+        self.abierto_desde = None
+        self.prueba_desde = None
+        self.aperturas = 0
+        self.lock = threading.Lock()
+    
+    def check(self):
+        """
+        Lanza CircuitOpenError si el circuito esta abierto. Pasado reset_seconds deja pasar
+        una sola llamada de prueba (semiabierto); las demas esperan su resultado. Si la
+        prueba no informa resultado en reset_seconds (ej: se cancelo), se permite otra.
+        """
+        with self.lock:
+            if self.estado == 'cerrado':
+                return
+            ahora = time.monotonic()
+            if self.estado == 'abierto':
+                restante = self.reset_seconds - (ahora - self.abierto_desde)
+                if restante > 0:
+                    raise CircuitOpenError("Circuit breaker abierto: {} fallas seguidas, se reintenta en {:.0f} s".format(
+                        self.fallas, restante))
+                self.estado = 'semiabierto'
+            elif ahora - self.prueba_desde < self.reset_seconds:
+                raise CircuitOpenError("Circuit breaker semiabierto: hay una llamada de prueba en curso")
+            self.prueba_desde = ahora
+    
+    def success(self):
+        with self.lock:
+            self.fallas = 0
+            self.estado = 'cerrado'
+            self.prueba_desde = None
+    
+    def failure(self):
+        with self.lock:
+            self.fallas += 1
+            if self.estado == 'semiabierto' or (self.estado == 'cerrado' and self.fallas >= self.threshold):
+                self.estado = 'abierto'
+                self.abierto_desde = time.monotonic()
+                self.prueba_desde = None
+                self.aperturas += 1
+                print("[ADVERTENCIA] Circuit breaker abierto tras {} fallas seguidas: pausa de {} s".format(
+                    self.fallas, self.reset_seconds))
+
+_RETRY_STATE = {}
+
+def get_token_bucket():
+    """Token bucket compartido para StartQueryExecution (todas las queries del proceso)"""
+    if 'bucket' not in _RETRY_STATE:
+        _RETRY_STATE['bucket'] = TokenBucket(CONFIG['start_query_rate_per_second'],
+                                             CONFIG['max_concurrent_queries'])
+    return _RETRY_STATE['bucket']
+
+def get_circuit_breaker():
+    """Circuit breaker compartido por todas las llamadas a Athena del proceso"""
+    if 'breaker' not in _RETRY_STATE:
+        _RETRY_STATE['breaker'] = CircuitBreaker(CONFIG['circuit_breaker_threshold'],
+                                                 CONFIG['circuit_breaker_reset_seconds'])
+    return _RETRY_STATE['breaker']
+
+def handle_retry_error(e, intento, descripcion):
+    """
+    Registra la falla en el breaker y decide si se reintenta.
+    Retorna los segundos a esperar o relanza el error si no corresponde reintentar.
+    """
+    tipo = classify_error(e)
+    if tipo not in ('throttling', 'transitorio'):
+        # Athena respondio: el error no es de disponibilidad (y libera la llamada de prueba)
+        get_circuit_breaker().success()
+        raise e
+    get_circuit_breaker().failure()
+    if tipo == 'throttling':
+        get_token_bucket().drain()
+    _RETRY_STATE['reintentos'] = _RETRY_STATE.get('reintentos', 0) + 1
+    if intento + 1 >= CONFIG['retry_max_attempts']:
+        raise e
+    espera = backoff_delay(intento)
+    print("    [ADVERTENCIA] {}: error {} ({}); reintento {} de {} en {:.1f} s".format(
+        descripcion, tipo, type(e).__name__, intento + 1, CONFIG['retry_max_attempts'] - 1, espera))
+    return espera
+
+def call_with_retry(fn, **kwargs):
+    """Llamada boto3 sincronica con reintentos y circuit breaker"""
+    intento = 0
+    while True:
+        get_circuit_breaker().check()
+        try:
+            resultado = fn(**kwargs)
+        except Exception as e:
+            time.sleep(handle_retry_error(e, intento, getattr(fn, '__name__', 'llamada')))
+            intento += 1
+            continue
+        get_circuit_breaker().success()
+        return resultado
+
+# ==================== EJECUCION EN ATHENA ====================
+# Motor asyncio sobre StartQueryExecution / BatchGetQueryExecution / GetQueryResults.
+# Las llamadas boto3 (bloqueantes) corren en el executor por defecto, por lo que
+# mientras una query espera en Athena el proceso puede escribir CSV/Excel de otra.
+# - Un unico poller consulta todas las queries en curso juntas, con backoff
+#   exponencial entre poll_min_seconds y poll_max_seconds.
+# - Cada query tiene timeout: al vencer se llama a StopQueryExecution.
+# - Si la tarea se cancela (Ctrl-C) las queries en curso se detienen en Athena.
+# El cliente se recibe por parametro, asi el motor puede probarse con un stub
+# local que implemente esas operaciones (tests/stub_athena.py, o DuckDBAthenaClient).
+
+class AthenaQueryError(Exception):
+    """La query termino en Athena en estado FAILED o CANCELLED"""
+    
+    def __init__(self, query_id, estado, motivo, reintentable=False):
+        super().__init__("Query {} termino en estado {}: {}".format(query_id, estado, motivo))
+        self.query_id = query_id
+        self.estado = estado
+        self.motivo = motivo
+        # AthenaError.Retryable de la QueryExecution
+        self.reintentable = reintentable
+
+ATHENA_NUMERIC_TYPES = {
+    'tinyint': 'Int64', 'smallint': 'Int64', 'integer': 'Int64', 'bigint': 'Int64',
+    'float': 'float64', 'real': 'float64', 'double': 'float64', 'decimal': 'float64'
+}
+
+def rows_to_dataframe(columnas, filas):
+    """Convierte filas de GetQueryResults (listas de VarCharValue) en DataFrame tipado"""
+    nombres = [col['Name'] for col in columnas]
+    df = pd.DataFrame(filas, columns=nombres)
+    for col in columnas:
+        tipo = ATHENA_NUMERIC_TYPES.get(col['Type'].lower())
+        if tipo == 'Int64':
+            df[col['Name']] = pd.to_numeric(df[col['Name']]).astype('Int64')
+        elif tipo is not None:
+            df[col['Name']] = pd.to_numeric(df[col['Name']]).astype(tipo)
+    return df
+
+class AsyncAthenaEngine:
+    """Ejecuta queries de Athena de forma no bloqueante (ver descripcion de la seccion)"""
+    
+    def __init__(self, client, database, workgroup, s3_output_fallback=None,
+                 poll_min=None, poll_max=None, timeout=None):
+        self.client = client
+        self.database = database
+        self.workgroup = workgroup
+        # Funcion que retorna el OutputLocation a usar si falla el workgroup
+        self.s3_output_fallback = s3_output_fallback
+        self.poll_min = poll_min if poll_min is not None else CONFIG['poll_min_seconds']
+        self.poll_max = poll_max if poll_max is not None else CONFIG['poll_max_seconds']
+        self.timeout = timeout if timeout is not None else CONFIG['query_timeout_seconds']
+        self.en_curso = set()
+        self.consultas = {}         # query_id -> SQL (para el registro de ejecuciones)
+        self.reutilizadas = {}      # query_id -> ejecucion registrada que se reutiliza
+        self._esperando = {}
+        self._poller = None
+        self._nuevas = None
+    
+    async def _call(self, fn, **kwargs):
+        """Ejecuta una llamada boto3 bloqueante en el executor, con reintentos y circuit breaker"""
+        loop = asyncio.get_running_loop()
+        intento = 0
+        while True:
+            get_circuit_breaker().check()
+            try:
+                resultado = await loop.run_in_executor(None, functools.partial(fn, **kwargs))
+            except Exception as e:
+                await asyncio.sleep(handle_retry_error(e, intento, getattr(fn, '__name__', 'llamada')))
+                intento += 1
+                continue
+            get_circuit_breaker().success()
+            return resultado
+    
+    async def reuse_query(self, query):
+        """QueryExecutionId de una ejecucion registrada reutilizable (sigue en SUCCEEDED), o None"""
+        previa = find_reusable_execution(query)
+        if previa is None:
+            return None
+        try:
+            respuesta = await self._call(self.client.get_query_execution, QueryExecutionId=previa['query_id'])
+        except Exception:
+            return None
+        if respuesta['QueryExecution']['Status']['State'] != 'SUCCEEDED':
+            return None
+        print("    [INFO] Reutilizando resultado de la ejecucion {} (hace {:.0f} min, sin escanear)".format(
+            previa['query_id'], (time.time() - previa['finished']) / 60.0))
+        self.reutilizadas[previa['query_id']] = previa
+        return previa['query_id']
+    
+    async def start_query(self, query):
+        """
+        StartQueryExecution con fallback sin workgroup. Retorna el QueryExecutionId
+        (el de una ejecucion previa si su resultado se puede reutilizar).
+        """
+        query_id = await self.reuse_query(query)
+        if query_id is not None:
+            return query_id
+        
+        await get_token_bucket().acquire()
+        extra = {}
+        if CONFIG['athena_result_reuse'] and not is_local_backend():
+            extra['ResultReuseConfiguration'] = {'ResultReuseByAgeConfiguration': {
+                'Enabled': True, 'MaxAgeInMinutes': CONFIG['athena_result_reuse_max_age_minutes']}}
+        try:
+            respuesta = await self._call(
+                self.client.start_query_execution,
+                QueryString=query,
+                QueryExecutionContext={'Database': self.database},
+                WorkGroup=self.workgroup,
+                **extra
+            )
+        except Exception as e:
+            if self.s3_output_fallback is None or not (
+                    'workgroup' in str(e).lower() or 'GetWorkGroup' in str(e)):
+                raise e
+            print("[ADVERTENCIA] Error con workgroup '{}', iniciando sin workgroup...".format(self.workgroup))
+            output = await asyncio.get_running_loop().run_in_executor(None, self.s3_output_fallback)
+            respuesta = await self._call(
+                self.client.start_query_execution,
+                QueryString=query,
+                QueryExecutionContext={'Database': self.database},
+                ResultConfiguration={'OutputLocation': output},
+                **extra
+            )
+        query_id = respuesta['QueryExecutionId']
+        self.en_curso.add(query_id)
+        self.consultas[query_id] = query
+        return query_id
+    
+    async def stop_query(self, query_id):
+        """StopQueryExecution (los errores se informan pero no se propagan)"""
+        self.en_curso.discard(query_id)
+        try:
+            await self._call(self.client.stop_query_execution, QueryExecutionId=query_id)
+            print("    [INFO] Query detenida en Athena: {}".format(query_id))
+        except Exception as e:
+            print("    [ADVERTENCIA] No se pudo detener la query {}: {}".format(query_id, str(e)))
+    
+    def stop_all_sync(self):
+        """Detiene sincronicamente las queries en curso (para usar fuera del loop, ej. tras Ctrl-C)"""
+        for query_id in list(self.en_curso):
+            self.en_curso.discard(query_id)
+            try:
+                self.client.stop_query_execution(QueryExecutionId=query_id)
+                print("    [INFO] Query detenida en Athena: {}".format(query_id))
+            except Exception as e:
+                print("    [ADVERTENCIA] No se pudo detener la query {}: {}".format(query_id, str(e)))
+    
+    async def _poll_loop(self):
+        """Consulta juntas todas las queries en espera con backoff exponencial"""
+        delay = self.poll_min
+        while self._esperando:
+            try:
+                await asyncio.wait_for(self._nuevas.wait(), timeout=delay)
+                # Llego una query nueva: volver al intervalo minimo
+                self._nuevas.clear()
+                delay = self.poll_min
+            except asyncio.TimeoutError:
+                delay = min(delay * 2, self.poll_max)
+            
+            ids = list(self._esperando.keys())
+            try:
+                ejecuciones = []
+                for i in range(0, len(ids), 50):
+                    respuesta = await self._call(self.client.batch_get_query_execution,
+                                                 QueryExecutionIds=ids[i:i + 50])
+                    ejecuciones.extend(respuesta.get('QueryExecutions', []))
+            except Exception as e:
+                if classify_error(e) in ('throttling', 'transitorio'):
+                    # Se agotaron los reintentos de esta consulta de estado: seguir esperando mas espaciado
+                    delay = self.poll_max
+                    continue
+                for futuro in self._esperando.values():
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                self._esperando.clear()
+                break
+            
+            for ejecucion in ejecuciones:
+                query_id = ejecucion['QueryExecutionId']
+                if ejecucion['Status']['State'] in ('QUEUED', 'RUNNING'):
+                    continue
+                futuro = self._esperando.pop(query_id, None)
+                if futuro is not None and not futuro.done():
+                    futuro.set_result(ejecucion)
+        self._poller = None
+    
+    async def wait_query(self, query_id, timeout=None):
+        """Espera el fin de la query. Retorna el QueryExecution o lanza AthenaQueryError/TimeoutError"""
+        loop = asyncio.get_running_loop()
+        if self._nuevas is None:
+            self._nuevas = asyncio.Event()
+        futuro = loop.create_future()
+        self._esperando[query_id] = futuro
+        self._nuevas.set()
+        if self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll_loop())
+        
+        try:
+            ejecucion = await asyncio.wait_for(futuro, timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._esperando.pop(query_id, None)
+            print("")
+            print("[ERROR] La query {} supero el timeout de {} s".format(query_id, timeout or self.timeout))
+            await self.stop_query(query_id)
+            raise
+        except asyncio.CancelledError:
+            self._esperando.pop(query_id, None)
+            await self.stop_query(query_id)
+            raise
+        
+        self.en_curso.discard(query_id)
+        self.record_execution(query_id, ejecucion)
+        estado = ejecucion['Status']['State']
+        if estado != 'SUCCEEDED':
+            raise AthenaQueryError(query_id, estado, ejecucion['Status'].get('StateChangeReason', estado),
+                                   reintentable=ejecucion['Status'].get('AthenaError', {}).get('Retryable', False))
+        return ejecucion
+    
+    def record_execution(self, query_id, ejecucion):
+        """Metricas de la ejecucion terminada y alta en el registro de ejecuciones"""
+        if query_id in self.reutilizadas:
+            record_reuse(True, self.reutilizadas[query_id]['bytes_escaneados'])
+            return
+        record_query_metrics(ejecucion)
+        reuso_athena = ejecucion.get('Statistics', {}).get('ResultReuseInformation', {})
+        if reuso_athena.get('ReusedPreviousResult'):
+            # Athena no informa cuanto escaneo la ejecucion original
+            record_reuse(True)
+        elif is_query_reuse_enabled() or CONFIG['athena_result_reuse']:
+            record_reuse(False)
+        if ejecucion['Status']['State'] == 'SUCCEEDED' and query_id in self.consultas:
+            register_execution(self.consultas.pop(query_id), ejecucion)
+    
+    async def fetch_results(self, query_id):
+        """Pagina GetQueryResults (en el executor) y retorna un DataFrame"""
+        loop = asyncio.get_running_loop()
+        inicio = time.perf_counter()
+        df = await loop.run_in_executor(
+            None, lambda: concat_pages(iter_result_pages(self.client, query_id)))
+        record_stage('descarga', inicio)
+        return df
+    
+    async def execute_query(self, query, timeout=None):
+        """Start + wait, relanzando la query si termina FAILED por un error transitorio. Retorna el QueryExecution"""
+        intento = 0
+        while True:
+            query_id = await self.start_query(query)
+            try:
+                ejecucion = await self.wait_query(query_id, timeout)
+            except AthenaQueryError as e:
+                await asyncio.sleep(handle_retry_error(e, intento, 'query {}'.format(query_id)))
+                intento += 1
+                continue
+            get_circuit_breaker().success()
+            return ejecucion
+    
+    async def run_query(self, query, timeout=None):
+        """Start + wait + fetch. Retorna (DataFrame, QueryExecution)"""
+        ejecucion = await self.execute_query(query, timeout)
+        df = await self.fetch_results(ejecucion['QueryExecutionId'])
+        return df, ejecucion
+
+def create_athena_engine(session):
+    """Crea el motor asyncio con el cliente Athena de la sesion y el fallback de wrangler"""
+    if is_local_backend():
+        # DuckDB termina cada query al iniciarla: polling casi inmediato
+        return AsyncAthenaEngine(get_duckdb_client(), database=CONFIG['database'],
+                                 workgroup=CONFIG['workgroup'], poll_min=0.01, poll_max=0.01)
+    return AsyncAthenaEngine(
+        get_aws_client('athena'),
+        database=CONFIG['database'],
+        workgroup=CONFIG['workgroup'],
+        s3_output_fallback=lambda: wr.athena.create_athena_bucket(boto3_session=session)
+    )
+
+def run_async(coro, engine):
+    """asyncio.run que ante Ctrl-C detiene en Athena las queries que quedaron en curso"""
+    try:
+        return asyncio.run(coro)
+    except KeyboardInterrupt:
+        print("")
+        print("[ADVERTENCIA] Interrumpido por el usuario: cancelando queries en curso...")
+        engine.stop_all_sync()
+        raise
+
+def run_athena_query(query, session, expected_rows=None):
+    """
+    Ejecuta la query en Athena (con fallback sin workgroup) y retorna un DataFrame.
+    expected_rows: filas esperadas del resultado, para elegir entre la descarga por
+    API y UNLOAD a Parquet (ver choose_fetch_strategy).
+    """
+    warn_if_credentials_expiring()
+    if choose_fetch_strategy(expected_rows) == 'unload':
+        return run_athena_query_unload(query, session)
+    engine = create_athena_engine(session)
+    df, _ = run_async(engine.run_query(query), engine)
+    return df
+
+# ==================== LECTURA DE RESULTADOS POR STREAMING ====================
+# Los resultados se recorren como generador de DataFrames (una pagina o chunk a la
+# vez): el CSV se escribe incrementalmente y la agregacion se hace sobre la marcha,
+# por lo que la memoria no depende del tamaño del resultado.
+
+def iter_result_pages(client, query_id, page_size=1000):
+    """Generador: pagina GetQueryResults y retorna un DataFrame tipado por pagina"""
+    columnas = None
+    token = None
+    while True:
+        kwargs = {'QueryExecutionId': query_id, 'MaxResults': page_size}
+        if token:
+            kwargs['NextToken'] = token
+        respuesta = call_with_retry(client.get_query_results, **kwargs)
+        rows = respuesta['ResultSet']['Rows']
+        if columnas is None:
+            columnas = respuesta['ResultSet']['ResultSetMetadata']['ColumnInfo']
+            rows = rows[1:]  # la primera fila es el encabezado
+        yield rows_to_dataframe(columnas, [[dato.get('VarCharValue') for dato in row['Data']] for row in rows])
+        token = respuesta.get('NextToken')
+        if not token:
+            break
+
+def iter_s3_result_chunks(session, output_location, chunk_rows=None, dtype=None):
+    """Generador: lee en chunks el CSV de resultados que Athena deja en S3"""
+    if chunk_rows is None:
+        chunk_rows = CONFIG['stream_chunk_rows']
+    bucket, key = output_location.replace('s3://', '', 1).split('/', 1)
+    body = get_aws_client('s3').get_object(Bucket=bucket, Key=key)['Body']
+    try:
+        for chunk in pd.read_csv(body, chunksize=chunk_rows, dtype=dtype):
+            yield chunk
+    finally:
+        body.close()
+
+def concat_pages(paginas):
+    """Junta las paginas de un generador en un unico DataFrame"""
+    paginas = list(paginas)
+    if len(paginas) == 1:
+        return paginas[0]
+    return pd.concat(paginas, ignore_index=True)
+
+def write_csv_streaming(paginas, csv_path, group_cols=('starting_cause',), value_col='Cant_sesiones'):
+    """
+    Escribe las paginas en csv_path a medida que llegan y acumula value_col por group_cols.
+    Retorna el DataFrame agregado (una fila por grupo) y la cantidad de filas escritas.
+    """
+    acumulado = None
+    filas = 0
+    os.makedirs(os.path.dirname(csv_path) or '.', exist_ok=True)
+    with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+        for pagina in paginas:
+            pagina.to_csv(f, index=False, header=(filas == 0))
+            filas += len(pagina)
+            if len(pagina) == 0:
+                continue
+            parcial = pagina.groupby(list(group_cols))[value_col].sum()
+            acumulado = parcial if acumulado is None else acumulado.add(parcial, fill_value=0)
+    
+    if acumulado is None:
+        return pd.DataFrame(columns=list(group_cols) + [value_col]), filas
+    df = acumulado.astype('int64').reset_index()
+    return df.sort_values(value_col, ascending=False).reset_index(drop=True), filas
+
+def run_athena_query_streaming(query, session, csv_path, group_cols=('starting_cause',), value_col='Cant_sesiones'):
+    """Ejecuta la query y descarga el resultado por streaming directo a csv_path. Retorna el agregado"""
+    engine = create_athena_engine(session)
+    
+    async def ejecutar():
+        return await engine.execute_query(query)
+    
+    ejecucion = run_async(ejecutar(), engine)
+    
+    if CONFIG['stream_source'] == 's3' and not is_local_backend():
+        paginas = iter_s3_result_chunks(session, ejecucion['ResultConfiguration']['OutputLocation'])
+    else:
+        paginas = iter_result_pages(engine.client, ejecucion['QueryExecutionId'])
+    
+    df, filas = write_csv_streaming(paginas, csv_path, group_cols, value_col)
+    print("    [INFO] Resultado descargado por streaming: {:,} filas -> {}".format(filas, csv_path))
+    return df
+
+# ==================== DESCARGA VIA UNLOAD (PARQUET) ====================
+# GetQueryResults devuelve hasta 1000 filas por llamada, todas como texto: sirve para
+# resultados agregados pero es muy lento para extracciones de detalle. Con UNLOAD
+# Athena escribe el resultado como Parquet en S3 y se lee directamente en columnas.
+
+def choose_fetch_strategy(expected_rows):
+    """Elige 'api' o 'unload' segun fetch_strategy y las filas esperadas"""
+    estrategia = CONFIG['fetch_strategy']
+    if is_local_backend():
+        return 'api'
+    if estrategia != 'auto':
+        return estrategia
+    if expected_rows is not None and expected_rows >= CONFIG['unload_threshold_rows']:
+        return 'unload'
+    return 'api'
+
+def build_unload_query(query, s3_prefix):
+    """Envuelve la query en UNLOAD ... TO s3_prefix en formato Parquet"""
+    return """UNLOAD (
+{query}
+)
+TO '{destino}'
+WITH (format = 'PARQUET', compression = 'SNAPPY')""".format(query=query, destino=s3_prefix)
+
+def get_unload_prefix(session):
+    """Prefijo S3 vacio y unico para un UNLOAD (UNLOAD exige que el destino no tenga archivos)"""
+    base = CONFIG['unload_s3_prefix']
+    if not base:
+        base = wr.athena.create_athena_bucket(boto3_session=session) + 'unload/'
+    if not base.endswith('/'):
+        base += '/'
+    return "{}{}/{}/".format(base, datetime.now().strftime('%Y%m%d'), uuid.uuid4().hex)
+
+def read_unload_results(prefix, session=None):
+    """Lee los Parquet escritos por UNLOAD (prefijo s3:// o carpeta local)"""
+    if prefix.startswith('s3://'):
+        return wr.s3.read_parquet(path=prefix, boto3_session=session)
+    return pd.read_parquet(prefix)
+
+def iter_unload_files(prefix, session=None):
+    """Generador: lee los Parquet de un UNLOAD de a un archivo por vez, en orden de nombre"""
+    if prefix.startswith('s3://'):
+        archivos = sorted(wr.s3.list_objects(prefix, boto3_session=session))
+    else:
+        archivos = sorted(glob.glob(os.path.join(prefix, '*')))
+    for archivo in archivos:
+        if archivo.startswith('s3://'):
+            yield wr.s3.read_parquet(path=archivo, boto3_session=session)
+        else:
+            yield pd.read_parquet(archivo)
+
+def delete_unload_results(prefix, session=None):
+    """Borra los archivos de un UNLOAD, salvo con unload_keep_files"""
+    if CONFIG['unload_keep_files']:
+        return
+    if prefix.startswith('s3://'):
+        wr.s3.delete_objects(path=prefix, boto3_session=session)
+    else:
+        import shutil
+        shutil.rmtree(prefix, ignore_errors=True)
+
+def run_athena_query_unload(query, session):
+    """Ejecuta la query como UNLOAD a Parquet y lee el resultado desde S3"""
+    prefix = get_unload_prefix(session)
+    engine = create_athena_engine(session)
+    
+    async def ejecutar():
+        return await engine.execute_query(build_unload_query(query, prefix))
+    
+    print("    [INFO] Descarga via UNLOAD a Parquet: {}".format(prefix))
+    run_async(ejecutar(), engine)
+    try:
+        df = read_unload_results(prefix, session)
+    finally:
+        delete_unload_results(prefix, session)
+    print("    [INFO] UNLOAD leido: {:,} filas".format(len(df)))
+    return df
+
+# ==================== EXPORTACION DE DETALLE POR SESION ====================
+# Una fila por sesion (session_id, session_creation_time, starting_cause) del periodo,
+# para auditar el numero de D4: con detail_starting_cause = 'WhatsAppTemplate' la
+# cantidad de filas es exactamente D4. La query se ejecuta como UNLOAD a Parquet y los
+# archivos se leen de a uno (ya tipados y comprimidos, sin parsear texto); si el UNLOAD
+# falla o fetch_strategy = 'api', se leen chunks del CSV que Athena deja en S3 (nunca
+# GetQueryResults, de a 1000 filas). Cada chunk de
+# detail_chunk_rows filas se escribe como un archivo comprimido en un pool de
+# detail_writers threads mientras se descarga el chunk siguiente. Como mucho hay
+# detail_writers chunks en escritura mas el que se esta leyendo, por lo que la memoria
+# queda acotada sin importar la cantidad de filas. En la carpeta queda un _manifest.json
+# con las filas, el tamaño y el sha256 de cada archivo.
+
+DETAIL_FORMATS = {
+    # formato: (extension, compresion). gzip nivel 6: ~2.5x mas rapido que el 9 por defecto
+    'csv.gz': ('csv.gz', {'method': 'gzip', 'compresslevel': 6}),
+    'csv.zst': ('csv.zst', {'method': 'zstd'}),
+    'parquet': ('parquet', 'zstd')
+}
+
+def build_detail_query(fecha_inicio, fecha_fin, layout=None):
+    """Query de una fila por sesion del periodo (filtrada por detail_starting_cause si esta definido)"""
+    if layout is None:
+        layout = get_table_layout('boti_session_metrics_2')
+    
+    where = build_where_clause(fecha_inicio, fecha_fin, layout)
+    if CONFIG['detail_starting_cause']:
+        where += "\n  AND starting_cause = '{}'".format(CONFIG['detail_starting_cause'])
+    
+    return """SELECT session_id, min({col}) as session_creation_time, starting_cause 
+FROM "{database}"."{table}"
+WHERE {where}
+group by session_id, starting_cause""".format(
+        col=layout['timestamp_column'],
+        database=layout['database'],
+        table=layout['table'],
+        where=where
+    )
+
+def iter_fixed_chunks(paginas, chunk_rows):
+    """Reagrupa un generador de paginas en DataFrames de chunk_rows filas (el ultimo puede ser menor)"""
+    buffer = []
+    filas = 0
+    for pagina in paginas:
+        buffer.append(pagina)
+        filas += len(pagina)
+        while filas >= chunk_rows:
+            df = pd.concat(buffer, ignore_index=True) if len(buffer) > 1 else buffer[0]
+            yield df.iloc[:chunk_rows].reset_index(drop=True)
+            resto = df.iloc[chunk_rows:]
+            buffer = [resto] if len(resto) else []
+            filas = len(resto)
+    if filas:
+        yield pd.concat(buffer, ignore_index=True) if len(buffer) > 1 else buffer[0].reset_index(drop=True)
+
+def write_detail_chunk(df, path, formato):
+    """Escribe un chunk comprimido (corre en el pool de threads). Retorna la entrada del manifest"""
+    compresion = DETAIL_FORMATS[formato][1]
+    if formato == 'parquet':
+        if not pd.api.types.is_datetime64_any_dtype(df['session_creation_time']):
+            df = df.assign(session_creation_time=pd.to_datetime(df['session_creation_time']))
+        df.to_parquet(path, index=False, compression=compresion)
+    else:
+        df.to_csv(path, index=False, encoding='utf-8', compression=compresion)
+    
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(bloque)
+    return {'archivo': os.path.basename(path), 'filas': len(df), 'bytes': os.path.getsize(path),
+            'sha256': sha256.hexdigest()}
+
+def write_detail_chunks(paginas, carpeta, formato, chunk_rows, writers, verbose=True):
+    """
+    Escribe las paginas como archivos part-NNNNN de chunk_rows filas en un pool de `writers`
+    threads. Retorna las entradas del manifest en orden.
+    """
+    import concurrent.futures
+    
+    archivos = []
+    
+    def terminar(futuro):
+        archivos.append(futuro.result())
+        if verbose:
+            print("    [OK] {} ({:,} filas)".format(archivos[-1]['archivo'], archivos[-1]['filas']))
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=writers) as pool:
+        en_escritura = []
+        for numero, chunk in enumerate(iter_fixed_chunks(paginas, chunk_rows)):
+            # Memoria acotada: no se lee otro chunk mientras todos los threads esten ocupados
+            while len(en_escritura) >= writers:
+                terminar(en_escritura.pop(0))
+            path = os.path.join(carpeta, 'part-{:05d}.{}'.format(numero, DETAIL_FORMATS[formato][0]))
+            en_escritura.append(pool.submit(write_detail_chunk, chunk, path, formato))
+        for futuro in en_escritura:
+            terminar(futuro)
+    return archivos
+
+def export_session_detail(periodo, session):
+    """
+    Exporta el detalle por sesion del periodo en archivos de detail_chunk_rows filas.
+    Retorna el manifest (dict) de la exportacion.
+    """
+    formato = CONFIG['detail_format']
+    if formato not in DETAIL_FORMATS:
+        raise ValueError("detail_format invalido: {} (opciones: {})".format(formato, ", ".join(DETAIL_FORMATS)))
+    if formato == 'csv.zst':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ImportError("El formato 'csv.zst' requiere el paquete zstandard: pip install zstandard")
+    
+    modo, fecha_inicio, fecha_fin, mes, anio, descripcion = periodo
+    query = build_detail_query(fecha_inicio, fecha_fin)
+    chunk_rows = CONFIG['detail_chunk_rows']
+    writers = max(1, CONFIG['detail_writers'])
+    
+    filename_csv, _ = generate_filename(modo, mes, anio, fecha_inicio, fecha_fin)
+    carpeta = os.path.join(CONFIG['detail_folder'], filename_csv[:-len('.csv')])
+    os.makedirs(carpeta, exist_ok=True)
+    for anterior in glob.glob(os.path.join(carpeta, 'part-*')):
+        os.remove(anterior)
+    
+    print("")
+    print("Query de detalle por sesion:")
+    print("    {}".format(query))
+    print("")
+    print("Ejecutando consulta...")
+    
+    inicio = time.perf_counter()
+    engine = create_athena_engine(session)
+    
+    async def ejecutar(sql):
+        return await engine.execute_query(sql)
+    
+    prefix = None
+    if not is_local_backend() and CONFIG['fetch_strategy'] != 'api':
+        prefix = get_unload_prefix(session)
+        print("    [INFO] Descarga via UNLOAD a Parquet: {}".format(prefix))
+        try:
+            ejecucion = run_async(ejecutar(build_unload_query(query, prefix)), engine)
+        except Exception as e:
+            print("    [ADVERTENCIA] Fallo el UNLOAD ({}): se usa el CSV de resultados".format(e))
+            delete_unload_results(prefix, session)
+            prefix = None
+    if prefix is None:
+        ejecucion = run_async(ejecutar(query), engine)
+    record_stage('consulta', inicio, descripcion)
+    
+    if prefix is not None:
+        descarga = 'unload'
+        paginas = iter_unload_files(prefix, session)
+    elif is_local_backend():
+        descarga = 'api'
+        paginas = iter_result_pages(engine.client, ejecucion['QueryExecutionId'], page_size=chunk_rows)
+    else:
+        descarga = 'csv'
+        paginas = iter_s3_result_chunks(session, ejecucion['ResultConfiguration']['OutputLocation'],
+                                        chunk_rows=chunk_rows, dtype={'session_id': str, 'starting_cause': str})
+    
+    print("[INFO] Exportando en {} ({:,} filas por archivo, {} threads de escritura)".format(
+        formato, chunk_rows, writers))
+    inicio = time.perf_counter()
+    try:
+        archivos = write_detail_chunks(paginas, carpeta, formato, chunk_rows, writers)
+    finally:
+        if prefix is not None:
+            delete_unload_results(prefix, session)
+    segundos = time.perf_counter() - inicio
+    record_stage('detalle', inicio, descripcion)
+    
+    manifest = {
+        'periodo': descripcion,
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'starting_cause': CONFIG['detail_starting_cause'],
+        'query': query,
+        'query_execution_id': ejecucion['QueryExecutionId'],
+        'descarga': descarga,
+        'formato': formato,
+        'filas': sum(archivo['filas'] for archivo in archivos),
+        'archivos': archivos,
+        'generado': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    with open(os.path.join(carpeta, '_manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    
+    total_bytes = sum(archivo['bytes'] for archivo in archivos)
+    print("")
+    print("[OK] Detalle exportado: {:,} sesiones en {} archivos ({:.1f} MB, {:,.0f} filas/s)".format(
+        manifest['filas'], len(archivos), total_bytes / 1024 / 1024, manifest['filas'] / max(segundos, 1e-9)))
+    print("    Carpeta: {}".format(os.path.abspath(carpeta)))
+    return manifest
+
+def export_details(periodos):
+    """Modo --exportar-detalle: exporta el detalle de cada periodo. Retorna dict descripcion -> manifest"""
+    print("")
+    print("Verificando credenciales AWS...")
+    if not check_aws_credentials():
+        return None
+    session = get_aws_session()
+    
+    resultados = {}
+    for periodo in dedupe_periods(periodos):
+        print("")
+        print("[INFO] Detalle por sesion: {} ({} a {})".format(periodo[5], periodo[1], periodo[2]))
+        try:
+            resultados[periodo[5]] = export_session_detail(periodo, session)
+        except Exception as e:
+            print_error_diagnostics(e)
+            resultados[periodo[5]] = None
+    return resultados
+
+# ==================== BACKEND LOCAL (DUCKDB) ====================
+# Con query_backend = 'duckdb' las mismas queries se ejecutan sobre extractos locales
+# (Parquet o CSV) de boti_session_metrics_2 con DuckDB, sin AWS. DuckDBAthenaClient
+# expone la misma API que el cliente boto3 de Athena (StartQueryExecution,
+# BatchGetQueryExecution, GetQueryResults, StopQueryExecution), asi que el motor
+# asyncio, el streaming y todo el pipeline hasta el Excel funcionan sin cambios.
+# Las funciones de Athena/Trino que DuckDB no tiene se definen como macros.
+
+DUCKDB_MACROS = [
+    "approx_distinct(x, e) AS approx_count_distinct(x)",
+    "with_timezone(ts, zona) AS timezone(zona, ts)",
+    "to_utf8(x) AS x",
+    "xxhash64(x) AS hash(x)",
+    # El bit 63 no se usa en los sketches HLL (registro + 52 bits de w)
+    "from_big_endian_64(x) AS CAST(x & 9223372036854775807 AS BIGINT)",
+    "bitwise_and(a, b) AS a & b",
+    "bitwise_right_shift(a, b) AS a >> b"
+]
+
+def resolve_local_source(source):
+    """Expresion read_parquet/read_csv de DuckDB para un archivo, glob o carpeta de extractos"""
+    if os.path.isdir(source):
+        parquets = os.path.join(source, '**', '*.parquet')
+        source = parquets if glob.glob(parquets, recursive=True) else os.path.join(source, '**', '*.csv')
+    ruta = source.replace('\\', '/').replace("'", "''")
+    if source.lower().endswith('.csv') or source.lower().endswith('.csv.gz'):
+        return "read_csv_auto('{}', union_by_name = true)".format(ruta)
+    return "read_parquet('{}', union_by_name = true)".format(ruta)
+
+def athena_type(dtype):
+    """Nombre de tipo de Athena equivalente a un dtype de pandas (para ColumnInfo)"""
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'bigint'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'double'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'timestamp'
+    return 'varchar'
+
+class DuckDBAthenaClient:
+    """Stand-in del cliente boto3 de Athena que ejecuta las queries en DuckDB"""
+    
+    def __init__(self, source, database=None):
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("El backend 'duckdb' requiere el paquete duckdb: pip install duckdb")
+        self._errores = duckdb.Error
+        self.con = duckdb.connect()
+        self.lock = threading.Lock()
+        self.ejecuciones = {}
+        self.resultados = {}
+        
+        layout = get_table_layout('boti_session_metrics_2')
+        self.con.execute('CREATE SCHEMA "{}"'.format(database or layout['database']))
+        self.con.execute('CREATE VIEW "{}"."{}" AS SELECT * FROM {}'.format(
+            database or layout['database'], layout['table'], resolve_local_source(source)))
+        for macro in DUCKDB_MACROS:
+            self.con.execute("CREATE MACRO {}".format(macro))
+    
+    def start_query_execution(self, QueryString, QueryExecutionContext=None, WorkGroup=None,
+                              ResultConfiguration=None):
+        """Ejecuta la query de forma sincronica; el estado queda disponible para el polling"""
+        query_id = uuid.uuid4().hex
+        inicio = time.time()
+        estado = {'State': 'SUCCEEDED'}
+        try:
+            with self.lock:
+                self.resultados[query_id] = self.con.execute(QueryString).df()
+        except self._errores as e:
+            estado = {'State': 'FAILED', 'StateChangeReason': str(e)}
+        self.ejecuciones[query_id] = {
+            'QueryExecutionId': query_id,
+            'Query': QueryString,
+            'Status': estado,
+            'Statistics': {'QueryQueueTimeInMillis': 0,
+                           'EngineExecutionTimeInMillis': int((time.time() - inicio) * 1000),
+                           'TotalExecutionTimeInMillis': int((time.time() - inicio) * 1000),
+                           'DataScannedInBytes': 0},
+            'ResultConfiguration': {'OutputLocation': 'duckdb://{}'.format(query_id)}
+        }
+        return {'QueryExecutionId': query_id}
+    
+    def get_query_execution(self, QueryExecutionId):
+        return {'QueryExecution': self.ejecuciones[QueryExecutionId]}
+    
+    def batch_get_query_execution(self, QueryExecutionIds):
+        return {'QueryExecutions': [self.ejecuciones[query_id] for query_id in QueryExecutionIds],
+                'UnprocessedQueryExecutionIds': []}
+    
+    def stop_query_execution(self, QueryExecutionId):
+        # Las queries ya terminaron al iniciarse
+        return {}
+    
+    def get_query_results(self, QueryExecutionId, MaxResults=1000, NextToken=None):
+        """Pagina el resultado como GetQueryResults (valores como texto, NULL sin VarCharValue)"""
+        df = self.resultados[QueryExecutionId]
+        columnas = [{'Name': str(col), 'Type': athena_type(dtype)} for col, dtype in df.dtypes.items()]
+        inicio = int(NextToken or 0)
+        rows = []
+        if inicio == 0:
+            rows.append({'Data': [{'VarCharValue': col['Name']} for col in columnas]})
+            MaxResults -= 1
+        fin = min(inicio + MaxResults, len(df))
+        for valores in df.iloc[inicio:fin].itertuples(index=False, name=None):
+            rows.append({'Data': [{} if pd.isna(valor) else {'VarCharValue': str(valor)} for valor in valores]})
+        respuesta = {'ResultSet': {'Rows': rows, 'ResultSetMetadata': {'ColumnInfo': columnas}}}
+        if fin < len(df):
+            respuesta['NextToken'] = str(fin)
+        else:
+            self.resultados.pop(QueryExecutionId, None)
+        return respuesta
+
+def get_duckdb_client():
+    """Cliente DuckDB compartido del proceso (la vista sobre los extractos se crea una sola vez)"""
+    if 'duckdb' not in _AWS_STATE:
+        print("[INFO] Backend local DuckDB sobre: {}".format(CONFIG['duckdb_source']))
+        _AWS_STATE['duckdb'] = DuckDBAthenaClient(CONFIG['duckdb_source'], CONFIG['database'])
+    return _AWS_STATE['duckdb']
+
+def is_local_backend():
+    """True si las queries se ejecutan localmente (sin Athena ni credenciales AWS)"""
+    return CONFIG['query_backend'] != 'athena'
+
+# ==================== PROCESAMIENTO DE RESULTADOS ====================
+
+def print_error_diagnostics(e):
+    """Muestra el error y un diagnostico segun el mensaje"""
+    print("")
+    print("[ERROR] ERROR DURANTE LA EJECUCION")
+    print("    Tipo: {}".format(type(e).__name__))
+    print("    Mensaje: {}".format(str(e)))
+    
+    error_str = str(e).lower()
+    
+    print("")
+    print("DIAGNOSTICO:")
+    if 'table' in error_str and 'not' in error_str:
+        print("    [!] La tabla no existe o no tienes permisos para accederla")
+        print("    Verifica acceso a: boti_session_metrics_2")
+    elif 'workgroup' in error_str:
+        print("    [!] Problema con el workgroup")
+    elif 'permission' in error_str or 'denied' in error_str:
+        print("    [!] Problema de permisos")
+    elif 'openpyxl' in error_str:
+        print("    [!] Falta libreria openpyxl para generar Excel")
+        print("    Ejecuta: pip install openpyxl")
+    elif isinstance(e, CircuitOpenError):
+        print("    [!] Demasiadas fallas seguidas de Athena (throttling o errores transitorios)")
+        print("    Espera unos minutos o reduce max_concurrent_queries")
+    elif classify_error(e) == 'throttling':
+        print("    [!] Athena limito las llamadas (throttling) y se agotaron los reintentos")
+    elif classify_error(e) == 'credenciales':
+        print("    [!] Credenciales expiradas o invalidas")
+        print("    Ejecuta: aws-azure-login --profile default --mode=gui")
+    elif 'timeout' in error_str or 'timed out' in error_str:
+        print("    [!] La query tomó demasiado tiempo")
+    else:
+        print("    [!] Error inesperado")
+
+def process_and_save_results(df, periodo, csv_escrito=False, valores=None, desgloses=None):
+    """
+    Extrae el valor de WhatsAppTemplate, muestra el desglose y genera CSV + Excel.
+    csv_escrito: el CSV ya se escribio por streaming y no se vuelve a generar.
+    valores: resto de los indicadores del Dashboard (key -> valor), ver DASHBOARD_INDICATORS.
+    desgloses: dict nombre -> DataFrame adicionales (hoja del Excel + CSV con sufijo).
+    Retorna el DataFrame o None si el resultado no tiene el formato esperado.
+    """
+    modo, fecha_inicio, fecha_fin, mes, anio, descripcion = periodo
+    
+    # Procesar resultados (puede haber múltiples filas por el GROUP BY)
+    if len(df) > 0 and 'starting_cause' in df.columns and 'Cant_sesiones' in df.columns:
+        # Buscar el valor correspondiente a 'WhatsAppTemplate' (sesiones abiertas por pushes)
+        whatsapp_row = df[df['starting_cause'] == 'WhatsAppTemplate']
+        
+        if len(whatsapp_row) > 0:
+            result_value = int(whatsapp_row['Cant_sesiones'].iloc[0])
+        else:
+            print("[ADVERTENCIA] No se encontró 'WhatsAppTemplate' en starting_cause")
+            print("    Valores encontrados: {}".format(df['starting_cause'].tolist()))
+            # Si no hay 'WhatsAppTemplate', usar 0
+            result_value = 0
+    else:
+        print("[ERROR] No se pudo obtener el resultado de la query")
+        print("    Columnas: {}".format(df.columns.tolist() if len(df) > 0 else 'Sin datos'))
+        return None
+    
+    # Mostrar resultados detallados
+    print("")
+    print("=" * 60)
+    print("RESULTADOS - {}".format(descripcion.upper()))
+    print("=" * 60)
+    print("\nDesglose por starting_cause:")
+    for cause, cantidad in zip(df['starting_cause'], df['Cant_sesiones']):
+        print("  {}: {:,}".format(cause, cantidad))
+    
+    print("\n" + "=" * 60)
+    if CONFIG['approximate']:
+        # approx_distinct usa el error configurado; los sketches del store, 1.04/sqrt(m)
+        if 'Error_std' in df.columns:
+            error_std = float(df['Error_std'].iloc[0])
+        else:
+            error_std = CONFIG['approx_max_error']
+        print("SESIONES ABIERTAS POR PUSHES (WhatsAppTemplate): ~{:,} (error estandar {:.2%}, +/- {:,} sesiones)".format(
+            result_value, error_std, int(round(result_value * error_std))))
+    else:
+        print("SESIONES ABIERTAS POR PUSHES (WhatsAppTemplate): {:,}".format(result_value))
+    print("=" * 60)
+    
+    # Agregar al archivo historico
+    inicio = time.perf_counter()
+    if CONFIG['archive_results'] and not is_local_backend() and archive_results(df, periodo):
+        print("")
+        print("[OK] Resultado agregado al archivo historico ({})".format(CONFIG['archive_folder']))
+        record_stage('archivo', inicio, descripcion)
+    
+    # Generar nombres de archivo
+    filename_csv, filename_excel = generate_filename(modo, mes, anio, fecha_inicio, fecha_fin)
+    output_folder = CONFIG['output_folder']
+    
+    # Crear carpeta si no existe
+    os.makedirs(output_folder, exist_ok=True)
+    
+    # Rutas completas
+    local_path_csv = os.path.join(output_folder, filename_csv)
+    local_path_excel = os.path.join(output_folder, filename_excel)
+    
+    # Guardar CSV
+    inicio = time.perf_counter()
+    if not csv_escrito:
+        print("")
+        print("Guardando CSV...")
+        df.to_csv(local_path_csv, index=False, encoding='utf-8-sig')
+    
+    # Desgloses adicionales: un CSV por desglose (nombre_base_<desglose>.csv)
+    desgloses = desgloses or {}
+    paths_desgloses = {}
+    for nombre, df_desglose in desgloses.items():
+        sufijo = re.sub(r'[^0-9a-z]+', '_', nombre.lower()).strip('_')
+        paths_desgloses[nombre] = local_path_csv[:-len('.csv')] + '_{}.csv'.format(sufijo)
+        df_desglose.to_csv(paths_desgloses[nombre], index=False, encoding='utf-8-sig')
+    record_stage('csv', inicio, descripcion)
+    
+    inicio = time.perf_counter()
+    if CONFIG['history_workbook']:
+        # Columna del periodo en el Excel historico (se guarda al final de la ejecucion)
+        celda = update_history_workbook(result_value, modo, mes, anio, fecha_inicio, fecha_fin,
+                                        valores=valores)
+    else:
+        # Crear Excel con Dashboard y resultado en D4
+        print("Generando Excel Dashboard...")
+        hojas = {'Desglose': df}
+        hojas.update(desgloses)
+        create_excel_with_dashboard(local_path_excel, result_value, modo, mes, anio, fecha_inicio, fecha_fin,
+                                    valores=valores, hojas=hojas)
+    record_stage('excel', inicio, descripcion)
+    
+    print("")
+    print("ARCHIVOS GENERADOS:")
+    print("    Carpeta: {}/".format(output_folder))
+    print("")
+    print("    [CSV] Nombre: {}".format(filename_csv))
+    print("          Ruta: {}".format(os.path.abspath(local_path_csv)))
+    print("          Tamaño: {:,} bytes".format(os.path.getsize(local_path_csv)))
+    for nombre, path in paths_desgloses.items():
+        print("    [CSV] {}: {}".format(nombre, os.path.basename(path)))
+    print("")
+    if CONFIG['history_workbook']:
+        print("    [EXCEL HISTORICO] Ruta: {}".format(os.path.abspath(CONFIG['history_workbook'])))
+        print("                      Columna {}: {} = {:,}".format(
+            get_period_header(modo, mes, anio, fecha_inicio, fecha_fin), celda, result_value))
+        return df
+    
+    print("    [EXCEL] Nombre: {}".format(filename_excel))
+    print("            Ruta: {}".format(os.path.abspath(local_path_excel)))
+    print("            Tamaño: {:,} bytes".format(os.path.getsize(local_path_excel)))
+    print("            Hojas: {}".format(", ".join(['Dashboard', 'Desglose'] + list(desgloses))))
+    print("            Resultado en celda: D4 = {:,}".format(result_value))
+    print("            [IMPORTANTE] Excel creado NUEVO con estructura completa")
+    
+    return df
+
+def execute_query_and_save(periodo=None, guardar_historico=True):
+    """
+    Funcion principal: ejecuta query y guarda resultados (periodo None = leer config_fechas.txt).
+    guardar_historico=False deja el Excel historico en memoria (el lote lo guarda al final).
+    """
+    
+    if periodo is None:
+        # Leer configuracion de fechas
+        print("Leyendo configuracion de fechas...")
+        
+        inicio = time.perf_counter()
+        periodo = read_date_config(CONFIG['config_file'])
+        record_stage('config', inicio)
+    
+    if periodo[0] is None:
+        print("[ERROR] No se pudo leer la configuracion de fechas")
+        return None
+    
+    modo, fecha_inicio, fecha_fin, mes, anio, descripcion = periodo
     
     print("[OK] Configuracion leida:")
     print("    Periodo: {}".format(descripcion))
@@ -385,7 +3354,7 @@ def execute_query_and_save():
     print("    Fecha fin: {}".format(fecha_fin))
     
     # Construir query
-    query = build_query(fecha_inicio, fecha_fin)
+    query = build_query(fecha_inicio, fecha_fin, aproximado=CONFIG['approximate'])
     
     print("")
     print("Configuracion AWS:")
@@ -398,159 +3367,898 @@ def execute_query_and_save():
     print("    {}".format(query))
     
     try:
-        # Crear sesion boto3
-        session = boto3.Session(region_name=CONFIG['region'])
+        sesion = {}
+        csv_escrito = None
         
-        print("")
-        print("Ejecutando consulta...")
+        def get_session():
+            """Verifica credenciales y crea la sesion boto3 una sola vez"""
+            if 'session' not in sesion:
+                print("")
+                print("Verificando credenciales AWS...")
+                if not check_aws_credentials():
+                    sesion['session'] = None
+                else:
+                    sesion['session'] = get_aws_session()
+            return sesion['session']
         
-        # Intentar con el workgroup especificado
-        try:
-            df = wr.athena.read_sql_query(
-                sql=query,
-                database=CONFIG['database'],
-                workgroup=CONFIG['workgroup'],
-                boto3_session=session,
-                ctas_approach=False,
-                unload_approach=False
-            )
-        except Exception as e:
-            if 'workgroup' in str(e).lower() or 'GetWorkGroup' in str(e):
+        valores = None
+        inicio = time.perf_counter()
+        if CONFIG['full_dashboard']:
+            # Todas las filas del Dashboard en un solo paso (D4 incluida)
+            valores, dfs = run_dashboard_indicators(periodo, get_session)
+            if valores is None:
+                return None
+            df = dfs['sesiones_abiertas_pushes']
+        elif CONFIG['use_daily_store']:
+            # Armar el rango desde los agregados diarios
+            df = fetch_from_daily_store(fecha_inicio, fecha_fin, get_session,
+                                        aproximado=CONFIG['approximate'])
+            if df is None:
+                return None
+        else:
+            # Buscar primero en la cache local (no requiere credenciales)
+            df = cache_get(query, fecha_inicio, fecha_fin)
+            
+            if df is not None:
                 print("")
-                print("[ADVERTENCIA] Error con workgroup '{}'".format(CONFIG['workgroup']))
-                print("    Intentando sin especificar workgroup...")
-                
-                df = wr.athena.read_sql_query(
-                    sql=query,
-                    database=CONFIG['database'],
-                    boto3_session=session,
-                    ctas_approach=False,
-                    unload_approach=False
-                )
+                print("[OK] Resultado obtenido de la cache local ({})".format(CONFIG['cache_folder']))
+                print("    No se ejecuto la consulta en Athena")
             else:
-                raise e
+                session = get_session()
+                if session is None:
+                    return None
+                
+                print("")
+                print("Ejecutando consulta...")
+                
+                if CONFIG['stream_results']:
+                    # El CSV se escribe pagina a pagina; solo queda en memoria el agregado
+                    filename_csv, _ = generate_filename(modo, mes, anio, fecha_inicio, fecha_fin)
+                    csv_escrito = os.path.join(CONFIG['output_folder'], filename_csv)
+                    df = run_athena_query_streaming(query, session, csv_escrito)
+                else:
+                    df = run_athena_query(query, session)
+                cache_put(query, fecha_inicio, fecha_fin, df)
+        
+        record_stage('consulta', inicio, descripcion)
         
         print("")
         print("[OK] Consulta ejecutada exitosamente!")
         
-        # Procesar resultados (puede haber múltiples filas por el GROUP BY)
-        if len(df) > 0 and 'starting_cause' in df.columns and 'Cant_sesiones' in df.columns:
-            # Buscar el valor correspondiente a 'WhatsAppTemplate' (sesiones abiertas por pushes)
-            whatsapp_row = df[df['starting_cause'] == 'WhatsAppTemplate']
-            
-            if len(whatsapp_row) > 0:
-                result_value = int(whatsapp_row['Cant_sesiones'].iloc[0])
+        desgloses = None
+        if CONFIG['time_breakdown']:
+            inicio = time.perf_counter()
+            pivots = fetch_time_breakdown(fecha_inicio, fecha_fin, get_session)
+            if pivots is None:
+                return None
+            desgloses = {'Por dia': pivots[0], 'Por hora': pivots[1]}
+            record_stage('desglose', inicio, descripcion)
+        
+        if CONFIG['campaign_breakdown']:
+            inicio = time.perf_counter()
+            campanas = fetch_campaign_breakdown(fecha_inicio, fecha_fin, get_session)
+            if campanas is None:
+                return None
+            desgloses = desgloses or {}
+            if CONFIG['campaign_top_n']:
+                desgloses['Top templates'] = campanas.head(CONFIG['campaign_top_n'])
             else:
-                print("[ADVERTENCIA] No se encontró 'WhatsAppTemplate' en starting_cause")
-                print("    Valores encontrados: {}".format(df['starting_cause'].tolist()))
-                # Si no hay 'WhatsAppTemplate', usar 0
-                result_value = 0
-        else:
-            print("[ERROR] No se pudo obtener el resultado de la query")
-            print("    Columnas: {}".format(df.columns.tolist() if len(df) > 0 else 'Sin datos'))
+                desgloses['Templates'] = campanas
+            record_stage('campanas', inicio, descripcion)
+        
+        df = process_and_save_results(df, periodo, csv_escrito=bool(csv_escrito), valores=valores,
+                                      desgloses=desgloses)
+        if df is None:
             return None
+        if guardar_historico:
+            save_history_workbook()
         
-        # Mostrar resultados detallados
         print("")
         print("=" * 60)
-        print("RESULTADOS - {}".format(descripcion.upper()))
+        print("PROCESO COMPLETADO EXITOSAMENTE")
         print("=" * 60)
-        print("\nDesglose por starting_cause:")
-        for idx, row in df.iterrows():
-            print("  {}: {:,}".format(row['starting_cause'], row['Cant_sesiones']))
         
-        print("\n" + "=" * 60)
-        print("SESIONES ABIERTAS POR PUSHES (WhatsAppTemplate): {:,}".format(result_value))
-        print("=" * 60)
+        return df
         
-        # Generar nombres de archivo
-        filename_csv, filename_excel = generate_filename(modo, mes, anio, fecha_inicio, fecha_fin)
-        output_folder = CONFIG['output_folder']
+    except Exception as e:
+        print_error_diagnostics(e)
+        return None
+
+def execute_batch(periodos):
+    """
+    Modo lote (ver resolve_batch). Con history_workbook, el Excel historico se escribe
+    una sola vez al terminar todos los periodos.
+    """
+    try:
+        return resolve_batch(periodos)
+    finally:
+        save_history_workbook()
+
+def resolve_batch(periodos):
+    """
+    Modo lote: resuelve varios periodos en una sola ejecucion.
+    Los periodos en cache se resuelven sin Athena; el resto se envia en paralelo
+    (hasta max_concurrent_queries a la vez), se consultan juntos con
+    BatchGetQueryExecution y cada CSV/Excel se escribe apenas llega su resultado.
+    Retorna dict descripcion -> DataFrame (o None si el periodo fallo).
+    """
+    resultados = {}
+    pendientes = []
+    periodos = dedupe_periods(periodos)
+    
+    print("[INFO] Modo LOTE: {} periodos".format(len(periodos)))
+    for periodo in periodos:
+        print("    - {} ({} a {})".format(periodo[5], periodo[1], periodo[2]))
+    
+    if (CONFIG['full_dashboard'] or CONFIG['use_daily_store'] or CONFIG['time_breakdown']
+            or CONFIG['campaign_breakdown']):
+        # Con el store diario (o la atribucion por template) cada periodo solo consulta sus
+        # dias faltantes; con el Dashboard completo o el desglose horario cada periodo lleva
+        # sus propias queries (run_dashboard_indicators, fetch_time_breakdown)
+        for periodo in periodos:
+            print("")
+            resultados[periodo[5]] = execute_query_and_save(periodo, guardar_historico=False)
+        return resultados
+    
+    # Resolver primero lo que ya esta en cache
+    for periodo in periodos:
+        query = build_query(periodo[1], periodo[2], aproximado=CONFIG['approximate'])
+        df = cache_get(query, periodo[1], periodo[2])
+        if df is not None:
+            print("")
+            print("[OK] {}: resultado obtenido de la cache local".format(periodo[5]))
+            resultados[periodo[5]] = process_and_save_results(df, periodo)
+        else:
+            pendientes.append((periodo, query))
+    
+    if not pendientes:
+        return resultados
+    
+    print("")
+    print("Verificando credenciales AWS...")
+    if not check_aws_credentials():
+        for periodo, _ in pendientes:
+            resultados[periodo[5]] = None
+        return resultados
+    
+    session = get_aws_session()
+    
+    if CONFIG['batch_single_scan'] and len(pendientes) > 1:
+        resultados.update(execute_single_scan(pendientes, session))
+        return resultados
+    
+    engine = create_athena_engine(session)
+    resultados.update(run_async(execute_concurrent_async(pendientes, engine), engine))
+    return resultados
+
+async def execute_concurrent_async(pendientes, engine):
+    """
+    Ejecuta una query por periodo (hasta max_concurrent_queries a la vez) y escribe
+    CSV/Excel de cada periodo en un thread apenas llega su resultado, sin frenar el
+    polling de las demas.
+    """
+    loop = asyncio.get_running_loop()
+    semaforo = asyncio.Semaphore(CONFIG['max_concurrent_queries'])
+    inicio_lote = time.time()
+    
+    print("")
+    print("Ejecutando {} consultas (maximo {} en paralelo)...".format(
+        len(pendientes), CONFIG['max_concurrent_queries']))
+    
+    async def procesar(periodo, query):
+        try:
+            async with semaforo:
+                warn_if_credentials_expiring()
+                print("    [INFO] {}: query enviada".format(periodo[5]))
+                ejecucion = await engine.execute_query(query)
+                df = await engine.fetch_results(ejecucion['QueryExecutionId'])
+            print("")
+            print("[OK] {}: consulta terminada ({:.0f} s desde el inicio del lote)".format(
+                periodo[5], time.time() - inicio_lote))
+            cache_put(query, periodo[1], periodo[2], df)
+            return periodo[5], await loop.run_in_executor(None, process_and_save_results, df, periodo)
+        except AthenaQueryError as e:
+            print("")
+            print("[ERROR] {}: la consulta termino en estado {}".format(periodo[5], e.estado))
+            print("    Motivo: {}".format(e.motivo))
+        except asyncio.TimeoutError:
+            print("[ERROR] {}: timeout, query detenida".format(periodo[5]))
+        except Exception as e:
+            print_error_diagnostics(e)
+        return periodo[5], None
+    
+    terminados = await asyncio.gather(*[procesar(periodo, query) for periodo, query in pendientes])
+    return dict(terminados)
+
+def execute_single_scan(pendientes, session):
+    """
+    Resuelve varios periodos (lista de (periodo, query)) con una unica query agrupada
+    por bucket de tiempo y escribe los archivos de cada periodo.
+    """
+    resultados = {}
+    periodos = [periodo for periodo, _ in pendientes]
+    dias = plan_single_scan(periodos)
+    query = build_single_scan_query(periodos, aproximado=CONFIG['approximate'])
+    
+    print("")
+    print("[INFO] Planificador: {} periodos en una sola query ({} dias)".format(len(periodos), len(dias)))
+    print("")
+    print("Query a ejecutar:")
+    print("    {}".format(query))
+    print("")
+    print("Ejecutando consulta...")
+    
+    try:
+        df = cache_get(query, dias[0], dias[-1])
+        if df is None:
+            df = run_athena_query(query, session, expected_rows=EXPECTED_STARTING_CAUSES)
+            cache_put(query, dias[0], dias[-1], df)
+    except Exception as e:
+        print_error_diagnostics(e)
+        return {periodo[5]: None for periodo in periodos}
+    
+    print("")
+    print("[OK] Consulta ejecutada exitosamente! ({:,} filas)".format(len(df)))
+    
+    for i, (periodo, query_periodo) in enumerate(pendientes):
+        df_periodo = slice_single_scan_results(df, i)
+        cache_put(query_periodo, periodo[1], periodo[2], df_periodo)
+        resultados[periodo[5]] = process_and_save_results(df_periodo, periodo)
+    
+    return resultados
+
+def run_dashboard_indicators(periodo, get_session):
+    """
+    Calcula todos los indicadores registrados del Dashboard para el periodo.
+    Las queries de los distintos grupos corren en paralelo con el motor asyncio, por lo
+    que el tiempo total es cercano al del indicador mas lento.
+    Retorna (valores: key -> valor, dfs: key -> DataFrame de su grupo) o (None, None).
+    """
+    planes = plan_indicator_queries(periodo[1], periodo[2], aproximado=CONFIG['approximate'])
+    
+    print("")
+    print("[INFO] Dashboard completo: {} indicadores en {} queries".format(
+        sum(len(plan['indicadores']) for plan in planes), len(planes)))
+    sin_consulta = [indicador['fila'] for indicador in DASHBOARD_INDICATORS if indicador['consulta'] is None]
+    if sin_consulta:
+        print("    Filas sin consulta registrada (quedan vacias): {}".format(
+            ", ".join(str(fila) for fila in sorted(sin_consulta))))
+    
+    resultados = {}
+    faltantes = []
+    for i, plan in enumerate(planes):
+        df = cache_get(plan['query'], periodo[1], periodo[2])
+        if df is not None:
+            resultados[i] = df
+        else:
+            faltantes.append(i)
+    
+    if faltantes:
+        session = get_session()
+        if session is None:
+            return None, None
+        engine = create_athena_engine(session)
+        semaforo = asyncio.Semaphore(CONFIG['max_concurrent_queries'])
         
-        # Crear carpeta si no existe
-        os.makedirs(output_folder, exist_ok=True)
+        async def ejecutar(i):
+            async with semaforo:
+                df, _ = await engine.run_query(planes[i]['query'])
+            return i, df
         
-        # Rutas completas
-        local_path_csv = os.path.join(output_folder, filename_csv)
-        local_path_excel = os.path.join(output_folder, filename_excel)
+        async def ejecutar_todas():
+            return await asyncio.gather(*[ejecutar(i) for i in faltantes])
         
-        # Guardar CSV
+        print("Ejecutando {} consultas de indicadores en paralelo...".format(len(faltantes)))
+        for i, df in run_async(ejecutar_todas(), engine):
+            cache_put(planes[i]['query'], periodo[1], periodo[2], df)
+            resultados[i] = df
+    
+    valores = {}
+    dfs = {}
+    for i, plan in enumerate(planes):
+        for indicador in plan['indicadores']:
+            valores[indicador['key']] = indicador['consulta']['extractor'](resultados[i])
+            dfs[indicador['key']] = resultados[i]
+            print("    [OK] Fila {} - {}: {}".format(
+                indicador['fila'], indicador['indicador'], valores[indicador['key']]))
+    return valores, dfs
+
+# ==================== MODO DAEMON (CALENDARIOS) ====================
+# El proceso queda residente y cada scheduler_check_seconds revisa los calendarios:
+#   - diario:    el dia anterior
+#   - quincenal: 1 al 15 y 16 a fin de mes
+#   - mensual:   mes completo (cierre)
+# Un periodo vence scheduler_delay_days despues de su ultimo dia. Se revisan los ultimos
+# scheduler_catchup periodos cerrados de cada calendario, por lo que los que se perdieron
+# (proceso detenido, credenciales vencidas, error) se recuperan en la revision siguiente.
+# Un periodo queda completado recien cuando todos sus dias estan cerrados (fuera de
+# late_arrival_days, ver is_range_closed). Mientras tanto el reporte generado es
+# provisorio y se vuelve a generar cada cache_ttl_minutes, para que el cierre incluya
+# los datos que llegan tarde. Ambos estados se guardan en scheduler_state_file.
+#
+# Deduplicacion: un periodo que aparece en varios calendarios se ejecuta una vez, y el
+# daemon usa el store diario, asi el cierre del mes solo consulta los dias que la
+# quincena (o el diario) no materializo. La sesion boto3, los clientes y el motor de
+# reintentos quedan vivos entre revisiones.
+
+SCHEDULER_CALENDARS = ['diario', 'quincenal', 'mensual']
+
+def build_period(fecha_inicio, fecha_fin):
+    """Tupla de periodo para un rango (mes completo si cubre un mes calendario exacto)"""
+    inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d')
+    fin = datetime.strptime(fecha_fin, '%Y-%m-%d')
+    if is_full_month_period(fecha_inicio, fecha_fin):
+        return ('mes', fecha_inicio, fecha_fin, inicio.month, inicio.year,
+                "{} {}".format(get_month_name(inicio.month), inicio.year))
+    descripcion = "{} al {}".format(inicio.strftime('%d/%m/%Y'), fin.strftime('%d/%m/%Y'))
+    return ('rango', fecha_inicio, fecha_fin, None, None, descripcion)
+
+def list_calendar_periods(calendario, hoy, cantidad):
+    """Ultimos `cantidad` periodos del calendario ya vencidos a la fecha `hoy`, en orden cronologico"""
+    limite = hoy - timedelta(days=CONFIG['scheduler_delay_days'] + 1)
+    rangos = []
+    if calendario == 'diario':
+        for atras in range(cantidad):
+            dia = (limite - timedelta(days=atras)).strftime('%Y-%m-%d')
+            rangos.append((dia, dia))
+    else:
+        anio, mes = limite.year, limite.month
+        while len(rangos) < cantidad:
+            ultimo = monthrange(anio, mes)[1]
+            if calendario == 'quincenal':
+                mitades = [(1, 15), (16, ultimo)]
+            else:
+                mitades = [(1, ultimo)]
+            for primero, fin in reversed(mitades):
+                if datetime(anio, mes, fin).date() <= limite and len(rangos) < cantidad:
+                    rangos.append(("{:04d}-{:02d}-{:02d}".format(anio, mes, primero),
+                                   "{:04d}-{:02d}-{:02d}".format(anio, mes, fin)))
+            anio, mes = (anio, mes - 1) if mes > 1 else (anio - 1, 12)
+    return [build_period(inicio, fin) for inicio, fin in reversed(rangos)]
+
+def load_scheduler_state():
+    """
+    Lee el estado del daemon: (completados, provisorios), dicts clave -> fecha de ejecucion.
+    Los provisorios se generaron con dias todavia abiertos y se vuelven a generar.
+    """
+    path = CONFIG['scheduler_state_file']
+    if not os.path.exists(path):
+        return {}, {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            estado = json.load(f)
+        return estado.get('completados', {}), estado.get('provisorios', {})
+    except (ValueError, OSError) as e:
+        print("    [ADVERTENCIA] Estado del daemon ilegible, se ignora: {}".format(str(e)))
+        return {}, {}
+
+def save_scheduler_state(completados, provisorios):
+    """Escribe el estado del daemon de forma atomica"""
+    write_json_atomically(CONFIG['scheduler_state_file'], {'completados': completados, 'provisorios': provisorios},
+                          indent=2, sort_keys=True)
+
+def plan_scheduled_periods(calendarios, completados, hoy, provisorios=None, ahora=None):
+    """
+    Periodos vencidos y no completados de los calendarios, sin repetir rangos. Los provisorios
+    se vuelven a incluir cuando pasaron cache_ttl_minutes desde su ultima generacion.
+    Retorna (lista de (periodo, claves de estado), claves vigentes de la ventana de recuperacion).
+    Orden: por fecha de fin y, a igual fin, el periodo mas corto primero.
+    """
+    provisorios = provisorios or {}
+    if ahora is None:
+        ahora = datetime.now()
+    por_rango = {}
+    vigentes = set()
+    for calendario in calendarios:
+        cantidad = CONFIG['scheduler_catchup'].get(calendario, 1)
+        for periodo in list_calendar_periods(calendario, hoy, cantidad):
+            clave = "{}|{}|{}".format(calendario, periodo[1], periodo[2])
+            vigentes.add(clave)
+            if clave in completados:
+                continue
+            if clave in provisorios and not is_scheduler_rerun_due(provisorios[clave], ahora):
+                continue
+            por_rango.setdefault((periodo[1], periodo[2]), (periodo, []))[1].append(clave)
+    pendientes = sorted(por_rango.values(), key=lambda item: item[0][1], reverse=True)
+    pendientes.sort(key=lambda item: item[0][2])
+    return pendientes, vigentes
+
+def is_scheduler_rerun_due(generado, ahora):
+    """True si un reporte provisorio generado en `generado` ya debe volver a generarse"""
+    anterior = datetime.strptime(generado, '%Y-%m-%d %H:%M:%S')
+    return ahora - anterior >= timedelta(minutes=CONFIG['cache_ttl_minutes'])
+
+def run_scheduler_cycle(calendarios, hoy=None, ahora=None):
+    """Una revision del calendario: ejecuta los periodos pendientes. Retorna True si no quedaron fallas"""
+    if ahora is None:
+        ahora = datetime.now() if hoy is None else datetime.combine(hoy, datetime.now().time())
+    if hoy is None:
+        hoy = ahora.date()
+    completados, provisorios = load_scheduler_state()
+    pendientes, vigentes = plan_scheduled_periods(calendarios, completados, hoy, provisorios, ahora)
+    
+    # Solo se conservan las claves de la ventana de recuperacion
+    completados = {clave: valor for clave, valor in completados.items() if clave in vigentes}
+    provisorios = {clave: valor for clave, valor in provisorios.items() if clave in vigentes}
+    
+    print("")
+    print("[INFO] Revision del calendario {} ({}): {} periodos pendientes".format(
+        ahora.strftime('%Y-%m-%d %H:%M'), ", ".join(calendarios), len(pendientes)))
+    if not pendientes:
+        save_scheduler_state(completados, provisorios)
+        return True
+    
+    reset_expired_aws_session()
+    reset_metrics()
+    print("")
+    
+    resultados = execute_batch([periodo for periodo, _ in pendientes])
+    generado = ahora.strftime('%Y-%m-%d %H:%M:%S')
+    for periodo, claves in pendientes:
+        if resultados.get(periodo[5]) is None:
+            continue
+        # Con dias dentro de la ventana de llegada tardia el reporte todavia puede cambiar
+        cerrado = is_range_closed(periodo[2], ahora)
+        for clave in claves:
+            if cerrado:
+                completados[clave] = generado
+                provisorios.pop(clave, None)
+            else:
+                provisorios[clave] = generado
+        if not cerrado:
+            print("[INFO] {}: reporte provisorio (dias abiertos), se regenera hasta el cierre".format(periodo[5]))
+    save_scheduler_state(completados, provisorios)
+    
+    exito = all(resultados.get(periodo[5]) is not None for periodo, _ in pendientes)
+    emit_metrics(exito)
+    if not exito:
+        print("[ADVERTENCIA] Hubo periodos con error: se reintentan en la proxima revision")
+    return exito
+
+def run_scheduler(calendarios, una_vez=False):
+    """
+    Modo daemon: revisa los calendarios cada scheduler_check_seconds hasta Ctrl+C.
+    una_vez=True hace una sola revision (para cron o un timer de systemd).
+    """
+    # El cierre del mes reutiliza los dias ya materializados por la quincena o el diario
+    CONFIG['use_daily_store'] = True
+    
+    print("[INFO] Modo daemon: calendarios {} (revision cada {} s)".format(
+        ", ".join(calendarios), CONFIG['scheduler_check_seconds']))
+    print("    Estado: {}".format(CONFIG['scheduler_state_file']))
+    
+    try:
+        while True:
+            try:
+                exito = run_scheduler_cycle(calendarios)
+            except Exception as e:
+                print_error_diagnostics(e)
+                exito = False
+            if una_vez:
+                return exito
+            time.sleep(CONFIG['scheduler_check_seconds'])
+    except KeyboardInterrupt:
         print("")
-        print("Guardando CSV...")
-        df.to_csv(local_path_csv, index=False, encoding='utf-8-sig')
-        
-        # Crear Excel con Dashboard y resultado en D4
-        print("Generando Excel Dashboard...")
-        create_excel_with_dashboard(local_path_excel, result_value, modo, mes, anio, fecha_inicio, fecha_fin)
+        print("[INFO] Modo daemon detenido")
+        return True
+
+# ==================== CONTADOR EN TIEMPO CASI REAL ====================
+# --contador-hoy mantiene el conteo de sesiones de hoy (dia en local_timezone) por
+# starting_cause. Cada rolling_refresh_seconds consulta solo la franja nueva
+# [watermark, ahora - rolling_lag_seconds) y suma su resultado al contador: como cada
+# sesion tiene un unico session_creation_time, las franjas son disjuntas y la suma de
+# los distinct de cada franja es el distinct del dia. El estado (watermark + conteos)
+# se guarda en rolling_state_file, asi un reinicio continua desde la ultima franja.
+# El valor actual se sirve como JSON en http://rolling_host:rolling_port/contador.
+
+_ROLLING_STATE = {'lock': threading.Lock()}
+
+def get_local_day_start(ahora_local):
+    """Inicio del dia local expresado en la zona de la tabla (datetime naive)"""
+    from zoneinfo import ZoneInfo
+    
+    inicio = ahora_local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return inicio.astimezone(ZoneInfo(CONFIG['source_timezone'])).replace(tzinfo=None)
+
+def build_slice_query(desde, hasta, layout=None, aproximado=False):
+    """Query por starting_cause de las sesiones creadas en [desde, hasta) (zona de la tabla)"""
+    if layout is None:
+        layout = get_table_layout('boti_session_metrics_2')
+    
+    return """SELECT starting_cause, {conteo} as Cant_sesiones 
+FROM "{database}"."{table}"
+WHERE {where}
+group by starting_cause""".format(
+        conteo=build_count_expression(aproximado),
+        database=layout['database'],
+        table=layout['table'],
+        where=build_range_where_clause(desde, hasta, layout)
+    )
+
+def load_rolling_state(dia, inicio_dia):
+    """Estado del contador para el dia local; si el guardado es de otro dia arranca de cero"""
+    path = CONFIG['rolling_state_file']
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                estado = json.load(f)
+            if estado.get('dia') == dia and estado.get('aproximado') == bool(CONFIG['approximate']):
+                return estado
+        except (ValueError, OSError) as e:
+            print("    [ADVERTENCIA] Estado del contador ilegible, se reinicia: {}".format(str(e)))
+    return {
+        'dia': dia,
+        'watermark': inicio_dia.strftime('%Y-%m-%d %H:%M:%S'),
+        'conteos': {},
+        'refrescos': 0,
+        'actualizado': None,
+        'aproximado': bool(CONFIG['approximate'])
+    }
+
+def save_rolling_state(estado):
+    """Escribe el estado del contador de forma atomica"""
+    write_json_atomically(CONFIG['rolling_state_file'], estado, indent=2, sort_keys=True)
+
+def merge_slice_counts(conteos, df):
+    """Suma el resultado de una franja (starting_cause, Cant_sesiones) a los conteos"""
+    conteos = dict(conteos)
+    for causa, cantidad in zip(df['starting_cause'], df['Cant_sesiones']):
+        causa = str(causa)
+        conteos[causa] = conteos.get(causa, 0) + int(cantidad)
+    return conteos
+
+def refresh_rolling_counter(session, ahora_local=None):
+    """
+    Consulta la franja nueva desde el watermark y actualiza el contador.
+    ahora_local: datetime con zona local_timezone (por defecto, ahora). Retorna el estado.
+    """
+    from zoneinfo import ZoneInfo
+    
+    if ahora_local is None:
+        ahora_local = datetime.now(ZoneInfo(CONFIG['local_timezone']))
+    dia = ahora_local.strftime('%Y-%m-%d')
+    inicio_dia = get_local_day_start(ahora_local)
+    
+    with _ROLLING_STATE['lock']:
+        estado = _ROLLING_STATE.get('estado')
+    if estado is None or estado['dia'] != dia:
+        estado = load_rolling_state(dia, inicio_dia)
+    
+    desde = datetime.strptime(estado['watermark'], '%Y-%m-%d %H:%M:%S')
+    hasta = (ahora_local.astimezone(ZoneInfo(CONFIG['source_timezone'])).replace(tzinfo=None, microsecond=0)
+             - timedelta(seconds=CONFIG['rolling_lag_seconds']))
+    
+    if hasta > desde:
+        query = build_slice_query(desde, hasta, aproximado=CONFIG['approximate'])
+        inicio = time.perf_counter()
+        df = run_athena_query(query, session)
+        record_stage('franja', inicio, dia)
         
-        print("")
-        print("ARCHIVOS GENERADOS:")
-        print("    Carpeta: {}/".format(output_folder))
-        print("")
-        print("    [CSV] Nombre: {}".format(filename_csv))
-        print("          Ruta: {}".format(os.path.abspath(local_path_csv)))
-        print("          Tamaño: {:,} bytes".format(os.path.getsize(local_path_csv)))
-        print("")
-        print("    [EXCEL] Nombre: {}".format(filename_excel))
-        print("            Ruta: {}".format(os.path.abspath(local_path_excel)))
-        print("            Tamaño: {:,} bytes".format(os.path.getsize(local_path_excel)))
-        print("            Hoja: Dashboard")
-        print("            Resultado en celda: D4 = {:,}".format(result_value))
-        print("            [IMPORTANTE] Excel creado NUEVO con estructura completa")
+        estado = dict(estado,
+                      conteos=merge_slice_counts(estado['conteos'], df),
+                      watermark=hasta.strftime('%Y-%m-%d %H:%M:%S'),
+                      refrescos=estado['refrescos'] + 1,
+                      actualizado=ahora_local.strftime('%Y-%m-%d %H:%M:%S'))
+        save_rolling_state(estado)
+        print("[OK] {} Franja {} a {}: WhatsAppTemplate = {:,}".format(
+            ahora_local.strftime('%H:%M:%S'), desde.strftime('%H:%M:%S'), hasta.strftime('%H:%M:%S'),
+            estado['conteos'].get('WhatsAppTemplate', 0)))
+    
+    with _ROLLING_STATE['lock']:
+        _ROLLING_STATE['estado'] = estado
+    return estado
+
+def get_rolling_snapshot():
+    """Valor actual del contador para el endpoint JSON"""
+    with _ROLLING_STATE['lock']:
+        estado = _ROLLING_STATE.get('estado')
+    if estado is None:
+        return {'dia': None, 'sesiones_abiertas_pushes': None, 'starting_cause': {}}
+    return {
+        'dia': estado['dia'],
+        'zona_horaria': CONFIG['local_timezone'],
+        'sesiones_abiertas_pushes': estado['conteos'].get('WhatsAppTemplate', 0),
+        'starting_cause': estado['conteos'],
+        'watermark': estado['watermark'],
+        'zona_watermark': CONFIG['source_timezone'],
+        'actualizado': estado['actualizado'],
+        'refrescos': estado['refrescos'],
+        'aproximado': estado['aproximado']
+    }
+
+def start_rolling_server(host, port):
+    """Levanta el endpoint HTTP (GET / o /contador) en un thread. Retorna el servidor"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class ContadorHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/contador'):
+                self.send_error(404)
+                return
+            cuerpo = json.dumps(get_rolling_snapshot(), ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
         
+        def log_message(self, formato, *args):
+            pass
+    
+    servidor = ThreadingHTTPServer((host, port), ContadorHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+def run_rolling_counter():
+    """Modo --contador-hoy: refresca el contador cada rolling_refresh_seconds hasta Ctrl+C"""
+    print("[INFO] Contador de hoy ({}): franja nueva cada {} s, margen de carga {} s".format(
+        CONFIG['local_timezone'], CONFIG['rolling_refresh_seconds'], CONFIG['rolling_lag_seconds']))
+    
+    print("")
+    print("Verificando credenciales AWS...")
+    if not check_aws_credentials():
+        return False
+    
+    servidor = start_rolling_server(CONFIG['rolling_host'], CONFIG['rolling_port'])
+    print("[OK] Endpoint JSON: http://{}:{}/contador".format(CONFIG['rolling_host'], CONFIG['rolling_port']))
+    print("")
+    
+    try:
+        while True:
+            try:
+                if reset_expired_aws_session() and not check_aws_credentials():
+                    raise RuntimeError("Credenciales AWS invalidas")
+                refresh_rolling_counter(get_aws_session())
+            except Exception as e:
+                # Se sigue sirviendo el ultimo valor; la franja se reintenta en el proximo refresco
+                print_error_diagnostics(e)
+            time.sleep(CONFIG['rolling_refresh_seconds'])
+    except KeyboardInterrupt:
         print("")
-        print("=" * 60)
-        print("PROCESO COMPLETADO EXITOSAMENTE")
-        print("=" * 60)
-        
-        return df
-        
-    except Exception as e:
+        print("[INFO] Contador detenido")
+    finally:
+        servidor.shutdown()
+    return True
+
+# ==================== DRY RUN ====================
+# --dry-run lee la configuracion y muestra las queries que se ejecutarian y si cada
+# una ya esta en la cache local, sin credenciales, sin Athena y sin escribir archivos.
+# Solo usa el indice JSON de la cache y el manifest del store diario: no importa
+# boto3, awswrangler, pandas ni openpyxl.
+
+def is_cached(query, fecha_inicio, fecha_fin, index):
+    """True si la query tiene una entrada fresca en el indice de la cache"""
+    if not CONFIG['use_cache']:
+        return False
+    entry = index.get(cache_key(query, fecha_inicio, fecha_fin))
+    return (entry is not None and is_cache_entry_fresh(entry)
+            and os.path.exists(os.path.join(CONFIG['cache_folder'], entry['file'])))
+
+def plan_dry_run(periodos):
+    """
+    Lista de (periodo, etiqueta, query, fecha_inicio, fecha_fin) con las queries que
+    ejecutaria el script para los periodos, en el mismo orden y con el mismo SQL.
+    """
+    aproximado = CONFIG['approximate']
+    pasos = []
+    for periodo in periodos:
+        fecha_inicio, fecha_fin = periodo[1], periodo[2]
+        if CONFIG['detail_export']:
+            descarga = ", via UNLOAD a Parquet" if not is_local_backend() and CONFIG['fetch_strategy'] != 'api' else ""
+            pasos.append((periodo, "Detalle por sesion ({}{})".format(CONFIG['detail_format'], descarga),
+                          build_detail_query(fecha_inicio, fecha_fin), None, None))
+            continue
+        if CONFIG['full_dashboard']:
+            for plan in plan_indicator_queries(fecha_inicio, fecha_fin, aproximado=aproximado):
+                etiqueta = "Indicadores: {}".format(", ".join(
+                    indicador['key'] for indicador in plan['indicadores']))
+                pasos.append((periodo, etiqueta, plan['query'], fecha_inicio, fecha_fin))
+        elif CONFIG['use_daily_store']:
+            manifest = load_daily_manifest('sketch' if aproximado else 'exacto')
+            faltantes = get_missing_days(fecha_inicio, fecha_fin, manifest)
+            if faltantes:
+                query = build_sketch_query(faltantes) if aproximado else build_daily_query(faltantes)
+                pasos.append((periodo, "Store diario ({} dias faltantes)".format(len(faltantes)),
+                              query, None, None))
+            else:
+                pasos.append((periodo, "Store diario (todos los dias materializados)", None, None, None))
+        else:
+            pasos.append((periodo, "Sesiones por starting_cause",
+                          build_query(fecha_inicio, fecha_fin, aproximado=aproximado), fecha_inicio, fecha_fin))
+        if CONFIG['time_breakdown']:
+            pasos.append((periodo, "Desglose por dia y hora ({})".format(CONFIG['local_timezone']),
+                          build_time_breakdown_query(fecha_inicio, fecha_fin, aproximado=aproximado),
+                          fecha_inicio, fecha_fin))
+        if CONFIG['campaign_breakdown']:
+            faltantes = get_missing_days(fecha_inicio, fecha_fin, load_daily_manifest('campana'),
+                                         firma=campaign_fingerprint())
+            if faltantes:
+                pasos.append((periodo, "Atribucion por template ({} dias faltantes)".format(len(faltantes)),
+                              build_campaign_query(faltantes), None, None))
+            else:
+                pasos.append((periodo, "Atribucion por template (todos los dias materializados)",
+                              None, None, None))
+    return pasos
+
+def print_dry_run(periodos):
+    """Muestra el plan de ejecucion de los periodos. Retorna la cantidad de queries a ejecutar"""
+    index = load_cache_index() if CONFIG['use_cache'] else {}
+    pasos = plan_dry_run(periodos)
+    
+    print("[INFO] Dry run: no se verifican credenciales ni se ejecutan queries")
+    print("    Backend: {}".format(CONFIG['query_backend']))
+    if not is_local_backend():
+        print("    Region: {} | Workgroup: {} | Base de datos: {}".format(
+            CONFIG['region'], CONFIG['workgroup'], CONFIG['database']))
+    
+    a_ejecutar = []
+    for periodo, etiqueta, query, fecha_inicio, fecha_fin in pasos:
+        if query is None:
+            estado = "sin query"
+        elif fecha_inicio is not None and is_cached(query, fecha_inicio, fecha_fin, index):
+            estado = "CACHE"
+        else:
+            estado = "EJECUTAR"
+            a_ejecutar.append((periodo, query))
         print("")
-        print("[ERROR] ERROR DURANTE LA EJECUCION")
-        print("    Tipo: {}".format(type(e).__name__))
-        print("    Mensaje: {}".format(str(e)))
-        
-        error_str = str(e).lower()
-        
+        print("[{}] {} ({} a {}) - {}".format(estado, periodo[5], periodo[1], periodo[2], etiqueta))
+        if query is not None:
+            print("    {}".format(query.replace('\n', '\n    ')))
+    
+    # El lote sin store diario ni desglose une los periodos faltantes en una sola query
+    lote_agrupado = (len(periodos) > 1 and CONFIG['batch_single_scan'] and not CONFIG['full_dashboard']
+                     and not CONFIG['detail_export']
+                     and not CONFIG['use_daily_store'] and not CONFIG['time_breakdown']
+                     and not CONFIG['campaign_breakdown'])
+    if lote_agrupado and len(a_ejecutar) > 1:
+        query = build_single_scan_query([periodo for periodo, _ in a_ejecutar], aproximado=CONFIG['approximate'])
         print("")
-        print("DIAGNOSTICO:")
-        if 'table' in error_str and 'not' in error_str:
-            print("    [!] La tabla no existe o no tienes permisos para accederla")
-            print("    Verifica acceso a: boti_session_metrics_2")
-        elif 'workgroup' in error_str:
-            print("    [!] Problema con el workgroup")
-        elif 'permission' in error_str or 'denied' in error_str:
-            print("    [!] Problema de permisos")
-        elif 'openpyxl' in error_str:
-            print("    [!] Falta libreria openpyxl para generar Excel")
-            print("    Ejecuta: pip install openpyxl")
-        elif 'timeout' in error_str or 'timed out' in error_str:
-            print("    [!] La query tomó demasiado tiempo")
-        else:
-            print("    [!] Error inesperado")
-        
-        return None
+        print("[INFO] Planificador: los {} periodos faltantes se resuelven con una sola query:".format(
+            len(a_ejecutar)))
+        print("    {}".format(query.replace('\n', '\n    ')))
+        return 1
+    
+    print("")
+    print("[INFO] Queries a ejecutar: {} de {}".format(
+        len(a_ejecutar), sum(1 for paso in pasos if paso[2] is not None)))
+    return len(a_ejecutar)
 
 # ==================== EJECUCION PRINCIPAL ====================
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sesiones Abiertas por Pushes - Query Athena")
+    parser.add_argument('--periodo', action='append', default=[],
+                        help="Periodo a procesar (repetible): 2025-10 | 2025-10-01:2025-10-15 | 2025-10-15")
+    parser.add_argument('--dashboard-completo', action='store_true',
+                        help="Calcula las filas del Dashboard con consulta registrada (por defecto solo D4; "
+                             "las demas se agregan con register_indicator)")
+    parser.add_argument('--historico', nargs='?', const=os.path.join('output', 'Dashboard_historico.xlsx'),
+                        help="Escribe cada periodo como una columna de un unico Excel (agrega o actualiza)")
+    parser.add_argument('--desglose-horario', action='store_true',
+                        help="Agrega hojas/CSV con sesiones por dia y por hora (hora de Buenos Aires)")
+    parser.add_argument('--campanas', action='store_true',
+                        help="Agrega la atribucion de sesiones por template de push (hoja Top templates + CSV). "
+                             "Requiere template_column en TABLE_LAYOUTS; la tasa de apertura queda desactivada "
+                             "hasta configurar campaign_sends_table")
+    parser.add_argument('--exportar-detalle', nargs='?', const='csv.gz', choices=list(DETAIL_FORMATS),
+                        help="Exporta una fila por sesion (session_id) del periodo: csv.gz | csv.zst | parquet")
+    parser.add_argument('--historial', nargs='?', type=int, const=18, metavar='MESES',
+                        help="Muestra la tendencia mensual desde el archivo historico local (sin Athena)")
+    parser.add_argument('--causa', default='WhatsAppTemplate',
+                        help="starting_cause para --historial (por defecto WhatsAppTemplate)")
+    parser.add_argument('--backend', choices=['athena', 'duckdb'],
+                        help="Motor de queries: athena (por defecto) o duckdb sobre extractos locales")
+    parser.add_argument('--datos-locales', metavar='RUTA',
+                        help="Carpeta, archivo o glob Parquet/CSV de boti_session_metrics_2 para --backend duckdb")
+    parser.add_argument('--metricas-prometheus', metavar='RUTA',
+                        help="Escribe tambien las metricas en un textfile de Prometheus (.prom)")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Queda residente y genera los reportes de los calendarios configurados")
+    parser.add_argument('--calendario', action='append', choices=SCHEDULER_CALENDARS,
+                        help="Calendario del modo daemon (repetible): diario | quincenal | mensual")
+    parser.add_argument('--una-vez', action='store_true',
+                        help="Con --daemon: una sola revision del calendario (para cron)")
+    parser.add_argument('--contador-hoy', action='store_true',
+                        help="Contador en tiempo casi real de las sesiones de hoy con endpoint JSON local")
+    parser.add_argument('--puerto', type=int, help="Puerto del endpoint de --contador-hoy")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Muestra las queries y su estado en cache sin credenciales ni Athena")
+    args = parser.parse_args()
+    if args.metricas_prometheus:
+        CONFIG['metrics_prometheus_file'] = args.metricas_prometheus
+    if args.backend:
+        CONFIG['query_backend'] = args.backend
+    if args.datos_locales:
+        CONFIG['duckdb_source'] = args.datos_locales
+    if args.historial is not None:
+        print_history_trend(args.causa, args.historial)
+        parser.exit()
+    if args.dashboard_completo:
+        CONFIG['full_dashboard'] = True
+    if args.historico:
+        CONFIG['history_workbook'] = args.historico
+    if args.desglose_horario:
+        CONFIG['time_breakdown'] = True
+    if args.campanas:
+        CONFIG['campaign_breakdown'] = True
+    if CONFIG['campaign_breakdown'] and check_campaign_config():
+        parser.exit(2, "[ERROR] {}\n".format(check_campaign_config()))
+    if args.exportar_detalle:
+        CONFIG['detail_export'] = True
+        CONFIG['detail_format'] = args.exportar_detalle
+    
+    if args.contador_hoy:
+        if args.puerto:
+            CONFIG['rolling_port'] = args.puerto
+        parser.exit(0 if run_rolling_counter() else 1)
+    
+    if args.daemon:
+        exito = run_scheduler(args.calendario or CONFIG['scheduler_calendars'], una_vez=args.una_vez)
+        parser.exit(0 if exito else 1)
+    
+    if args.dry_run:
+        if args.periodo:
+            periodos = [parse_period_arg(texto) for texto in args.periodo]
+        else:
+            periodos = read_periods_config(CONFIG['config_file'])
+        if not periodos or any(periodo[0] is None for periodo in periodos):
+            parser.exit(1, "[ERROR] No se pudo leer la configuracion de fechas\n")
+        print_dry_run(dedupe_periods(periodos))
+        parser.exit()
+    
     print("")
     print("=" * 60)
     print("SCRIPT: SESIONES ABIERTAS POR PUSHES - QUERY ATHENA V2")
     print("=" * 60)
     print("Lee configuracion desde: {}".format(CONFIG['config_file']))
     print("Rol requerido: PIBAConsumeBoti")
-    print("Salida: CSV + Excel Dashboard NUEVO (resultado en celda D4)")
+    if CONFIG['history_workbook']:
+        print("Salida: CSV + columna del Excel historico {}".format(CONFIG['history_workbook']))
+    else:
+        print("Salida: CSV + Excel Dashboard NUEVO (resultado en celda D4)")
     print("Query: boti_session_metrics_2 agrupado por starting_cause")
     print("")
     print("MODOS SOPORTADOS:")
     print("  [1] MES COMPLETO: Configura MES y AÑO")
     print("  [2] RANGO PERSONALIZADO: Configura FECHA_INICIO y FECHA_FIN")
+    print("  [3] LOTE: Varias secciones [nombre] en el archivo o --periodo repetido")
     print("=" * 60)
     print("")
     
-    result = execute_query_and_save()
+    # Periodos: linea de comandos o archivo de configuracion
+    if args.periodo:
+        periodos = [parse_period_arg(texto) for texto in args.periodo]
+        if any(periodo[0] is None for periodo in periodos):
+            periodos = None
+    else:
+        print("Leyendo configuracion de fechas...")
+        inicio = time.perf_counter()
+        periodos = read_periods_config(CONFIG['config_file'])
+        record_stage('config', inicio)
+    if periodos:
+        periodos = dedupe_periods(periodos)
+    
+    if not periodos:
+        print("[ERROR] No se pudo leer la configuracion de fechas")
+        result = None
+    elif CONFIG['detail_export']:
+        resultados = export_details(periodos)
+        result = resultados if resultados and all(r is not None for r in resultados.values()) else None
+    elif len(periodos) == 1:
+        result = execute_query_and_save(periodos[0])
+    else:
+        resultados = execute_batch(periodos)
+        
+        print("")
+        print("=" * 60)
+        print("RESUMEN DEL LOTE")
+        print("=" * 60)
+        for periodo in periodos:
+            estado = "[OK]" if resultados.get(periodo[5]) is not None else "[ERROR]"
+            print("    {} {}".format(estado, periodo[5]))
+        result = resultados if all(r is not None for r in resultados.values()) else None
+    
+    emit_metrics(result is not None)
     
     if result is not None:
         print("")
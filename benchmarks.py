@@ -0,0 +1,651 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks y comparaciones locales para Sesiones_Abiertas_porPushes.py
+
+No consultan Athena: trabajan sobre datos sinteticos con la misma forma que
+boti_session_metrics_2 (session_id, session_creation_time, starting_cause).
+
+USO:
+    python benchmarks.py aproximado [--sesiones 2000000] [--desde 2025-10-01] [--hasta 2025-10-31]
+    python benchmarks.py descarga [--filas 100000 500000]
+    python benchmarks.py excel [--filas 10000 100000 1000000]
+    python benchmarks.py pipeline [--escalas 2200000 20000000] [--guardar-baseline]
+    python benchmarks.py fallas [--queries 40]
+    python benchmarks.py detalle [--filas 5000000] [--formatos csv.gz parquet] [--threads 1 4]
+    python benchmarks.py arranque [--limite-dry-run-ms 150] [--limite-cache-ms 1000]
+    python benchmarks.py fixture [--sesiones 5000000] [--desde 2025-09-01] [--hasta 2025-10-31] [--salida datos_locales/boti_session_metrics_2]
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import Sesiones_Abiertas_porPushes as sap
+from tests.stub_athena import FaultyAthenaClient
+
+# Distribucion aproximada de starting_cause observada en produccion
+STARTING_CAUSES = {
+    'WhatsAppTemplate': 0.45,
+    'UserMessage': 0.35,
+    'Web': 0.12,
+    'Facebook': 0.05,
+    'Instagram': 0.03
+}
+
+# ==================== DATOS SINTETICOS ====================
+
+# Templates de push distintos en los datos sinteticos
+N_TEMPLATES = 2000
+
+# Peso relativo de cada hora UTC (Buenos Aires = UTC-3): poca actividad de madrugada,
+# picos a media manana y a la tarde
+HOURLY_PROFILE = np.array([
+    4, 3, 2, 1, 1, 1, 1, 1, 1, 1, 2, 4,       # 00-11 UTC = 21-08 hs
+    6, 8, 9, 9, 8, 7, 8, 9, 9, 8, 7, 5        # 12-23 UTC = 09-20 hs
+], dtype='float64')
+
+def generate_synthetic_sessions(n_sesiones, fecha_inicio, fecha_fin, seed=42):
+    """
+    Genera sesiones sinteticas con la forma de boti_session_metrics_2.
+    Cada sesion tiene un unico session_creation_time dentro del rango, con la
+    distribucion horaria de HOURLY_PROFILE.
+    """
+    rng = np.random.default_rng(seed)
+    inicio = np.datetime64(fecha_inicio)
+    dias = len(list(sap.iter_days(fecha_inicio, fecha_fin)))
+
+    horas = rng.choice(24, size=n_sesiones, p=HOURLY_PROFILE / HOURLY_PROFILE.sum())
+    segundos = (rng.integers(0, dias, size=n_sesiones) * 86400 + horas * 3600
+                + rng.integers(0, 3600, size=n_sesiones))
+    causas = list(STARTING_CAUSES.keys())
+    probabilidades = np.array(list(STARTING_CAUSES.values()))
+
+    sesiones = pd.DataFrame({
+        'session_id': pd.Series(rng.integers(0, 2 ** 62, size=n_sesiones)).map('{:016x}'.format),
+        'session_creation_time': inicio + segundos.astype('timedelta64[s]'),
+        'starting_cause': rng.choice(causas, size=n_sesiones, p=probabilidades / probabilidades.sum())
+    })
+    # Template de la push (solo WhatsAppTemplate): pocos templates concentran la mayoria.
+    # Para --campanas sobre el extracto: template_column = 'template' en TABLE_LAYOUTS
+    pesos = 1.0 / np.arange(1, N_TEMPLATES + 1)
+    templates = pd.Series(rng.choice(N_TEMPLATES, size=n_sesiones, p=pesos / pesos.sum())).map('template_{:04d}'.format)
+    sesiones['template'] = templates.where(sesiones['starting_cause'] == 'WhatsAppTemplate')
+    return sesiones
+
+def write_session_fixture(n_sesiones, fecha_inicio, fecha_fin, carpeta, filas_por_archivo=1000000):
+    """
+    Escribe un extracto sintetico de boti_session_metrics_2 en Parquet (varios archivos de
+    filas_por_archivo filas) para usar con el backend DuckDB. La memoria usada no depende
+    del total de sesiones.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    escritas = 0
+    parte = 0
+    while escritas < n_sesiones:
+        filas = min(filas_por_archivo, n_sesiones - escritas)
+        sesiones = generate_synthetic_sessions(filas, fecha_inicio, fecha_fin, seed=42 + parte)
+        sesiones.to_parquet(os.path.join(carpeta, 'part-{:05d}.parquet'.format(parte)), index=False)
+        escritas += filas
+        parte += 1
+    print("[OK] Extracto sintetico: {:,} sesiones ({} a {}) en {} archivos -> {}".format(
+        n_sesiones, fecha_inicio, fecha_fin, parte, carpeta))
+
+# ==================== SKETCHES LOCALES ====================
+
+def build_local_sketches(sesiones):
+    """
+    Calcula localmente los registros HLL por (fecha, starting_cause, registro),
+    con la misma logica que build_sketch_query ejecuta en Athena.
+    """
+    hv = pd.util.hash_array(sesiones['session_id'].to_numpy())
+    registro = (hv & np.uint64(sap.HLL_M - 1)).astype('int64')
+    w = ((hv >> np.uint64(sap.HLL_P)) & np.uint64(2 ** sap.HLL_W_BITS - 1)).astype('float64')
+    with np.errstate(divide='ignore'):
+        rho = np.where(w == 0, sap.HLL_W_BITS + 1, sap.HLL_W_BITS - np.floor(np.log2(w)))
+
+    df = pd.DataFrame({
+        'fecha': sesiones['session_creation_time'].dt.strftime('%Y-%m-%d'),
+        'starting_cause': sesiones['starting_cause'],
+        'registro': registro,
+        'rho': rho.astype('int64')
+    })
+    return df.groupby(['fecha', 'starting_cause', 'registro'], as_index=False)['rho'].max()
+
+# ==================== COMPARACION EXACTO VS APROXIMADO ====================
+
+def compare_exact_vs_approximate(n_sesiones, fecha_inicio, fecha_fin):
+    """Compara conteo exacto vs estimacion HLL combinando sketches diarios"""
+    print("Generando {:,} sesiones sinteticas ({} a {})...".format(n_sesiones, fecha_inicio, fecha_fin))
+    sesiones = generate_synthetic_sessions(n_sesiones, fecha_inicio, fecha_fin)
+
+    # Exacto: count(distinct session_id) por starting_cause sobre el rango completo
+    t0 = time.perf_counter()
+    exacto = sesiones.groupby('starting_cause')['session_id'].nunique()
+    t_exacto = time.perf_counter() - t0
+
+    # Aproximado: materializar sketches diarios y combinarlos para el rango
+    t0 = time.perf_counter()
+    sketches = build_local_sketches(sesiones)
+    t_sketches = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    aproximado = sap.merge_sketches(sketches).set_index('starting_cause')['Cant_sesiones']
+    t_merge = time.perf_counter() - t0
+
+    print("")
+    print("=" * 72)
+    print("EXACTO VS APROXIMADO (HLL, {} registros, error estandar teorico {:.2%})".format(
+        sap.HLL_M, sap.hll_standard_error()))
+    print("=" * 72)
+    print("{:<20} {:>14} {:>14} {:>10}".format('starting_cause', 'exacto', 'aproximado', 'error'))
+    for cause, valor in exacto.sort_values(ascending=False).items():
+        estimado = int(aproximado.get(cause, 0))
+        print("{:<20} {:>14,} {:>14,} {:>9.2%}".format(
+            cause, int(valor), estimado, (estimado - valor) / float(valor)))
+
+    print("")
+    print("Tiempos:")
+    print("    Exacto (distinct sobre el rango):    {:.3f} s".format(t_exacto))
+    print("    Materializar sketches diarios:       {:.3f} s ({:,} filas)".format(t_sketches, len(sketches)))
+    print("    Combinar sketches para el rango:     {:.3f} s".format(t_merge))
+    print("=" * 72)
+
+# ==================== DESCARGA: API VS UNLOAD ====================
+
+class LocalAthenaResults:
+    """
+    Stand-in local de Athena + S3 para un resultado ya calculado:
+    - get_query_results: pagina de a 1000 filas como texto (VarCharValue), igual que la API
+    - unload(prefijo): escribe el resultado como Parquet en una carpeta local (el "S3")
+    """
+
+    ATHENA_TYPES = {'int64': 'bigint', 'float64': 'double'}
+
+    def __init__(self, df, latencia=0.0):
+        self.df = df
+        self.latencia = latencia  # segundos simulados por llamada a la API
+        self.columnas = [
+            {'Name': col, 'Type': self.ATHENA_TYPES.get(str(dtype), 'varchar')}
+            for col, dtype in df.dtypes.items()
+        ]
+
+    def get_query_results(self, QueryExecutionId, MaxResults, NextToken=None):
+        time.sleep(self.latencia)
+        inicio = int(NextToken or 0)
+        rows = []
+        if inicio == 0:
+            rows.append({'Data': [{'VarCharValue': col['Name']} for col in self.columnas]})
+            MaxResults -= 1
+        fin = min(inicio + MaxResults, len(self.df))
+        for valores in self.df.iloc[inicio:fin].astype(str).itertuples(index=False):
+            rows.append({'Data': [{'VarCharValue': valor} for valor in valores]})
+        respuesta = {'ResultSet': {'Rows': rows, 'ResultSetMetadata': {'ColumnInfo': self.columnas}}}
+        if fin < len(self.df):
+            respuesta['NextToken'] = str(fin)
+        return respuesta
+
+    def unload(self, prefijo, archivos=4):
+        """Escribe el resultado en varios Parquet, como hace UNLOAD"""
+        os.makedirs(prefijo, exist_ok=True)
+        for i, parte in enumerate(np.array_split(np.arange(len(self.df)), archivos)):
+            self.df.iloc[parte].to_parquet(os.path.join(prefijo, 'part-{:05d}.parquet'.format(i)), index=False)
+
+def compare_fetch_strategies(tamanos, latencia_ms=0):
+    """Compara tiempo de descarga por GetQueryResults vs lectura de Parquet de UNLOAD"""
+    print("")
+    print("=" * 72)
+    print("DESCARGA DE RESULTADOS: API (GetQueryResults) VS UNLOAD (Parquet)")
+    print("=" * 72)
+    print("{:>12} {:>14} {:>14} {:>10}  {}".format('filas', 'api (s)', 'unload (s)', 'speedup', 'auto elige'))
+
+    for filas in tamanos:
+        sesiones = generate_synthetic_sessions(filas, '2025-10-01', '2025-10-31')
+        sesiones['session_creation_time'] = sesiones['session_creation_time'].astype(str)
+        stand_in = LocalAthenaResults(sesiones, latencia=latencia_ms / 1000.0)
+
+        t0 = time.perf_counter()
+        df_api = sap.concat_pages(sap.iter_result_pages(stand_in, 'local'))
+        t_api = time.perf_counter() - t0
+
+        carpeta = tempfile.mkdtemp(prefix='unload_')
+        try:
+            # La escritura la hace Athena: solo se mide la lectura local
+            stand_in.unload(carpeta)
+            t0 = time.perf_counter()
+            df_unload = sap.read_unload_results(carpeta)
+            t_unload = time.perf_counter() - t0
+        finally:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+        assert len(df_api) == len(df_unload) == filas
+        print("{:>12,} {:>14.3f} {:>14.3f} {:>9.1f}x  {}".format(
+            filas, t_api, t_unload, t_api / max(t_unload, 1e-9), sap.choose_fetch_strategy(filas)))
+
+    print("=" * 72)
+    print("Umbral actual de UNLOAD en modo auto: {:,} filas".format(sap.CONFIG['unload_threshold_rows']))
+
+# ==================== EXCEL: NORMAL VS WRITE-ONLY ====================
+
+def write_detail_excel(filas, write_only, carpeta):
+    """Corre en un proceso propio: genera el detalle y escribe el Excel. Retorna (segundos, pico RSS)"""
+    detalle = generate_synthetic_sessions(filas, '2025-10-01', '2025-10-31')
+    rss_base = sap.peak_rss_mb()
+    t0 = time.perf_counter()
+    sap.create_excel_with_dashboard(os.path.join(carpeta, 'detalle.xlsx'), 0, 'mes', 10, 2025,
+                                    '2025-10-01', '2025-10-31', hojas={'Detalle': detalle},
+                                    write_only=write_only)
+    segundos = time.perf_counter() - t0
+    rss = sap.peak_rss_mb()
+    return segundos, None if rss is None else max(rss - rss_base, 0.0)
+
+def compare_excel_writers(tamanos):
+    """Compara tiempo y pico de memoria del Excel normal vs write-only con hojas de detalle"""
+    print("")
+    print("=" * 72)
+    print("EXCEL: MODELO EN MEMORIA VS WRITE-ONLY (hoja de detalle por sesion)")
+    print("=" * 72)
+    print("{:>12} {:>12} {:>12} {:>12} {:>12}  {}".format(
+        'filas', 'normal (s)', 'normal (MB)', 'w-only (s)', 'w-only (MB)', 'auto elige'))
+
+    # Un proceso nuevo por medicion: el pico de RSS es por proceso
+    contexto = multiprocessing.get_context('spawn')
+    for filas in tamanos:
+        medidas = []
+        for write_only in (False, True):
+            carpeta = tempfile.mkdtemp(prefix='excel_')
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+                    medidas.append(pool.submit(write_detail_excel, filas, write_only, carpeta).result())
+            finally:
+                shutil.rmtree(carpeta, ignore_errors=True)
+
+        (t_normal, rss_normal), (t_stream, rss_stream) = medidas
+        formato_mb = lambda mb: 'n/d' if mb is None else '{:.0f}'.format(mb)
+        print("{:>12,} {:>12.2f} {:>12} {:>12.2f} {:>12}  {}".format(
+            filas, t_normal, formato_mb(rss_normal), t_stream, formato_mb(rss_stream),
+            'write-only' if filas >= sap.CONFIG['excel_write_only_rows'] else 'normal'))
+
+    print("=" * 72)
+    print("Umbral actual de write-only en modo automatico: {:,} filas".format(sap.CONFIG['excel_write_only_rows']))
+
+# ==================== PIPELINE COMPLETO (BACKEND DUCKDB) ====================
+
+# Etapas que registra el script en _METRICS['etapas'] (record_stage). 'descarga' esta
+# incluida en 'consulta' y en 'desglose', por eso el total se mide aparte.
+PIPELINE_STAGES = ['config', 'consulta', 'descarga', 'desglose', 'csv', 'excel']
+
+def script_version():
+    """Hash corto de Sesiones_Abiertas_porPushes.py (identifica la version medida)"""
+    with open(sap.__file__, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+def run_pipeline_stages(fuente, carpeta):
+    """
+    Corre en un proceso propio: ejecuta execute_query_and_save para un mes (query principal
+    + desglose por dia y hora) contra el backend DuckDB y toma los tiempos de cada etapa de
+    _METRICS['etapas']. Retorna (tiempos, pico RSS).
+    """
+    config_path = os.path.join(carpeta, 'config_fechas.txt')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        f.write("MES=10\nAÑO=2025\n")
+    sap.CONFIG.update(query_backend='duckdb', duckdb_source=fuente, config_file=config_path,
+                      output_folder=carpeta, use_cache=False, use_daily_store=False,
+                      archive_results=False, time_breakdown=True, full_dashboard=False,
+                      campaign_breakdown=False, history_workbook=None, stream_results=False)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        resultado = sap.execute_query_and_save()
+        total = time.perf_counter() - t0
+    if resultado is None:
+        raise RuntimeError("El pipeline fallo sobre {}".format(fuente))
+
+    tiempos = dict.fromkeys(PIPELINE_STAGES, 0.0)
+    for etapa in sap._METRICS['etapas']:
+        if etapa['etapa'] in tiempos:
+            tiempos[etapa['etapa']] += etapa['segundos']
+    tiempos['total'] = total
+    return tiempos, sap.peak_rss_mb()
+
+def get_pipeline_fixture(n_sesiones):
+    """Extracto sintetico de un mes (octubre 2025) para la escala pedida; se reutiliza entre corridas"""
+    carpeta = os.path.join(sap.CONFIG['cache_folder'], 'benchmarks', 'sesiones_{}'.format(n_sesiones))
+    if not os.path.isdir(carpeta):
+        write_session_fixture(n_sesiones, '2025-10-01', '2025-10-31', carpeta)
+    return carpeta
+
+def find_regressions(actual, baseline, tolerancia):
+    """Etapas (y memoria) que empeoraron mas que la tolerancia respecto del baseline"""
+    regresiones = []
+    for escala, medida in actual.items():
+        base = baseline.get('escalas', {}).get(escala)
+        if base is None:
+            continue
+        for etapa in PIPELINE_STAGES + ['total']:
+            antes, ahora = base['tiempos'].get(etapa), medida['tiempos'][etapa]
+            # Diferencias de menos de 50 ms son ruido
+            if antes is not None and ahora > antes * (1 + tolerancia) and ahora - antes > 0.05:
+                regresiones.append((escala, etapa, antes, ahora))
+        if base.get('rss_mb') and medida['rss_mb'] and medida['rss_mb'] > base['rss_mb'] * (1 + tolerancia):
+            regresiones.append((escala, 'memoria (MB)', base['rss_mb'], medida['rss_mb']))
+    return regresiones
+
+def benchmark_pipeline(escalas, baseline_path, guardar_baseline=False, tolerancia=0.2):
+    """Mide el pipeline por etapas para cada escala y lo compara contra el baseline guardado"""
+    print("")
+    print("=" * 96)
+    print("PIPELINE COMPLETO SOBRE DATOS SINTETICOS (backend DuckDB) - version {}".format(script_version()))
+    print("=" * 96)
+    print("{:>12} ".format('sesiones/mes') + " ".join("{:>9}".format(etapa) for etapa in PIPELINE_STAGES)
+          + " {:>9} {:>9}".format('total', 'pico MB'))
+
+    contexto = multiprocessing.get_context('spawn')
+    resultados = {}
+    for n_sesiones in escalas:
+        fuente = get_pipeline_fixture(n_sesiones)
+        carpeta = tempfile.mkdtemp(prefix='pipeline_')
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+                tiempos, rss = pool.submit(run_pipeline_stages, fuente, carpeta).result()
+        finally:
+            shutil.rmtree(carpeta, ignore_errors=True)
+        resultados[str(n_sesiones)] = {'tiempos': tiempos, 'rss_mb': rss}
+
+        print("{:>12,} ".format(n_sesiones) + " ".join("{:>9.3f}".format(tiempos[etapa]) for etapa in PIPELINE_STAGES)
+              + " {:>9.3f} {:>9}".format(tiempos['total'], 'n/d' if rss is None else '{:.0f}'.format(rss)))
+    print("=" * 96)
+    print("Tiempos en segundos.")
+
+    regresiones = []
+    if os.path.exists(baseline_path):
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regresiones = find_regressions(resultados, baseline, tolerancia)
+        print("")
+        print("Baseline: {} (version {}, {})".format(baseline_path, baseline['version'], baseline['fecha']))
+        if regresiones:
+            print("[ADVERTENCIA] Regresiones de mas del {:.0%}:".format(tolerancia))
+            for escala, etapa, antes, ahora in regresiones:
+                print("    {:>12,} sesiones - {}: {:.3f} -> {:.3f} ({:+.0%})".format(
+                    int(escala), etapa, antes, ahora, (ahora - antes) / antes))
+        else:
+            print("[OK] Sin regresiones respecto del baseline")
+    else:
+        print("")
+        print("[INFO] No hay baseline en {} (usar --guardar-baseline)".format(baseline_path))
+
+    if guardar_baseline:
+        os.makedirs(os.path.dirname(baseline_path) or '.', exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': script_version(), 'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'escalas': resultados}, f, indent=2)
+        print("[OK] Baseline guardado: {}".format(baseline_path))
+
+    return regresiones
+
+# ==================== DETALLE: ESCRITORES EN PARALELO ====================
+
+def iter_synthetic_pages(n_filas, filas_por_pagina):
+    """Paginas sinteticas de detalle por sesion (simulan la descarga del resultado)"""
+    generadas = 0
+    pagina = 0
+    while generadas < n_filas:
+        filas = min(filas_por_pagina, n_filas - generadas)
+        sesiones = generate_synthetic_sessions(filas, '2025-10-01', '2025-10-31', seed=pagina)
+        sesiones['session_creation_time'] = sesiones['session_creation_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        yield sesiones[['session_id', 'session_creation_time', 'starting_cause']]
+        generadas += filas
+        pagina += 1
+
+def run_detail_export(n_filas, formato, writers, chunk_rows):
+    """Corre en un proceso propio: exporta n_filas sinteticas. Retorna (segundos, bytes, pico RSS)"""
+    carpeta = tempfile.mkdtemp(prefix='detalle_')
+    try:
+        t0 = time.perf_counter()
+        archivos = sap.write_detail_chunks(iter_synthetic_pages(n_filas, 250000), carpeta, formato,
+                                           chunk_rows, writers, verbose=False)
+        segundos = time.perf_counter() - t0
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return segundos, sum(archivo['bytes'] for archivo in archivos), sap.peak_rss_mb()
+
+def compare_detail_writers(n_filas, formatos, writers, chunk_rows):
+    """Throughput y memoria de la exportacion de detalle por formato y cantidad de threads"""
+    print("")
+    print("=" * 72)
+    print("EXPORTACION DE DETALLE: {:,} filas, chunks de {:,} filas".format(n_filas, chunk_rows))
+    print("=" * 72)
+    print("{:>10} {:>8} {:>10} {:>12} {:>10} {:>10}".format(
+        'formato', 'threads', 'segundos', 'filas/s', 'MB', 'pico MB'))
+
+    contexto = multiprocessing.get_context('spawn')
+    for formato in formatos:
+        for cantidad in writers:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+                segundos, total_bytes, rss = pool.submit(run_detail_export, n_filas, formato, cantidad,
+                                                         chunk_rows).result()
+            print("{:>10} {:>8} {:>10.2f} {:>12,.0f} {:>10.1f} {:>10}".format(
+                formato, cantidad, segundos, n_filas / segundos, total_bytes / 1024 / 1024,
+                'n/d' if rss is None else '{:.0f}'.format(rss)))
+    print("=" * 72)
+    print("El tiempo incluye generar las paginas sinteticas (simula la descarga).")
+
+# ==================== ARRANQUE (-X importtime) ====================
+
+# Modulos que cada camino no debe importar: --dry-run no usa datos y un resultado en
+# cache solo necesita pandas/pyarrow (leer el Parquet) y openpyxl (escribir el Excel)
+STARTUP_FORBIDDEN = {
+    'dry-run': ['boto3', 'botocore', 'awswrangler', 'pandas', 'pyarrow', 'openpyxl', 'duckdb'],
+    'cache': ['boto3', 'botocore', 'awswrangler', 'duckdb']
+}
+
+def parse_importtime(salida):
+    """Suma de los tiempos acumulados de primer nivel (ms) y paquetes raiz importados"""
+    total_us = 0
+    raices = set()
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, nombre = linea.split('|', 2)
+        if not nombre.startswith('  '):
+            total_us += int(acumulado)
+        raices.add(nombre.strip().split('.')[0])
+    return total_us / 1000, raices
+
+def measure_startup(argumentos, carpeta, repeticiones):
+    """Corre el script con -X importtime; retorna (mejor import ms, mejor total ms, paquetes importados)"""
+    mejor_import, mejor_total, raices = None, None, set()
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        proceso = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(sap.__file__)] + argumentos,
+                                 cwd=carpeta, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        total_ms = (time.perf_counter() - t0) * 1000
+        if proceso.returncode != 0:
+            raise RuntimeError("El script termino con codigo {}: {}".format(
+                proceso.returncode, proceso.stderr.strip().splitlines()[-1:]))
+        import_ms, raices = parse_importtime(proceso.stderr)
+        mejor_import = import_ms if mejor_import is None else min(mejor_import, import_ms)
+        mejor_total = total_ms if mejor_total is None else min(mejor_total, total_ms)
+    return mejor_import, mejor_total, raices
+
+def benchmark_startup(limite_dry_run_ms, limite_cache_ms, repeticiones=3):
+    """
+    Mide el arranque de --dry-run y de un periodo resuelto desde la cache local (backend
+    DuckDB sobre un extracto chico, cacheado en una primera corrida). Falla si algun camino
+    importa un modulo prohibido o si sus imports superan el limite. Retorna la lista de fallas.
+    """
+    carpeta = tempfile.mkdtemp(prefix='arranque_')
+    try:
+        fuente = os.path.join(carpeta, 'datos')
+        with contextlib.redirect_stdout(io.StringIO()):
+            write_session_fixture(20000, '2025-10-01', '2025-10-31', fuente)
+        base = ['--backend', 'duckdb', '--datos-locales', fuente, '--periodo', '2025-10']
+        # Primera corrida: deja el resultado en la cache de la carpeta temporal
+        subprocess.run([sys.executable, os.path.abspath(sap.__file__)] + base, cwd=carpeta,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+        caminos = [('dry-run', base + ['--dry-run'], limite_dry_run_ms),
+                   ('cache', base, limite_cache_ms)]
+
+        print("")
+        print("=" * 72)
+        print("ARRANQUE DEL SCRIPT (-X importtime, mejor de {} corridas)".format(repeticiones))
+        print("=" * 72)
+        print("{:>10} {:>12} {:>12} {:>12}".format('camino', 'imports ms', 'limite ms', 'proceso ms'))
+        fallas = []
+        for camino, argumentos, limite in caminos:
+            import_ms, total_ms, raices = measure_startup(argumentos, carpeta, repeticiones)
+            print("{:>10} {:>12.0f} {:>12.0f} {:>12.0f}".format(camino, import_ms, limite, total_ms))
+            if import_ms > limite:
+                fallas.append("{}: imports en {:.0f} ms (limite {:.0f} ms)".format(camino, import_ms, limite))
+            prohibidos = sorted(raices.intersection(STARTUP_FORBIDDEN[camino]))
+            if prohibidos:
+                fallas.append("{}: importa {}".format(camino, ", ".join(prohibidos)))
+        print("=" * 72)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    if fallas:
+        print("[ERROR] Regresiones de arranque:")
+        for falla in fallas:
+            print("    {}".format(falla))
+    else:
+        print("[OK] Arranque dentro de los limites")
+    return fallas
+
+# ==================== INYECCION DE FALLAS (REINTENTOS) ====================
+
+def simulate_faults(n_queries, p_throttling, p_fallas, caida=False):
+    """Ejecuta n_queries en paralelo contra FaultyAthenaClient y resume reintentos y breaker"""
+    sap.CONFIG.update(retry_base_seconds=0.01, retry_max_seconds=0.2, circuit_breaker_reset_seconds=1,
+                      start_query_rate_per_second=50, query_reuse_max_age_minutes=0)
+    sap._RETRY_STATE.clear()
+    df = pd.DataFrame({'starting_cause': list(STARTING_CAUSES), 'Cant_sesiones': [1000] * len(STARTING_CAUSES)})
+    cliente = FaultyAthenaClient(df, p_throttling, p_fallas, caida)
+    engine = sap.AsyncAthenaEngine(cliente, 'db', 'wg', poll_min=0.01, poll_max=0.05)
+
+    async def ejecutar(i):
+        try:
+            await engine.run_query('SELECT {}'.format(i))
+            return 'ok'
+        except sap.CircuitOpenError:
+            return 'breaker'
+        except Exception:
+            return 'error'
+
+    async def ejecutar_todas():
+        semaforo = asyncio.Semaphore(sap.CONFIG['max_concurrent_queries'])
+
+        async def limitada(i):
+            async with semaforo:
+                return await ejecutar(i)
+        return await asyncio.gather(*[limitada(i) for i in range(n_queries)])
+
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultados = sap.run_async(ejecutar_todas(), engine)
+    segundos = time.perf_counter() - t0
+
+    print("{:<28} {:>6} {:>7} {:>8} {:>10} {:>9} {:>9} {:>8.2f}".format(
+        'throttling={:.0%} fallas={:.0%}{}'.format(p_throttling, p_fallas, ' CAIDA' if caida else ''),
+        resultados.count('ok'), resultados.count('error'), resultados.count('breaker'),
+        sap._RETRY_STATE.get('reintentos', 0), sap.get_circuit_breaker().aperturas, len(cliente.llamadas), segundos))
+
+def compare_fault_scenarios(n_queries):
+    """Escenarios de fallas inyectadas sobre el motor con reintentos y circuit breaker"""
+    print("")
+    print("=" * 96)
+    print("REINTENTOS Y CIRCUIT BREAKER CON FALLAS INYECTADAS ({} queries)".format(n_queries))
+    print("=" * 96)
+    print("{:<28} {:>6} {:>7} {:>8} {:>10} {:>9} {:>9} {:>8}".format(
+        'escenario', 'ok', 'error', 'breaker', 'reintentos', 'aperturas', 'llamadas', 'seg'))
+    simulate_faults(n_queries, 0.0, 0.0)
+    simulate_faults(n_queries, 0.2, 0.0)
+    simulate_faults(n_queries, 0.0, 0.3)
+    simulate_faults(n_queries, 0.3, 0.3)
+    simulate_faults(n_queries, 0.0, 0.0, caida=True)
+    print("=" * 96)
+    print("Con el servicio caido el breaker corta las llamadas en lugar de reintentar cada query.")
+
+# ==================== EJECUCION PRINCIPAL ====================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks locales de Sesiones Abiertas por Pushes")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    p_aprox = subparsers.add_parser('aproximado', help='Compara conteo exacto vs sketches HLL')
+    p_aprox.add_argument('--sesiones', type=int, default=2000000)
+    p_aprox.add_argument('--desde', default='2025-10-01')
+    p_aprox.add_argument('--hasta', default='2025-10-31')
+
+    p_descarga = subparsers.add_parser('descarga', help='Compara descarga por API vs UNLOAD a Parquet')
+    p_descarga.add_argument('--filas', type=int, nargs='+', default=[10000, 100000, 500000])
+    p_descarga.add_argument('--latencia-ms', type=float, default=0,
+                            help='Latencia simulada por llamada a GetQueryResults')
+
+    p_excel = subparsers.add_parser('excel', help='Compara Excel en memoria vs write-only')
+    p_excel.add_argument('--filas', type=int, nargs='+', default=[10000, 100000, 1000000])
+
+    p_fixture = subparsers.add_parser('fixture', help='Genera un extracto sintetico para el backend DuckDB')
+    p_fixture.add_argument('--sesiones', type=int, default=5000000)
+    p_fixture.add_argument('--desde', default='2025-09-01')
+    p_fixture.add_argument('--hasta', default='2025-10-31')
+    p_fixture.add_argument('--salida', default=sap.CONFIG['duckdb_source'])
+
+    p_pipeline = subparsers.add_parser('pipeline', help='Mide el pipeline completo por etapas contra un baseline')
+    p_pipeline.add_argument('--escalas', type=int, nargs='+', default=[2200000, 5000000, 20000000],
+                            help='Sesiones por mes de cada escala')
+    p_pipeline.add_argument('--baseline', default=os.path.join(sap.CONFIG['cache_folder'], 'benchmarks',
+                                                               'pipeline_baseline.json'))
+    p_pipeline.add_argument('--guardar-baseline', action='store_true',
+                            help='Guarda los resultados como nuevo baseline')
+    p_pipeline.add_argument('--tolerancia', type=float, default=0.2,
+                            help='Empeoramiento relativo a partir del cual se marca una regresion')
+
+    p_fallas = subparsers.add_parser('fallas', help='Reintentos y circuit breaker con fallas inyectadas')
+    p_fallas.add_argument('--queries', type=int, default=40)
+
+    p_detalle = subparsers.add_parser('detalle', help='Exportacion de detalle: formatos y threads de escritura')
+    p_detalle.add_argument('--filas', type=int, default=5000000)
+    p_detalle.add_argument('--formatos', nargs='+', default=['csv.gz', 'parquet'], choices=list(sap.DETAIL_FORMATS))
+    p_detalle.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    p_detalle.add_argument('--chunk', type=int, default=1000000, help='Filas por archivo')
+
+    p_arranque = subparsers.add_parser('arranque', help='Limita el tiempo de imports de --dry-run y de la cache')
+    p_arranque.add_argument('--limite-dry-run-ms', type=float, default=150)
+    p_arranque.add_argument('--limite-cache-ms', type=float, default=1000)
+    p_arranque.add_argument('--repeticiones', type=int, default=3)
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'aproximado':
+        compare_exact_vs_approximate(args.sesiones, args.desde, args.hasta)
+    elif args.benchmark == 'descarga':
+        compare_fetch_strategies(args.filas, args.latencia_ms)
+    elif args.benchmark == 'excel':
+        compare_excel_writers(args.filas)
+    elif args.benchmark == 'pipeline':
+        if benchmark_pipeline(args.escalas, args.baseline, args.guardar_baseline, args.tolerancia):
+            raise SystemExit(1)
+    elif args.benchmark == 'fallas':
+        compare_fault_scenarios(args.queries)
+    elif args.benchmark == 'detalle':
+        compare_detail_writers(args.filas, args.formatos, args.threads, args.chunk)
+    elif args.benchmark == 'arranque':
+        if benchmark_startup(args.limite_dry_run_ms, args.limite_cache_ms, args.repeticiones):
+            raise SystemExit(1)
+    elif args.benchmark == 'fixture':
+        write_session_fixture(args.sesiones, args.desde, args.hasta, args.salida)
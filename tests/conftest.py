@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+# El script vive en la raiz del repositorio (no es un paquete instalable)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+
+@pytest.fixture
+def athena_local(tmp_path, monkeypatch):
+    """
+    Configuracion para correr AsyncAthenaEngine contra stub_athena: backend 'athena',
+    registro de ejecuciones en tmp, reintentos rapidos y estado de reintentos/metricas nuevo.
+    """
+    import Sesiones_Abiertas_porPushes as sap
+
+    for clave, valor in {
+        'query_backend': 'athena',
+        'query_registry_file': str(tmp_path / 'query_registry.json'),
+        'query_reuse_max_age_minutes': 0,
+        'athena_result_reuse': False,
+        'retry_base_seconds': 0.001,
+        'retry_max_seconds': 0.01,
+        'start_query_rate_per_second': 1000,
+    }.items():
+        monkeypatch.setitem(sap.CONFIG, clave, valor)
+    monkeypatch.setattr(sap, '_RETRY_STATE', {})
+    monkeypatch.setattr(sap, '_METRICS', {'etapas': [], 'queries': [],
+                                          'reuso': {'hits': 0, 'misses': 0, 'bytes_ahorrados': 0}})
+    return sap
+
+
+@pytest.fixture
+def duckdb_local(tmp_path, monkeypatch):
+    """
+    Backend DuckDB sobre un extracto sintetico de boti_session_metrics_2 (septiembre y
+    octubre de 2025) con cache y store diario en tmp. Las filas de una misma sesion caen en
+    dias distintos, asi que sumar conteos por dia da mas sesiones que la query directa.
+    Retorna el modulo; el extracto queda en sap.CONFIG['duckdb_source'].
+    """
+    pytest.importorskip('duckdb')
+    import numpy as np
+    import pandas as pd
+    import Sesiones_Abiertas_porPushes as sap
+
+    rng = np.random.default_rng(7)
+    n_filas = 4000
+    inicio = pd.Timestamp('2025-09-01')
+    segundos = rng.integers(0, 61 * 86400, n_filas)
+    extracto = pd.DataFrame({
+        'session_id': ['s{:04d}'.format(n) for n in rng.integers(0, 900, n_filas)],
+        'starting_cause': rng.choice(['WhatsAppTemplate', 'UserMessage', 'Referral', 'Ad'], n_filas),
+        'session_creation_time': inicio + pd.to_timedelta(segundos, unit='s'),
+    })
+    fuente = str(tmp_path / 'boti_session_metrics_2.parquet')
+    extracto.to_parquet(fuente, index=False)
+
+    for clave, valor in {
+        'query_backend': 'duckdb',
+        'duckdb_source': fuente,
+        'cache_folder': str(tmp_path / 'cache'),
+        'daily_store_folder': str(tmp_path / 'cache' / 'diario'),
+        'query_registry_file': str(tmp_path / 'cache' / 'query_registry.json'),
+        'approximate': False,
+    }.items():
+        monkeypatch.setitem(sap.CONFIG, clave, valor)
+    monkeypatch.setattr(sap, '_AWS_STATE', {})
+    monkeypatch.setattr(sap, '_METRICS', {'etapas': [], 'queries': [],
+                                          'reuso': {'hits': 0, 'misses': 0, 'bytes_ahorrados': 0}})
+    return sap
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in local de Athena para los tests del motor asyncio, los reintentos y el registro
+de ejecuciones. Implementa las operaciones que usa AsyncAthenaEngine
+(StartQueryExecution, BatchGetQueryExecution, GetQueryExecution, GetQueryResults,
+StopQueryExecution) y registra cada llamada con su instante.
+
+- StubAthenaClient: deterministico. Cada query iniciada toma el siguiente estado final de
+  `finales` (por defecto SUCCEEDED) despues de `polls_hasta_fin` consultas de estado en
+  RUNNING (None = no termina nunca). `errores[operacion]` es una lista de excepciones que
+  se lanzan, en orden, en las proximas llamadas a esa operacion.
+- FaultyAthenaClient: inyecta fallas al azar (throttling y queries FAILED reintentables);
+  lo usa tambien `python benchmarks.py fallas`.
+"""
+import random
+import threading
+import time
+
+import pandas as pd
+from botocore.exceptions import ClientError
+
+RESULTADO_POR_DEFECTO = pd.DataFrame({'starting_cause': ['WhatsAppTemplate', 'UserMessage'],
+                                      'Cant_sesiones': [120, 80]})
+
+FALLA_S3_SLOWDOWN = {'State': 'FAILED', 'StateChangeReason': 'HIVE_CANNOT_OPEN_SPLIT: S3 SlowDown',
+                     'AthenaError': {'ErrorCategory': 1, 'Retryable': True}}
+
+
+def client_error(codigo, operacion, mensaje='Error inyectado'):
+    """ClientError de botocore con el codigo indicado"""
+    return ClientError({'Error': {'Code': codigo, 'Message': mensaje}}, operacion)
+
+
+class StubAthenaClient:
+    """Athena local programable (ver descripcion del modulo)"""
+
+    ATHENA_TYPES = {'int64': 'bigint', 'float64': 'double'}
+
+    def __init__(self, df=None, finales=None, polls_hasta_fin=0, output_location='s3://resultados/'):
+        self.df = RESULTADO_POR_DEFECTO if df is None else df
+        self.finales = list(finales or [])
+        self.polls_hasta_fin = polls_hasta_fin
+        self.output_location = output_location
+        self.errores = {}
+        self.ejecuciones = {}
+        self.polls = {}
+        self.llamadas = []
+        self.detenidas = []
+        self.lock = threading.Lock()
+
+    def _registrar(self, operacion):
+        with self.lock:
+            self.llamadas.append((operacion, time.monotonic()))
+            pendientes = self.errores.get(operacion)
+            if pendientes:
+                raise pendientes.pop(0)
+
+    def instantes(self, operacion):
+        """Instantes (time.monotonic) de las llamadas a una operacion"""
+        return [instante for nombre, instante in self.llamadas if nombre == operacion]
+
+    def _estado_final(self):
+        final = self.finales.pop(0) if self.finales else 'SUCCEEDED'
+        return {'State': final} if isinstance(final, str) else dict(final)
+
+    def _ejecucion(self, query_id):
+        ejecucion = self.ejecuciones[query_id]
+        if ejecucion['Status']['State'] == 'RUNNING':
+            self.polls[query_id] += 1
+            if self.polls_hasta_fin is not None and self.polls[query_id] > self.polls_hasta_fin:
+                ejecucion['Status'] = ejecucion.pop('final')
+        return {clave: valor for clave, valor in ejecucion.items() if clave != 'final'}
+
+    def start_query_execution(self, QueryString, QueryExecutionContext, WorkGroup=None, **kwargs):
+        self._registrar('StartQueryExecution')
+        with self.lock:
+            query_id = 'q{:05d}'.format(len(self.ejecuciones))
+            self.ejecuciones[query_id] = {
+                'QueryExecutionId': query_id,
+                'Query': QueryString,
+                'WorkGroup': WorkGroup,
+                'Status': {'State': 'RUNNING'},
+                'final': self._estado_final(),
+                'ResultConfiguration': {'OutputLocation': '{}{}.csv'.format(self.output_location, query_id)},
+                'Statistics': {'DataScannedInBytes': 50 * 1024 ** 2, 'EngineExecutionTimeInMillis': 10,
+                               'QueryQueueTimeInMillis': 1}
+            }
+            self.polls[query_id] = 0
+        return {'QueryExecutionId': query_id}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        self._registrar('BatchGetQueryExecution')
+        with self.lock:
+            return {'QueryExecutions': [self._ejecucion(query_id) for query_id in QueryExecutionIds]}
+
+    def get_query_execution(self, QueryExecutionId):
+        self._registrar('GetQueryExecution')
+        with self.lock:
+            if QueryExecutionId not in self.ejecuciones:
+                raise client_error('InvalidRequestException', 'GetQueryExecution', 'QueryExecution no encontrada')
+            return {'QueryExecution': self._ejecucion(QueryExecutionId)}
+
+    def get_query_results(self, QueryExecutionId, MaxResults, NextToken=None):
+        self._registrar('GetQueryResults')
+        columnas = [{'Name': col, 'Type': self.ATHENA_TYPES.get(str(dtype), 'varchar')}
+                    for col, dtype in self.df.dtypes.items()]
+        inicio = int(NextToken or 0)
+        rows = []
+        if inicio == 0:
+            rows.append({'Data': [{'VarCharValue': col['Name']} for col in columnas]})
+            MaxResults -= 1
+        fin = min(inicio + MaxResults, len(self.df))
+        for valores in self.df.iloc[inicio:fin].astype(str).itertuples(index=False):
+            rows.append({'Data': [{'VarCharValue': valor} for valor in valores]})
+        respuesta = {'ResultSet': {'Rows': rows, 'ResultSetMetadata': {'ColumnInfo': columnas}}}
+        if fin < len(self.df):
+            respuesta['NextToken'] = str(fin)
+        return respuesta
+
+    def stop_query_execution(self, QueryExecutionId):
+        self._registrar('StopQueryExecution')
+        with self.lock:
+            self.detenidas.append(QueryExecutionId)
+            ejecucion = self.ejecuciones.get(QueryExecutionId)
+            if ejecucion is not None and ejecucion['Status']['State'] == 'RUNNING':
+                ejecucion['Status'] = {'State': 'CANCELLED', 'StateChangeReason': 'Detenida por el usuario'}
+        return {}
+
+
+class FaultyAthenaClient(StubAthenaClient):
+    """
+    Inyecta fallas al azar: throttling (ClientError) en cualquier llamada con probabilidad
+    p_throttling y queries FAILED reintentables (S3 SlowDown) con probabilidad p_fallas.
+    Con caida=True todas las llamadas fallan (servicio caido).
+    """
+
+    def __init__(self, df=None, p_throttling=0.0, p_fallas=0.0, caida=False, seed=42):
+        super().__init__(df)
+        self.p_throttling = p_throttling
+        self.p_fallas = p_fallas
+        self.caida = caida
+        self.rng = random.Random(seed)
+
+    def _registrar(self, operacion):
+        super()._registrar(operacion)
+        with self.lock:
+            throttling = self.caida or self.rng.random() < self.p_throttling
+        if throttling and operacion != 'StopQueryExecution':
+            raise client_error('TooManyRequestsException', operacion, 'Rate exceeded')
+
+    def _estado_final(self):
+        return dict(FALLA_S3_SLOWDOWN) if self.rng.random() < self.p_fallas else {'State': 'SUCCEEDED'}
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""AsyncAthenaEngine contra un Athena local (stub_athena): polling, timeout, cancelacion y fallas"""
+import asyncio
+
+import pytest
+
+from stub_athena import StubAthenaClient
+
+
+def motor(sap, cliente, **kwargs):
+    kwargs.setdefault('poll_min', 0.01)
+    kwargs.setdefault('poll_max', 0.05)
+    return sap.AsyncAthenaEngine(cliente, 'db', 'wg', **kwargs)
+
+
+def test_run_query_retorna_el_resultado_tipado(athena_local):
+    cliente = StubAthenaClient(polls_hasta_fin=2)
+    df, ejecucion = asyncio.run(motor(athena_local, cliente).run_query('SELECT 1'))
+
+    assert ejecucion['Status']['State'] == 'SUCCEEDED'
+    assert list(df['Cant_sesiones']) == [120, 80] and str(df['Cant_sesiones'].dtype) == 'Int64'
+    assert athena_local._METRICS['queries'][0]['query_id'] == ejecucion['QueryExecutionId']
+
+
+def test_polling_con_backoff_exponencial_hasta_el_maximo(athena_local):
+    cliente = StubAthenaClient(polls_hasta_fin=5)
+    asyncio.run(motor(athena_local, cliente, poll_min=0.05, poll_max=0.2).execute_query('SELECT 1'))
+
+    polls = cliente.instantes('BatchGetQueryExecution')
+    assert len(polls) == 6
+    intervalos = [fin - inicio for inicio, fin in zip(polls, polls[1:])]
+    # El primer poll es inmediato; despues la espera se duplica desde poll_min hasta poll_max.
+    # Nunca se espera menos que el nominal; el margen superior absorbe la carga de la maquina.
+    nominales = [0.05, 0.1, 0.2, 0.2, 0.2]
+    assert all(nominal * 0.9 <= intervalo < nominal + 0.15 for intervalo, nominal in zip(intervalos, nominales))
+    assert max(intervalos[2:]) < 0.2 * 2
+
+
+def test_un_solo_poller_consulta_todas_las_queries_juntas(athena_local):
+    cliente = StubAthenaClient(polls_hasta_fin=3)
+    engine = motor(athena_local, cliente)
+
+    async def varias():
+        return await asyncio.gather(*[engine.execute_query('SELECT {}'.format(i)) for i in range(4)])
+
+    assert len(asyncio.run(varias())) == 4
+    # 4 queries terminan en el 4to poll de cada una: sin un poller compartido serian 16 llamadas
+    assert len(cliente.instantes('BatchGetQueryExecution')) <= 8
+
+
+def test_timeout_detiene_la_query_en_athena(athena_local):
+    cliente = StubAthenaClient(polls_hasta_fin=None)
+    engine = motor(athena_local, cliente)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(engine.execute_query('SELECT 1', timeout=0.1))
+    assert cliente.detenidas == ['q00000']
+    assert engine.en_curso == set()
+
+
+def test_cancelar_la_tarea_detiene_la_query_en_athena(athena_local):
+    cliente = StubAthenaClient(polls_hasta_fin=None)
+    engine = motor(athena_local, cliente)
+
+    async def cancelar():
+        tarea = asyncio.ensure_future(engine.run_query('SELECT 1'))
+        while not engine.en_curso:
+            await asyncio.sleep(0.005)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    asyncio.run(cancelar())
+    assert cliente.detenidas == ['q00000']
+    assert engine.en_curso == set()
+
+
+def test_ctrl_c_detiene_las_queries_en_curso(athena_local):
+    cliente = StubAthenaClient(polls_hasta_fin=None)
+    engine = motor(athena_local, cliente)
+
+    async def interrumpida():
+        await engine.start_query('SELECT 1')
+        await engine.start_query('SELECT 2')
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        athena_local.run_async(interrumpida(), engine)
+    assert sorted(cliente.detenidas) == ['q00000', 'q00001']
+    assert engine.en_curso == set()
+
+
+def test_query_failed_lanza_athena_query_error(athena_local):
+    cliente = StubAthenaClient(finales=[{'State': 'FAILED',
+                                         'StateChangeReason': "SYNTAX_ERROR: line 1:8: Column 'x' cannot be resolved"}])
+
+    with pytest.raises(athena_local.AthenaQueryError) as error:
+        asyncio.run(motor(athena_local, cliente).execute_query('SELECT x'))
+    assert error.value.estado == 'FAILED' and 'SYNTAX_ERROR' in error.value.motivo
+    # Error permanente: no se relanza
+    assert len(cliente.instantes('StartQueryExecution')) == 1
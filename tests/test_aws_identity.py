@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Expiracion de credenciales e identidad cacheada (fechas UTC con zona)"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import Sesiones_Abiertas_porPushes as sap
+
+
+class Credenciales:
+    def __init__(self, method, **atributos):
+        self.method = method
+        self.access_key = 'AKIAEJEMPLO'
+        self.__dict__.update(atributos)
+
+
+class Sesion:
+    profile_name = 'default'
+
+    def __init__(self, credenciales):
+        self.credenciales = credenciales
+
+    def get_credentials(self):
+        return self.credenciales
+
+
+@pytest.fixture
+def credentials_file(tmp_path, monkeypatch):
+    path = tmp_path / 'credentials'
+    monkeypatch.setenv('AWS_SHARED_CREDENTIALS_FILE', str(path))
+    monkeypatch.setitem(sap.CONFIG, 'identity_cache_file', str(tmp_path / 'identity.json'))
+
+    def escribir(expiracion):
+        path.write_text("[default]\naws_access_key_id = AKIAEJEMPLO\naws_expiration = {}\n".format(expiracion))
+    return escribir
+
+
+def test_usa_aws_expiration_del_archivo_de_credenciales(credentials_file):
+    credentials_file('2025-10-17T15:04:05.000Z')
+    expiry = sap.get_credentials_expiry(Sesion(Credenciales('shared-credentials-file')))
+    assert expiry == datetime(2025, 10, 17, 15, 4, 5, tzinfo=timezone.utc)
+
+
+def test_expiracion_de_botocore_se_normaliza_a_utc(credentials_file):
+    local = datetime(2025, 10, 17, 12, 0, tzinfo=timezone(timedelta(hours=-3)))
+    expiry = sap.get_credentials_expiry(Sesion(Credenciales('assume-role', _expiry_time=local)))
+    assert expiry == datetime(2025, 10, 17, 15, 0, tzinfo=timezone.utc)
+
+
+def test_sin_expiracion_conocida(credentials_file):
+    assert sap.get_credentials_expiry(Sesion(Credenciales('env'))) is None
+    assert sap.get_credentials_expiry(Sesion(None)) is None
+
+
+def test_identidad_cacheada_vale_hasta_la_expiracion(credentials_file):
+    sesion = Sesion(Credenciales('shared-credentials-file'))
+    futuro = datetime.now(timezone.utc) + timedelta(hours=1)
+    credentials_file(futuro.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    sap.save_cached_identity(sesion, 'arn:aws:sts::1:assumed-role/PIBAConsumeBoti/x')
+    assert sap.load_cached_identity(sesion)['expiry'] == futuro.strftime('%Y-%m-%d %H:%M:%S')
+
+    credentials_file((futuro - timedelta(hours=2)).strftime('%Y-%m-%dT%H:%M:%SZ'))
+    sap.save_cached_identity(sesion, 'arn:aws:sts::1:assumed-role/PIBAConsumeBoti/x')
+    assert sap.load_cached_identity(sesion) is None
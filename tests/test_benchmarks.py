@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""benchmarks.py pipeline: mide el entry point real del script sobre DuckDB"""
+import os
+
+import pytest
+
+import benchmarks
+import Sesiones_Abiertas_porPushes as sap
+
+
+def test_pipeline_toma_las_etapas_de_las_metricas_del_script(tmp_path, monkeypatch):
+    pytest.importorskip('duckdb')
+    fuente = str(tmp_path / 'datos')
+    benchmarks.write_session_fixture(5000, '2025-10-01', '2025-10-31', fuente)
+    salida = tmp_path / 'salida'
+    salida.mkdir()
+    monkeypatch.setattr(sap, 'CONFIG', dict(sap.CONFIG))
+    monkeypatch.setattr(sap, '_AWS_STATE', {})
+    monkeypatch.setattr(sap, '_METRICS', {'etapas': [], 'queries': [],
+                                          'reuso': {'hits': 0, 'misses': 0, 'bytes_ahorrados': 0}})
+
+    tiempos, _ = benchmarks.run_pipeline_stages(fuente, str(salida))
+
+    registradas = {etapa['etapa'] for etapa in sap._METRICS['etapas']}
+    assert set(benchmarks.PIPELINE_STAGES) <= registradas
+    assert all(tiempos[etapa] > 0 for etapa in ['consulta', 'desglose', 'csv', 'excel'])
+    assert tiempos['total'] >= tiempos['consulta'] + tiempos['desglose']
+    # Los archivos son los del script (Excel con las hojas del desglose)
+    assert any(nombre.endswith('.xlsx') for nombre in os.listdir(str(salida)))
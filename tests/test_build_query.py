@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""SQL generado por build_query y los predicados de tiempo/particion"""
+import re
+
+import pytest
+
+import Sesiones_Abiertas_porPushes as sap
+
+
+def layout_con_particiones(partitions, sortable=False):
+    layout = dict(sap.get_table_layout('boti_session_metrics_2'))
+    layout.update(partitions=partitions, partition_sortable=sortable)
+    return layout
+
+
+@pytest.mark.parametrize('periodo, inicio, fin_exclusivo', [
+    ('2025-10', '2025-10-01 00:00:00', '2025-11-01 00:00:00'),            # mes completo
+    ('2025-12', '2025-12-01 00:00:00', '2026-01-01 00:00:00'),            # cambio de año
+    ('2025-10-01:2025-10-15', '2025-10-01 00:00:00', '2025-10-16 00:00:00'),  # rango
+    ('2025-10-15', '2025-10-15 00:00:00', '2025-10-16 00:00:00'),         # un solo dia
+])
+def test_build_query_usa_rango_semiabierto(periodo, inicio, fin_exclusivo):
+    _, fecha_inicio, fecha_fin, _, _, _ = sap.parse_period_arg(periodo)
+    query = sap.build_query(fecha_inicio, fecha_fin)
+
+    assert ("session_creation_time >= timestamp '{}' AND session_creation_time < timestamp '{}'".format(
+        inicio, fin_exclusivo)) in query
+    assert not re.search(r'CAST\s*\(.*AS\s+DATE\)', query, re.IGNORECASE)
+    assert 'BETWEEN' not in query
+    assert query.startswith('SELECT starting_cause, count(distinct (session_id)) as Cant_sesiones')
+    assert query.rstrip().endswith('group by starting_cause')
+
+
+def test_build_query_aproximado_usa_approx_distinct():
+    query = sap.build_query('2025-10-01', '2025-10-31', aproximado=True)
+    assert 'approx_distinct(session_id, {})'.format(sap.CONFIG['approx_max_error']) in query
+
+
+def test_tabla_sin_particiones_no_agrega_predicado_de_particion():
+    layout = sap.get_table_layout('boti_session_metrics_2')
+    assert sap.build_partition_predicate('2025-10-01', '2025-10-31', layout) is None
+
+
+def test_particion_unica_ordenable_usa_between():
+    layout = layout_con_particiones([('dt', '%Y-%m-%d')], sortable=True)
+    query = sap.build_query('2025-10-01', '2025-10-31', layout=layout)
+    assert "dt BETWEEN '2025-10-01' AND '2025-10-31'" in query
+    assert "AND session_creation_time >= timestamp '2025-10-01 00:00:00'" in query
+
+
+def test_particion_unica_de_un_dia_usa_igualdad():
+    layout = layout_con_particiones([('dt', '%Y-%m-%d')], sortable=True)
+    assert sap.build_partition_predicate('2025-10-15', '2025-10-15', layout) == "dt = '2025-10-15'"
+
+
+def test_particion_unica_no_ordenable_usa_in():
+    layout = layout_con_particiones([('mes', '%m/%Y')])
+    assert sap.build_partition_predicate('2025-09-20', '2025-10-05', layout) == "mes IN ('09/2025', '10/2025')"
+
+
+def test_particiones_anio_mes_dia():
+    layout = layout_con_particiones([('year', '%Y'), ('month', '%m'), ('day', '%d')])
+    predicado = sap.build_partition_predicate('2025-10-30', '2025-11-01', layout)
+    assert predicado == ("((year = '2025' AND month = '10' AND day = '30')"
+                         " OR (year = '2025' AND month = '10' AND day = '31')"
+                         " OR (year = '2025' AND month = '11' AND day = '01'))")
+
+    un_dia = sap.build_partition_predicate('2025-10-15', '2025-10-15', layout)
+    assert un_dia == "year = '2025' AND month = '10' AND day = '15'"
+
+
+def test_dias_no_contiguos_del_store_diario_se_combinan_con_or():
+    query = sap.build_daily_query(['2025-10-01', '2025-10-02', '2025-10-05', '2025-10-09'])
+    where = query.split('WHERE', 1)[1]
+
+    assert where.count('\n   OR ') == 2
+    assert ("(session_creation_time >= timestamp '2025-10-01 00:00:00'"
+            " AND session_creation_time < timestamp '2025-10-03 00:00:00')") in where
+    assert ("(session_creation_time >= timestamp '2025-10-05 00:00:00'"
+            " AND session_creation_time < timestamp '2025-10-06 00:00:00')") in where
+    assert ("(session_creation_time >= timestamp '2025-10-09 00:00:00'"
+            " AND session_creation_time < timestamp '2025-10-10 00:00:00')") in where
+
+
+def test_dias_contiguos_del_store_diario_son_un_solo_rango():
+    query = sap.build_daily_query(['2025-10-03', '2025-10-01', '2025-10-02'])
+    assert ' OR ' not in query
+    assert ("session_creation_time >= timestamp '2025-10-01 00:00:00'"
+            " AND session_creation_time < timestamp '2025-10-04 00:00:00'") in query
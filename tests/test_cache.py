@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Cache local de resultados: frescura de rangos cerrados y abiertos, LRU y escritura atomica"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import Sesiones_Abiertas_porPushes as sap
+
+RESULTADO = pd.DataFrame({'starting_cause': ['WhatsAppTemplate', 'UserMessage'], 'Cant_sesiones': [120, 80]})
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    for clave, valor in {'use_cache': True, 'cache_folder': str(tmp_path / 'cache'), 'query_backend': 'athena',
+                         'late_arrival_days': 2, 'cache_ttl_minutes': 60,
+                         'cache_max_bytes': 500 * 1024 * 1024}.items():
+        monkeypatch.setitem(sap.CONFIG, clave, valor)
+    return tmp_path / 'cache'
+
+
+def query(fecha_inicio, fecha_fin):
+    return sap.build_query(fecha_inicio, fecha_fin)
+
+
+def entrada(fecha_inicio, fecha_fin):
+    return sap.load_cache_index()[sap.cache_key(query(fecha_inicio, fecha_fin), fecha_inicio, fecha_fin)]
+
+
+def test_rango_cerrado_es_inmutable(cache, monkeypatch):
+    sap.cache_put(query('2025-09-01', '2025-09-30'), '2025-09-01', '2025-09-30', RESULTADO)
+
+    assert entrada('2025-09-01', '2025-09-30')['immutable']
+    assert sap.is_cache_entry_fresh(entrada('2025-09-01', '2025-09-30'), datetime.now() + timedelta(days=365))
+    monkeypatch.setitem(sap.CONFIG, 'cache_ttl_minutes', 0)
+    pd.testing.assert_frame_equal(sap.cache_get(query('2025-09-01', '2025-09-30'), '2025-09-01', '2025-09-30'),
+                                  RESULTADO)
+
+
+@pytest.mark.parametrize('dias_atras', [0, 1, 2])
+def test_rango_abierto_o_en_ventana_tardia_vence_con_el_ttl(cache, monkeypatch, dias_atras):
+    # Con late_arrival_days = 2, hoy y los dos dias anteriores siguen abiertos
+    fin = (datetime.now() - timedelta(days=dias_atras)).strftime('%Y-%m-%d')
+    inicio = (datetime.now() - timedelta(days=10)).strftime('%Y-%m-%d')
+    sap.cache_put(query(inicio, fin), inicio, fin, RESULTADO)
+    registro = entrada(inicio, fin)
+
+    assert not registro['immutable']
+    assert sap.is_cache_entry_fresh(registro, datetime.now() + timedelta(minutes=59))
+    assert not sap.is_cache_entry_fresh(registro, datetime.now() + timedelta(minutes=61))
+    assert sap.cache_get(query(inicio, fin), inicio, fin) is not None
+    monkeypatch.setitem(sap.CONFIG, 'cache_ttl_minutes', 0)
+    assert sap.cache_get(query(inicio, fin), inicio, fin) is None
+
+
+def test_lru_elimina_la_entrada_usada_hace_mas_tiempo(cache, monkeypatch):
+    meses = [('2025-0{}-01'.format(mes), '2025-0{}-28'.format(mes)) for mes in (1, 2, 3)]
+    for inicio, fin in meses:
+        sap.cache_put(query(inicio, fin), inicio, fin, RESULTADO)
+    index = sap.load_cache_index()
+    for dia, (inicio, fin) in enumerate(meses, start=1):
+        index[sap.cache_key(query(inicio, fin), inicio, fin)]['last_access'] = '2026-01-0{} 00:00:00'.format(dia)
+    sap.save_cache_index(index)
+    tamano = entrada(*meses[0])['size']
+
+    # Enero es la mas vieja por creacion, pero se acaba de leer: la menos usada es febrero
+    assert sap.cache_get(query(*meses[0]), *meses[0]) is not None
+    monkeypatch.setitem(sap.CONFIG, 'cache_max_bytes', 3 * tamano)
+    sap.cache_put(query('2025-04-01', '2025-04-28'), '2025-04-01', '2025-04-28', RESULTADO)
+
+    index = sap.load_cache_index()
+    claves = {sap.cache_key(query(inicio, fin), inicio, fin) for inicio, fin in meses}
+    eliminada = sap.cache_key(query(*meses[1]), *meses[1])
+    assert claves - set(index) == {eliminada}
+    assert not os.path.exists(os.path.join(str(cache), '{}.parquet'.format(eliminada)))
+    assert len(index) == 3
+
+
+def test_escrituras_concurrentes_del_indice_no_se_pisan(cache):
+    errores = []
+
+    def escribir(n):
+        try:
+            for i in range(200):
+                sap.save_cache_index({'escritor': n, 'i': i})
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=escribir, args=(n,)) for n in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert errores == []
+    with open(sap.get_cache_index_path(), 'r', encoding='utf-8') as f:
+        assert json.load(f)['i'] == 199
+    assert os.listdir(str(cache)) == ['index.json']
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Store diario de la atribucion por template: invalidacion por cambio de configuracion"""
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+import Sesiones_Abiertas_porPushes as sap
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Store diario en una carpeta temporal y un Athena falso que registra las queries"""
+    monkeypatch.setitem(sap.CONFIG, 'daily_store_folder', str(tmp_path / 'diario'))
+    monkeypatch.setitem(sap.CONFIG, 'query_backend', 'athena')
+    monkeypatch.setitem(sap.CONFIG, 'campaign_sends_table', None)
+    monkeypatch.setitem(sap.TABLE_LAYOUTS, 'boti_session_metrics_2', dict(
+        sap.TABLE_LAYOUTS['boti_session_metrics_2'], template_column='push_template'))
+    monkeypatch.setitem(sap.TABLE_LAYOUTS, 'envios_push', dict(
+        sap.TABLE_LAYOUTS['boti_session_metrics_2'], table='envios_push', timestamp_column='sent_time'))
+    queries = []
+
+    def run_athena_query(query, session, expected_rows=None):
+        queries.append(query)
+        envios = 40 if 'envios_push' in query else 0
+        return pd.DataFrame({'fecha': ['2025-09-01', '2025-09-02'], 'template': ['t1', 't1'],
+                             'envios': [envios, envios], 'Cant_sesiones': [10, 20]})
+
+    monkeypatch.setattr(sap, 'run_athena_query', run_athena_query)
+    return queries
+
+
+def test_dias_cerrados_no_se_vuelven_a_consultar(store):
+    sap.fetch_campaign_breakdown('2025-09-01', '2025-09-02', lambda: object())
+    df = sap.fetch_campaign_breakdown('2025-09-01', '2025-09-02', lambda: object())
+
+    assert len(store) == 1
+    assert df['Cant_sesiones'].tolist() == [30]
+
+
+def test_configurar_tabla_de_envios_invalida_los_dias_guardados(store):
+    sin_envios = sap.fetch_campaign_breakdown('2025-09-01', '2025-09-02', lambda: object())
+    assert 'Tasa_apertura' not in sin_envios.columns
+
+    sap.CONFIG['campaign_sends_table'] = 'envios_push'
+    con_envios = sap.fetch_campaign_breakdown('2025-09-01', '2025-09-02', lambda: object())
+
+    assert len(store) == 2
+    assert 'envios_push' in store[-1]
+    assert con_envios['envios'].tolist() == [80]
+    assert con_envios['Tasa_apertura'].tolist() == [30 / 80]
+
+
+def test_cambiar_columna_de_template_invalida_los_dias_guardados(store, monkeypatch):
+    sap.fetch_campaign_breakdown('2025-09-01', '2025-09-02', lambda: object())
+    monkeypatch.setitem(sap.TABLE_LAYOUTS, 'boti_session_metrics_2', dict(
+        sap.TABLE_LAYOUTS['boti_session_metrics_2'], template_column='campaign_id'))
+    sap.fetch_campaign_breakdown('2025-09-01', '2025-09-02', lambda: object())
+
+    assert len(store) == 2
+    assert 'campaign_id' in store[-1]
+
+
+def test_dia_con_otra_firma_falta():
+    manifest = {'2025-09-01': {'created': '2025-09-10 00:00:00', 'immutable': True, 'firma': 'a'}}
+    assert sap.get_missing_days('2025-09-01', '2025-09-01', manifest, firma='a') == []
+    assert sap.get_missing_days('2025-09-01', '2025-09-01', manifest, firma='b') == ['2025-09-01']
+
+
+def test_sin_columna_de_template_campanas_termina_con_error(tmp_path):
+    assert sap.TABLE_LAYOUTS['boti_session_metrics_2']['template_column'] is None
+    proceso = subprocess.run([sys.executable, os.path.abspath(sap.__file__), '--campanas', '--dry-run',
+                              '--periodo', '2025-10'], cwd=str(tmp_path), capture_output=True, text=True)
+
+    assert proceso.returncode == 2
+    assert "template_column" in proceso.stderr
+
+
+def test_tabla_de_envios_sin_columna_de_template(store, monkeypatch):
+    assert sap.check_campaign_config() is None
+    monkeypatch.setitem(sap.CONFIG, 'campaign_sends_table', 'envios_push')
+    monkeypatch.setitem(sap.TABLE_LAYOUTS, 'envios_push', dict(
+        sap.TABLE_LAYOUTS['envios_push'], template_column=None))
+
+    assert 'envios_push' in sap.check_campaign_config()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Store diario exacto sobre DuckDB: armado de rangos, dias faltantes y ventana de llegada tardia"""
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+
+def conteos(df):
+    """{starting_cause: sesiones} de un resultado con el formato de build_query"""
+    return {causa: int(cant) for causa, cant in zip(df['starting_cause'], df['Cant_sesiones'])}
+
+
+def query_directa(sap, fecha_inicio, fecha_fin):
+    return conteos(sap.run_athena_query(sap.build_query(fecha_inicio, fecha_fin), None))
+
+
+@pytest.fixture
+def queries(duckdb_local, monkeypatch):
+    """Registra las queries que llegan a run_athena_query (y las ejecuta en DuckDB)"""
+    sap = duckdb_local
+    ejecutadas = []
+    run_athena_query = sap.run_athena_query
+
+    def espia(query, session, expected_rows=None):
+        ejecutadas.append(query)
+        return run_athena_query(query, session, expected_rows=expected_rows)
+
+    monkeypatch.setattr(sap, 'run_athena_query', espia)
+    return ejecutadas
+
+
+def test_rango_armado_igual_a_query_directa(duckdb_local, queries):
+    sap = duckdb_local
+    # El extracto tiene sesiones con filas en varios dias: sumar por dia no alcanzaria
+    extracto = pd.read_parquet(sap.CONFIG['duckdb_source'])
+    en_rango = extracto[(extracto['session_creation_time'] >= '2025-09-10')
+                        & (extracto['session_creation_time'] < '2025-10-06')]
+    suma_diaria = en_rango.groupby([en_rango['session_creation_time'].dt.date, 'starting_cause'])[
+        'session_id'].nunique().sum()
+    assert suma_diaria > en_rango['session_id'].nunique()
+
+    df = sap.fetch_from_daily_store('2025-09-10', '2025-10-05', lambda: object())
+
+    assert conteos(df) == query_directa(sap, '2025-09-10', '2025-10-05')
+    assert df['Cant_sesiones'].is_monotonic_decreasing
+
+
+def test_solo_se_consultan_los_dias_faltantes(duckdb_local, queries):
+    sap = duckdb_local
+    sap.fetch_from_daily_store('2025-09-01', '2025-09-10', lambda: object())
+    del queries[:]
+
+    df = sap.fetch_from_daily_store('2025-09-05', '2025-09-15', lambda: object())
+
+    faltantes = ['2025-09-{:02d}'.format(dia) for dia in range(11, 16)]
+    assert queries == [sap.build_daily_query(faltantes)]
+    assert conteos(df) == query_directa(sap, '2025-09-05', '2025-09-15')
+
+
+def test_dias_con_huecos_se_consultan_en_una_query(duckdb_local, queries):
+    sap = duckdb_local
+    sap.fetch_from_daily_store('2025-09-03', '2025-09-04', lambda: object())
+    sap.fetch_from_daily_store('2025-09-08', '2025-09-08', lambda: object())
+    del queries[:]
+
+    df = sap.fetch_from_daily_store('2025-09-01', '2025-09-10', lambda: object())
+
+    assert queries == [sap.build_daily_query(
+        ['2025-09-01', '2025-09-02', '2025-09-05', '2025-09-06', '2025-09-07', '2025-09-09', '2025-09-10'])]
+    assert conteos(df) == query_directa(sap, '2025-09-01', '2025-09-10')
+
+
+def test_dia_sin_archivo_se_vuelve_a_consultar(duckdb_local, queries):
+    sap = duckdb_local
+    sap.fetch_from_daily_store('2025-09-01', '2025-09-03', lambda: object())
+    del queries[:]
+    os.remove(sap.get_daily_set_path('2025-09-02'))
+
+    sap.fetch_from_daily_store('2025-09-01', '2025-09-03', lambda: object())
+
+    assert queries == [sap.build_daily_query(['2025-09-02'])]
+
+
+def test_dias_abiertos_se_vuelven_a_consultar_despues_del_ttl(duckdb_local, queries, monkeypatch):
+    sap = duckdb_local
+    # Todos los dias del extracto quedan dentro de la ventana de llegada tardia
+    monkeypatch.setitem(sap.CONFIG, 'late_arrival_days', 100000)
+    sap.fetch_from_daily_store('2025-10-01', '2025-10-03', lambda: object())
+    sap.fetch_from_daily_store('2025-10-01', '2025-10-03', lambda: object())
+    assert len(queries) == 1
+
+    manifest = sap.load_daily_manifest('exacto')
+    assert not any(entry['immutable'] for entry in manifest.values())
+    despues_del_ttl = datetime.now() + timedelta(minutes=sap.CONFIG['cache_ttl_minutes'] + 1)
+    assert sap.get_missing_days('2025-10-01', '2025-10-03', manifest, now=despues_del_ttl) == [
+        '2025-10-01', '2025-10-02', '2025-10-03']
+
+    monkeypatch.setitem(sap.CONFIG, 'cache_ttl_minutes', 0)
+    sap.fetch_from_daily_store('2025-10-01', '2025-10-03', lambda: object())
+    assert len(queries) == 2
+
+
+def test_dias_cerrados_son_inmutables(duckdb_local, queries):
+    sap = duckdb_local
+    sap.fetch_from_daily_store('2025-10-01', '2025-10-03', lambda: object())
+    manifest = sap.load_daily_manifest('exacto')
+
+    assert all(entry['immutable'] for entry in manifest.values())
+    assert sap.get_missing_days('2025-10-01', '2025-10-03', manifest,
+                                now=datetime.now() + timedelta(days=365)) == []
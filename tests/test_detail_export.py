@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Exportacion de detalle: UNLOAD a Parquet leido de a un archivo y fallback al CSV de S3"""
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import Sesiones_Abiertas_porPushes as sap
+
+PERIODO = sap.parse_period_arg('2025-10')
+
+
+def sesiones(desde, cantidad):
+    return pd.DataFrame({
+        'session_id': ['s{:05d}'.format(i) for i in range(desde, desde + cantidad)],
+        'session_creation_time': pd.Timestamp('2025-10-01 12:00:00'),
+        'starting_cause': 'WhatsAppTemplate',
+    })
+
+
+class MotorFalso:
+    """Motor de Athena que escribe los Parquet del UNLOAD en una carpeta local"""
+
+    def __init__(self, falla_unload=False):
+        self.falla_unload = falla_unload
+        self.queries = []
+
+    async def execute_query(self, query):
+        self.queries.append(query)
+        if query.startswith('UNLOAD'):
+            if self.falla_unload:
+                raise RuntimeError('AccessDenied en el prefijo de UNLOAD')
+            destino = query.split("TO '")[1].split("'")[0]
+            os.makedirs(destino, exist_ok=True)
+            for numero, (desde, cantidad) in enumerate([(0, 7), (7, 3), (10, 6)]):
+                sesiones(desde, cantidad).to_parquet(os.path.join(destino, '{:02d}_part'.format(numero)))
+        return {'QueryExecutionId': 'q-{}'.format(len(self.queries)),
+                'ResultConfiguration': {'OutputLocation': 's3://resultados/q.csv'}}
+
+
+@pytest.fixture
+def exportacion(tmp_path, monkeypatch):
+    monkeypatch.setitem(sap.CONFIG, 'query_backend', 'athena')
+    monkeypatch.setitem(sap.CONFIG, 'fetch_strategy', 'auto')
+    monkeypatch.setitem(sap.CONFIG, 'unload_keep_files', False)
+    monkeypatch.setitem(sap.CONFIG, 'detail_folder', str(tmp_path / 'detalle'))
+    monkeypatch.setitem(sap.CONFIG, 'detail_format', 'csv.gz')
+    monkeypatch.setitem(sap.CONFIG, 'detail_chunk_rows', 5)
+    monkeypatch.setitem(sap.CONFIG, 'detail_writers', 2)
+    monkeypatch.setattr(sap, 'get_unload_prefix', lambda session: str(tmp_path / 'unload' / 'q1'))
+    monkeypatch.setattr(sap, 'record_stage', lambda *args: None)
+
+    def exportar(motor):
+        monkeypatch.setattr(sap, 'create_athena_engine', lambda session: motor)
+        manifest = sap.export_session_detail(PERIODO, session=None)
+        carpeta = os.path.join(sap.CONFIG['detail_folder'], 'sesiones_abiertas_pushes_octubre_2025')
+        return manifest, carpeta
+    return exportar
+
+
+def test_unload_reagrupa_los_parquet_y_borra_el_prefijo(exportacion, tmp_path, monkeypatch):
+    monkeypatch.setattr(sap, 'iter_s3_result_chunks', lambda *a, **k: pytest.fail('no debe leer el CSV'))
+    motor = MotorFalso()
+    manifest, carpeta = exportacion(motor)
+
+    assert motor.queries[0].startswith('UNLOAD') and "format = 'PARQUET'" in motor.queries[0]
+    assert manifest['descarga'] == 'unload'
+    assert [archivo['filas'] for archivo in manifest['archivos']] == [5, 5, 5, 1]
+    leido = pd.concat([pd.read_csv(os.path.join(carpeta, archivo['archivo']))
+                       for archivo in manifest['archivos']], ignore_index=True)
+    assert list(leido['session_id']) == list(sesiones(0, 16)['session_id'])
+    assert not os.path.exists(tmp_path / 'unload' / 'q1')
+    with open(os.path.join(carpeta, '_manifest.json'), encoding='utf-8') as f:
+        assert json.load(f)['filas'] == 16
+
+
+def test_unload_fallido_usa_el_csv_de_resultados(exportacion, monkeypatch):
+    leidos = []
+
+    def iter_s3_result_chunks(session, output_location, chunk_rows=None, dtype=None):
+        leidos.append(output_location)
+        yield sesiones(0, 4)
+
+    monkeypatch.setattr(sap, 'iter_s3_result_chunks', iter_s3_result_chunks)
+    motor = MotorFalso(falla_unload=True)
+    manifest, _ = exportacion(motor)
+
+    assert motor.queries[0].startswith('UNLOAD') and motor.queries[1].startswith('SELECT')
+    assert leidos == ['s3://resultados/q.csv']
+    assert manifest['descarga'] == 'csv' and manifest['filas'] == 4
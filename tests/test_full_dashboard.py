@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Dashboard completo con varios periodos: ejecucion y dry run consistentes"""
+import pytest
+
+import Sesiones_Abiertas_porPushes as sap
+
+PERIODOS = [sap.parse_period_arg('2025-09'), sap.parse_period_arg('2025-10')]
+
+
+@pytest.fixture
+def dashboard_completo(monkeypatch):
+    monkeypatch.setitem(sap.CONFIG, 'full_dashboard', True)
+    monkeypatch.setitem(sap.CONFIG, 'use_cache', False)
+    monkeypatch.setitem(sap.CONFIG, 'batch_single_scan', True)
+
+
+def test_lote_calcula_los_indicadores_de_cada_periodo(dashboard_completo, monkeypatch):
+    ejecutados = []
+    monkeypatch.setattr(sap, 'execute_query_and_save',
+                        lambda periodo, guardar_historico=True: ejecutados.append(periodo[5]) or periodo[5])
+    monkeypatch.setattr(sap, 'check_aws_credentials', lambda: pytest.fail('no debe usar el lote agrupado'))
+
+    resultados = sap.resolve_batch(PERIODOS)
+    assert ejecutados == ['septiembre 2025', 'octubre 2025']
+    assert resultados == {'septiembre 2025': 'septiembre 2025', 'octubre 2025': 'octubre 2025'}
+
+
+def test_dry_run_planifica_las_queries_de_indicadores_por_periodo(dashboard_completo, capsys):
+    pasos = sap.plan_dry_run(PERIODOS)
+    assert [paso[1] for paso in pasos] == ['Indicadores: sesiones_abiertas_pushes'] * 2
+    assert pasos[0][2] == sap.plan_indicator_queries('2025-09-01', '2025-09-30')[0]['query']
+
+    assert sap.print_dry_run(PERIODOS) == 2
+    assert 'una sola query' not in capsys.readouterr().out
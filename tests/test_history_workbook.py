@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Excel historico: una columna por periodo, en orden cronologico"""
+import pytest
+
+import Sesiones_Abiertas_porPushes as sap
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+@pytest.fixture
+def historico(tmp_path, monkeypatch):
+    path = tmp_path / 'Dashboard_historico.xlsx'
+    monkeypatch.setitem(sap.CONFIG, 'history_workbook', str(path))
+    monkeypatch.setattr(sap, '_HISTORY_STATE', {'lock': sap._HISTORY_STATE['lock']})
+
+    def escribir(periodos):
+        for texto, valor in periodos:
+            modo, fecha_inicio, fecha_fin, mes, anio, _ = sap.parse_period_arg(texto)
+            sap.update_history_workbook(valor, modo, mes, anio, fecha_inicio, fecha_fin)
+        sap.save_history_workbook()
+        ws = openpyxl.load_workbook(path)['Dashboard']
+        return [(ws.cell(row=1, column=col).value, ws.cell(row=4, column=col).value)
+                for col in range(4, ws.max_column + 1)]
+    return escribir
+
+
+@pytest.mark.parametrize('periodo, header, rango', [
+    ('2025-10', 'oct-25', ('2025-10-01', '2025-10-31')),
+    ('2025-10-01:2025-10-15', '01/10-15/10/25', ('2025-10-01', '2025-10-15')),
+    ('2025-12-20:2026-01-10', '20/12-10/01/26', ('2025-12-20', '2026-01-10')),  # cambio de año
+])
+def test_parse_period_header_es_inverso_de_get_period_header(periodo, header, rango):
+    modo, fecha_inicio, fecha_fin, mes, anio, _ = sap.parse_period_arg(periodo)
+    assert sap.get_period_header(modo, mes, anio, fecha_inicio, fecha_fin) == header
+
+    inicio, fin = sap.parse_period_header(header)
+    assert (inicio.strftime('%Y-%m-%d'), fin.strftime('%Y-%m-%d')) == rango
+
+
+def test_encabezado_que_no_es_periodo():
+    assert sap.parse_period_header('Notas') is None
+    assert sap.parse_period_header(None) is None
+
+
+def test_periodos_nuevos_se_insertan_en_orden_cronologico(historico):
+    historico([('2025-10', 100), ('2025-08', 80)])
+    columnas = historico([('2025-09', 90), ('2025-10-01:2025-10-15', 55), ('2025-11', 110), ('2025-10', 101)])
+
+    assert columnas == [('ago-25', 80), ('sep-25', 90), ('01/10-15/10/25', 55),
+                        ('oct-25', 101), ('nov-25', 110)]
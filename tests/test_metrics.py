@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""Metricas de ejecucion: pico de memoria segun la unidad de ru_maxrss de cada plataforma"""
+import pytest
+
+import Sesiones_Abiertas_porPushes as sap
+
+resource = pytest.importorskip('resource')
+
+
+class Uso:
+    ru_maxrss = 200 * 1024 * 1024
+
+
+@pytest.mark.parametrize('plataforma,esperado', [('linux', 200 * 1024), ('darwin', 200)])
+def test_peak_rss_mb_segun_plataforma(monkeypatch, plataforma, esperado):
+    monkeypatch.setattr(sap.sys, 'platform', plataforma)
+    monkeypatch.setattr(resource, 'getrusage', lambda quien: Uso())
+
+    assert sap.peak_rss_mb() == esperado
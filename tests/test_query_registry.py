@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Registro de ejecuciones: reuso de resultados dentro de la edad maxima y por workgroup/base"""
+import asyncio
+import json
+import time
+
+import pytest
+
+from stub_athena import StubAthenaClient
+
+QUERY = 'SELECT starting_cause, count(distinct (session_id)) as Cant_sesiones FROM t group by starting_cause'
+
+
+@pytest.fixture
+def sap(athena_local, monkeypatch):
+    monkeypatch.setitem(athena_local.CONFIG, 'query_reuse_max_age_minutes', 60)
+    monkeypatch.setitem(athena_local.CONFIG, 'workgroup', 'wg')
+    monkeypatch.setitem(athena_local.CONFIG, 'database', 'db')
+    return athena_local
+
+
+def ejecutar(sap, cliente, query=QUERY):
+    """run_query con un motor nuevo (como otra ejecucion del script); retorna (df, QueryExecutionId)"""
+    engine = sap.AsyncAthenaEngine(cliente, sap.CONFIG['database'], sap.CONFIG['workgroup'],
+                                   poll_min=0.01, poll_max=0.01)
+    df, ejecucion = asyncio.run(engine.run_query(query))
+    return df, ejecucion['QueryExecutionId']
+
+
+def test_misma_query_dentro_de_la_edad_maxima_reutiliza_la_ejecucion(sap):
+    cliente = StubAthenaClient()
+    _, primera = ejecutar(sap, cliente)
+    df, segunda = ejecutar(sap, cliente, '  ' + QUERY.replace(' FROM', '\n FROM') + ';')
+
+    assert segunda == primera
+    assert len(cliente.instantes('StartQueryExecution')) == 1
+    assert list(df['Cant_sesiones']) == [120, 80]
+    assert sap._METRICS['reuso'] == {'hits': 1, 'misses': 1, 'bytes_ahorrados': 50 * 1024 ** 2}
+
+
+def test_ejecucion_vencida_se_ignora(sap):
+    cliente = StubAthenaClient()
+    ejecutar(sap, cliente)
+    with open(sap.CONFIG['query_registry_file'], 'r', encoding='utf-8') as f:
+        registro = json.load(f)
+    for entrada in registro.values():
+        entrada['finished'] = time.time() - 61 * 60
+    with open(sap.CONFIG['query_registry_file'], 'w', encoding='utf-8') as f:
+        json.dump(registro, f)
+
+    assert sap.find_reusable_execution(QUERY) is None
+    _, segunda = ejecutar(sap, cliente)
+    assert segunda == 'q00001'
+    assert len(cliente.instantes('StartQueryExecution')) == 2
+
+
+@pytest.mark.parametrize('clave,valor', [('workgroup', 'otro-workgroup'), ('database', 'otra-base')])
+def test_otro_workgroup_o_base_no_reutiliza(sap, monkeypatch, clave, valor):
+    cliente = StubAthenaClient()
+    ejecutar(sap, cliente)
+    monkeypatch.setitem(sap.CONFIG, clave, valor)
+
+    assert sap.find_reusable_execution(QUERY) is None
+    ejecutar(sap, cliente)
+    assert len(cliente.instantes('StartQueryExecution')) == 2
+    assert cliente.ejecuciones['q00001']['WorkGroup'] == sap.CONFIG['workgroup']
+
+
+def test_ejecucion_que_athena_ya_no_conoce_se_vuelve_a_lanzar(sap):
+    ejecutar(sap, StubAthenaClient())
+    # Otro cliente no conoce el QueryExecutionId registrado (GetQueryExecution falla)
+    cliente = StubAthenaClient()
+    _, query_id = ejecutar(sap, cliente)
+
+    assert query_id == 'q00000'
+    assert len(cliente.instantes('StartQueryExecution')) == 1
+
+
+def test_sin_edad_maxima_no_se_registra(sap, monkeypatch):
+    monkeypatch.setitem(sap.CONFIG, 'query_reuse_max_age_minutes', 0)
+    cliente = StubAthenaClient()
+    ejecutar(sap, cliente)
+    ejecutar(sap, cliente)
+
+    assert len(cliente.instantes('StartQueryExecution')) == 2
+    assert sap.load_query_registry() == {}
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Clasificacion de errores, reintentos, circuit breaker y token bucket con fallas inyectadas"""
+import asyncio
+import time
+
+import pytest
+
+from stub_athena import FALLA_S3_SLOWDOWN, FaultyAthenaClient, StubAthenaClient, client_error
+
+
+def motor(sap, cliente):
+    return sap.AsyncAthenaEngine(cliente, 'db', 'wg', poll_min=0.005, poll_max=0.01)
+
+
+@pytest.mark.parametrize('error, tipo', [
+    (client_error('TooManyRequestsException', 'StartQueryExecution'), 'throttling'),
+    (client_error('ExpiredToken', 'StartQueryExecution'), 'credenciales'),
+    (client_error('InternalServerException', 'BatchGetQueryExecution'), 'transitorio'),
+    (client_error('InvalidRequestException', 'StartQueryExecution'), 'permanente'),
+])
+def test_clasificacion_de_errores_de_api(athena_local, error, tipo):
+    assert athena_local.classify_error(error) == tipo
+
+
+@pytest.mark.parametrize('motivo, reintentable, tipo', [
+    ('ICEBERG_COMMIT_ERROR: Failed to commit Iceberg update', False, 'transitorio'),
+    ('HIVE_CANNOT_OPEN_SPLIT: S3 SlowDown', False, 'transitorio'),
+    ('GENERIC_INTERNAL_ERROR', True, 'transitorio'),       # AthenaError.Retryable
+    ("SYNTAX_ERROR: line 1:8: Column 'x' cannot be resolved", False, 'permanente'),
+])
+def test_clasificacion_de_queries_failed(athena_local, motivo, reintentable, tipo):
+    error = athena_local.AthenaQueryError('q1', 'FAILED', motivo, reintentable=reintentable)
+    assert athena_local.classify_error(error) == tipo
+
+
+def test_query_cancelada_no_se_reintenta(athena_local):
+    error = athena_local.AthenaQueryError('q1', 'CANCELLED', 'S3 SlowDown')
+    assert athena_local.classify_error(error) == 'permanente'
+
+
+def test_query_failed_transitoria_se_relanza(athena_local):
+    cliente = StubAthenaClient(finales=[FALLA_S3_SLOWDOWN, 'SUCCEEDED'])
+    ejecucion = asyncio.run(motor(athena_local, cliente).execute_query('SELECT 1'))
+
+    assert ejecucion['QueryExecutionId'] == 'q00001'
+    assert len(cliente.instantes('StartQueryExecution')) == 2
+    assert athena_local._RETRY_STATE['reintentos'] == 1
+
+
+def test_throttling_en_la_api_se_reintenta(athena_local):
+    cliente = StubAthenaClient()
+    cliente.errores['StartQueryExecution'] = [client_error('TooManyRequestsException', 'StartQueryExecution')] * 2
+    asyncio.run(motor(athena_local, cliente).execute_query('SELECT 1'))
+
+    assert len(cliente.instantes('StartQueryExecution')) == 3
+    assert athena_local._RETRY_STATE['reintentos'] == 2
+
+
+def test_error_de_credenciales_no_se_reintenta(athena_local):
+    cliente = StubAthenaClient()
+    cliente.errores['StartQueryExecution'] = [client_error('ExpiredToken', 'StartQueryExecution')]
+    with pytest.raises(Exception, match='ExpiredToken'):
+        asyncio.run(motor(athena_local, cliente).execute_query('SELECT 1'))
+    assert len(cliente.instantes('StartQueryExecution')) == 1
+
+
+def test_breaker_abre_tras_n_fallas_y_semiabre_con_una_sola_prueba(athena_local):
+    breaker = athena_local.CircuitBreaker(threshold=3, reset_seconds=0.05)
+    for _ in range(2):
+        breaker.check()
+        breaker.failure()
+    assert breaker.estado == 'cerrado'
+    breaker.failure()
+    assert breaker.estado == 'abierto' and breaker.aperturas == 1
+    with pytest.raises(athena_local.CircuitOpenError):
+        breaker.check()
+
+    time.sleep(0.06)
+    breaker.check()                    # la llamada de prueba pasa
+    assert breaker.estado == 'semiabierto'
+    with pytest.raises(athena_local.CircuitOpenError):
+        breaker.check()                # las concurrentes no
+    breaker.failure()                  # la prueba falla: vuelve a abrirse
+    assert breaker.estado == 'abierto' and breaker.aperturas == 2
+
+    time.sleep(0.06)
+    breaker.check()
+    breaker.success()
+    assert breaker.estado == 'cerrado'
+    breaker.check()
+    breaker.check()
+
+
+def test_prueba_sin_resultado_no_bloquea_el_breaker(athena_local):
+    breaker = athena_local.CircuitBreaker(threshold=1, reset_seconds=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    breaker.check()                    # la prueba se cancela sin informar resultado
+    time.sleep(0.06)
+    breaker.check()                    # pasado reset_seconds se permite otra prueba
+
+
+def test_breaker_corta_las_llamadas_con_el_servicio_caido(athena_local, monkeypatch):
+    monkeypatch.setitem(athena_local.CONFIG, 'circuit_breaker_threshold', 3)
+    monkeypatch.setitem(athena_local.CONFIG, 'circuit_breaker_reset_seconds', 60)
+    monkeypatch.setitem(athena_local.CONFIG, 'retry_max_attempts', 10)
+    cliente = FaultyAthenaClient(caida=True)
+
+    with pytest.raises(athena_local.CircuitOpenError):
+        asyncio.run(motor(athena_local, cliente).execute_query('SELECT 1'))
+    assert len(cliente.instantes('StartQueryExecution')) == 3
+
+
+def test_token_bucket_espacia_start_query_execution(athena_local, monkeypatch):
+    monkeypatch.setitem(athena_local.CONFIG, 'start_query_rate_per_second', 20)
+    monkeypatch.setitem(athena_local.CONFIG, 'max_concurrent_queries', 2)
+    cliente = StubAthenaClient()
+    engine = motor(athena_local, cliente)
+
+    async def varias():
+        await asyncio.gather(*[engine.execute_query('SELECT {}'.format(i)) for i in range(6)])
+
+    asyncio.run(varias())
+    inicios = sorted(cliente.instantes('StartQueryExecution'))
+    # 2 tokens iniciales y despues uno cada 50 ms: las 6 queries tardan al menos 200 ms en arrancar
+    assert inicios[-1] - inicios[0] >= 0.18
+
+
+def test_throttling_vacia_el_bucket(athena_local, monkeypatch):
+    monkeypatch.setitem(athena_local.CONFIG, 'start_query_rate_per_second', 20)
+    monkeypatch.setitem(athena_local.CONFIG, 'max_concurrent_queries', 5)
+    cliente = StubAthenaClient()
+    cliente.errores['StartQueryExecution'] = [client_error('TooManyRequestsException', 'StartQueryExecution')]
+    engine = motor(athena_local, cliente)
+
+    async def dos_queries():
+        await engine.execute_query('SELECT 1')
+        await engine.execute_query('SELECT 2')
+
+    asyncio.run(dos_queries())
+    inicios = cliente.instantes('StartQueryExecution')
+    assert len(inicios) == 3
+    # Con el bucket lleno (5 tokens) solo el vaciado explica la espera de un token (50 ms)
+    assert inicios[2] - inicios[1] >= 0.045
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Modo daemon: calendarios, deduplicacion y cierre de periodos con dias abiertos"""
+from datetime import date, datetime
+
+import pytest
+
+import Sesiones_Abiertas_porPushes as sap
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    """Estado en una carpeta temporal; execute_batch falso que registra los periodos ejecutados"""
+    monkeypatch.setitem(sap.CONFIG, 'scheduler_state_file', str(tmp_path / 'scheduler_state.json'))
+    monkeypatch.setitem(sap.CONFIG, 'scheduler_catchup', {'diario': 2, 'quincenal': 2, 'mensual': 1})
+    monkeypatch.setitem(sap.CONFIG, 'scheduler_delay_days', 0)
+    monkeypatch.setitem(sap.CONFIG, 'late_arrival_days', 2)
+    monkeypatch.setitem(sap.CONFIG, 'cache_ttl_minutes', 60)
+    ejecutados = []
+
+    def execute_batch(periodos):
+        ejecutados.append([(periodo[1], periodo[2]) for periodo in periodos])
+        return {periodo[5]: object() for periodo in periodos}
+
+    monkeypatch.setattr(sap, 'execute_batch', execute_batch)
+    monkeypatch.setattr(sap, 'emit_metrics', lambda exito: None)
+    return ejecutados
+
+
+def test_calendario_quincenal_y_mensual():
+    periodos = sap.list_calendar_periods('quincenal', date(2025, 11, 1), 3)
+    assert [(p[1], p[2]) for p in periodos] == [
+        ('2025-09-16', '2025-09-30'), ('2025-10-01', '2025-10-15'), ('2025-10-16', '2025-10-31')]
+    mensual = sap.list_calendar_periods('mensual', date(2025, 11, 1), 1)[0]
+    assert mensual[:2] == ('mes', '2025-10-01') and mensual[5] == 'octubre 2025'
+
+
+def test_pendientes_ordenados_por_fin_y_mas_cortos_primero(daemon):
+    sap.run_scheduler_cycle(['quincenal', 'mensual'], ahora=datetime(2025, 11, 20, 6, 0))
+    assert daemon[0] == [('2025-10-16', '2025-10-31'), ('2025-10-01', '2025-10-31'),
+                         ('2025-11-01', '2025-11-15')]
+
+
+def test_periodo_con_dias_abiertos_se_regenera_hasta_el_cierre(daemon):
+    sap.run_scheduler_cycle(['mensual'], ahora=datetime(2025, 11, 1, 6, 0))
+    assert daemon == [[('2025-10-01', '2025-10-31')]]
+    completados, provisorios = sap.load_scheduler_state()
+    assert completados == {} and list(provisorios) == ['mensual|2025-10-01|2025-10-31']
+
+    # Antes de cache_ttl_minutes no se vuelve a generar
+    sap.run_scheduler_cycle(['mensual'], ahora=datetime(2025, 11, 1, 6, 30))
+    assert len(daemon) == 1
+
+    sap.run_scheduler_cycle(['mensual'], ahora=datetime(2025, 11, 1, 7, 0))
+    assert len(daemon) == 2
+
+    # Con todos los dias fuera de late_arrival_days queda completado y no se repite
+    sap.run_scheduler_cycle(['mensual'], ahora=datetime(2025, 11, 3, 6, 0))
+    completados, provisorios = sap.load_scheduler_state()
+    assert list(completados) == ['mensual|2025-10-01|2025-10-31'] and provisorios == {}
+    sap.run_scheduler_cycle(['mensual'], ahora=datetime(2025, 11, 4, 6, 0))
+    assert len(daemon) == 3
+
+
+def test_periodo_con_error_se_reintenta(daemon, monkeypatch):
+    monkeypatch.setattr(sap, 'execute_batch', lambda periodos: {periodo[5]: None for periodo in periodos})
+    assert not sap.run_scheduler_cycle(['mensual'], ahora=datetime(2025, 11, 10, 6, 0))
+    assert sap.load_scheduler_state() == ({}, {})
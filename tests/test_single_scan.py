@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Modo lote sobre DuckDB: un solo escaneo con el mismo resultado que la query de cada periodo"""
+import pandas as pd
+
+
+def conteos(df):
+    """{starting_cause: sesiones} de un resultado con el formato de build_query"""
+    return {causa: int(cant) for causa, cant in zip(df['starting_cause'], df['Cant_sesiones'])}
+
+
+def query_directa(sap, periodo):
+    return conteos(sap.run_athena_query(sap.build_query(periodo[1], periodo[2]), None))
+
+
+def test_mes_y_rango_superpuesto_igual_a_query_por_periodo(duckdb_local):
+    sap = duckdb_local
+    periodos = [sap.build_period('2025-09-01', '2025-09-30'), sap.build_period('2025-09-20', '2025-10-10')]
+    # Sumar conteos por dia daria mas sesiones que la query del periodo
+    extracto = pd.read_parquet(sap.CONFIG['duckdb_source'])
+    septiembre = extracto[extracto['session_creation_time'].dt.month == 9]
+    assert (septiembre.groupby([septiembre['session_creation_time'].dt.date, 'starting_cause'])[
+        'session_id'].nunique().sum() > septiembre['session_id'].nunique())
+
+    df = sap.run_athena_query(sap.build_single_scan_query(periodos), None)
+
+    for i, periodo in enumerate(periodos):
+        assert conteos(sap.slice_single_scan_results(df, i)) == query_directa(sap, periodo)
+
+
+def test_execute_single_scan_escribe_cada_periodo_con_su_conteo(duckdb_local, monkeypatch):
+    sap = duckdb_local
+    periodos = [sap.build_period('2025-09-01', '2025-09-30'), sap.build_period('2025-09-20', '2025-10-10'),
+                sap.build_period('2025-10-01', '2025-10-31')]
+    monkeypatch.setattr(sap, 'process_and_save_results', lambda df, periodo: df)
+    pendientes = [(periodo, sap.build_query(periodo[1], periodo[2])) for periodo in periodos]
+
+    resultados = sap.execute_single_scan(pendientes, None)
+
+    for periodo in periodos:
+        assert conteos(resultados[periodo[5]]) == query_directa(sap, periodo)
+    # Cada periodo queda en cache con la clave de su propia query
+    for periodo, query in pendientes:
+        assert conteos(sap.cache_get(query, periodo[1], periodo[2])) == query_directa(sap, periodo)
+
+
+def test_query_aproximada_usa_approx_distinct_por_periodo(duckdb_local):
+    sap = duckdb_local
+    periodos = [sap.build_period('2025-09-01', '2025-09-30'), sap.build_period('2025-09-20', '2025-10-10')]
+
+    query = sap.build_single_scan_query(periodos, aproximado=True)
+
+    assert query.count('approx_distinct(CASE WHEN') == 2
+    assert 'periodo_1' in query and 'count(distinct' not in query
+
+
+def test_periodos_repetidos_se_procesan_una_vez(duckdb_local, monkeypatch):
+    sap = duckdb_local
+    monkeypatch.setitem(sap.CONFIG, 'use_cache', False)
+    monkeypatch.setattr(sap, 'process_and_save_results', lambda df, periodo: df)
+    periodos = [sap.parse_period_arg(texto) for texto in
+                ['2025-09', '2025-09-20:2025-10-10', '2025-09-01:2025-09-30', '2025-09-20:2025-10-10']]
+
+    assert sap.dedupe_periods(periodos) == [periodos[0], periodos[1]]
+    resultados = sap.resolve_batch(periodos)
+
+    assert list(resultados) == [periodos[0][5], periodos[1][5]]
+    for periodo in periodos[:2]:
+        assert conteos(resultados[periodo[5]]) == query_directa(sap, periodo)
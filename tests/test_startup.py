@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Arranque del script (-X importtime): --dry-run y resultados en cache no cargan modulos pesados"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import benchmarks
+import Sesiones_Abiertas_porPushes as sap
+
+# Limites de la suma de imports de primer nivel (mejor de 3 corridas)
+LIMITE_DRY_RUN_MS = 150
+LIMITE_CACHE_MS = 1000
+
+
+def test_dry_run_no_importa_modulos_pesados(tmp_path):
+    argumentos = ['--dry-run', '--periodo', '2025-10', '--periodo', '2025-09']
+    import_ms, _, raices = benchmarks.measure_startup(argumentos, str(tmp_path), 3)
+
+    for modulo in ['boto3', 'awswrangler', 'pandas', 'openpyxl']:
+        assert modulo not in raices
+    assert not raices.intersection(benchmarks.STARTUP_FORBIDDEN['dry-run'])
+    assert import_ms < LIMITE_DRY_RUN_MS
+
+
+def test_resultado_en_cache_no_importa_aws(tmp_path):
+    pytest.importorskip('duckdb')
+    fuente = os.path.join(str(tmp_path), 'datos')
+    benchmarks.write_session_fixture(20000, '2025-10-01', '2025-10-31', fuente)
+    argumentos = ['--backend', 'duckdb', '--datos-locales', fuente, '--periodo', '2025-10']
+    # Primera corrida: deja el resultado en la cache de la carpeta temporal
+    subprocess.run([sys.executable, os.path.abspath(sap.__file__)] + argumentos, cwd=str(tmp_path),
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    import_ms, _, raices = benchmarks.measure_startup(argumentos, str(tmp_path), 3)
+
+    assert not raices.intersection(benchmarks.STARTUP_FORBIDDEN['cache'])
+    assert import_ms < LIMITE_CACHE_MS
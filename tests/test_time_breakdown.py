@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Desglose por dia y hora local: limites del filtro y pivots"""
+import pandas as pd
+
+import Sesiones_Abiertas_porPushes as sap
+
+
+def test_filtro_va_de_medianoche_local_a_medianoche_local():
+    query = sap.build_time_breakdown_query('2025-10-01', '2025-10-31')
+    # Buenos Aires es UTC-3: la medianoche local es 03:00 UTC
+    assert ("session_creation_time >= timestamp '2025-10-01 03:00:00' "
+            "AND session_creation_time < timestamp '2025-11-01 03:00:00'") in query
+
+
+def test_particiones_cubren_el_dia_siguiente_en_utc(monkeypatch):
+    layout = dict(sap.get_table_layout('boti_session_metrics_2'))
+    layout.update(partitions=[('dt', '%Y-%m-%d')], partition_sortable=True)
+    monkeypatch.setitem(sap.TABLE_LAYOUTS, 'boti_session_metrics_2', layout)
+
+    query = sap.build_time_breakdown_query('2025-10-01', '2025-10-31')
+    assert "dt BETWEEN '2025-10-01' AND '2025-11-01'" in query
+
+
+def test_resultado_vacio_tiene_todos_los_dias_y_enteros():
+    vacio = pd.DataFrame({'fecha': [], 'hora': [], 'starting_cause': [], 'Cant_sesiones': []})
+    por_dia, por_hora = sap.pivot_time_breakdown(vacio, '2025-10-01', '2025-10-03')
+
+    assert list(por_dia['fecha']) == ['2025-10-01', '2025-10-02', '2025-10-03']
+    assert list(por_hora['hora']) == list(range(24))
+    assert por_dia['Total'].dtype == 'int64' and por_hora['Total'].dtype == 'int64'
+    assert por_dia['Total'].sum() == 0
+
+
+def test_pivots_completan_dias_y_horas_sin_sesiones():
+    df = pd.DataFrame({
+        'fecha': ['2025-10-02', '2025-10-02', '2025-10-03'],
+        'hora': [0, 23, 23],
+        'starting_cause': ['WhatsAppTemplate', 'Organico', 'WhatsAppTemplate'],
+        'Cant_sesiones': [5, 2, 1],
+    })
+    por_dia, por_hora = sap.pivot_time_breakdown(df, '2025-10-01', '2025-10-04')
+
+    assert list(por_dia['fecha']) == ['2025-10-01', '2025-10-02', '2025-10-03', '2025-10-04']
+    assert list(por_dia['Total']) == [0, 7, 1, 0]
+    assert list(por_dia.columns) == ['fecha', 'Organico', 'WhatsAppTemplate', 'Total']
+    assert por_hora.loc[23, 'Total'] == 3 and por_hora.loc[0, 'WhatsAppTemplate'] == 5
+    assert all(dtype == 'int64' for dtype in por_hora.dtypes)